@@ -0,0 +1,153 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Benchmark the JSON decoders on SealedBundle lines shaped like the ones returned by
+read_chunk for a mobile session: a few hundred motion samples per bundle plus pointer,
+text and key events.
+
+Run with: python benchmarks/decode_bundles.py [--bundles N] [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# run from a source checkout without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moonsense.decoder import ProtobufJsonDecoder, FastJsonDecoder
+from moonsense.lazy import LazySealedBundle
+from moonsense.pipeline import DecodePool
+from moonsense.models import SealedBundle
+
+
+def motion_samples(count, start_millis):
+    return [{
+        "determinedAt": str(start_millis + i * 10),
+        "x": random.uniform(-2, 2),
+        "y": random.uniform(-2, 2),
+        "z": random.uniform(8, 11),
+    } for i in range(count)]
+
+
+def generate_bundle_line(index, session_id="zKDPvZfVLMc6jjUHNpmXHk"):
+    start_millis = 1660000000000 + index * 2000
+    bundle = {
+        "bundle": {
+            "index": index,
+            "clientTime": {"wallTimeMillis": str(start_millis), "timerMillis": str(index * 2000)},
+            "battery": {"capacity": 87, "state": "DISCHARGING"},
+            "accelerometerData": motion_samples(200, start_millis),
+            "linearAccelerometerData": motion_samples(200, start_millis),
+            "gyroscopeData": motion_samples(200, start_millis),
+            "magnetometerData": motion_samples(100, start_millis),
+            "orientationData": [{
+                "determinedAt": str(start_millis + i * 20),
+                "azimuth": random.uniform(0, 6),
+                "pitch": random.uniform(-1, 1),
+                "roll": random.uniform(-1, 1),
+            } for i in range(100)],
+            "pointerData": [{
+                "determinedAt": str(start_millis + i * 16),
+                "type": "TOUCH",
+                "position": {"dx": random.uniform(0, 400), "dy": random.uniform(0, 800)},
+                "pressure": random.random(),
+                "size": random.random(),
+                "target": {"targetId": "login", "targetType": "input"},
+            } for i in range(60)],
+            "textChangeData": [{
+                "determinedAt": str(start_millis + i * 150),
+                "target": {"targetId": "email", "targetType": "input"},
+                "maskedText": "xxxxxx@xxxx.xxx"[:i + 1],
+                "focus": True,
+            } for i in range(10)],
+            "keyPressData": [{
+                "determinedAt": str(start_millis + i * 150),
+                "type": "KEY_DOWN",
+                "maskedKey": 120,
+                "target": {"targetId": "email", "targetType": "input"},
+            } for i in range(10)],
+        },
+        "appId": "app_id",
+        "sessionId": session_id,
+        "serverTimeMillis": str(start_millis + 500),
+        "remoteIp": "203.0.113.7",
+        "journeyId": "journey_id",
+    }
+    return json.dumps(bundle).encode()
+
+
+def measure(decode, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for line in lines:
+            decode(line)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bundles", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="also measure a DecodePool with this many worker processes")
+    args = parser.parse_args()
+
+    random.seed(42)
+    lines = [generate_bundle_line(i) for i in range(args.bundles)]
+    reference = ProtobufJsonDecoder()
+    fast = FastJsonDecoder()
+
+    # both decoders must produce identical messages before any timing is reported
+    for line in lines:
+        if reference.decode(line, SealedBundle()) != fast.decode(line, SealedBundle()):
+            raise SystemExit("FastJsonDecoder produced a different message")
+
+    megabytes = sum(len(line) for line in lines) / 1024 / 1024
+    reference_time = measure(lambda line: reference.decode(line, SealedBundle()), lines, args.repeat)
+    fast_time = measure(lambda line: fast.decode(line, SealedBundle()), lines, args.repeat)
+    # envelope and bundle index only, the way filtering pipelines read bundles
+    lazy_time = measure(lambda line: LazySealedBundle.from_json(line, fast).bundle.index, lines, args.repeat)
+
+    print(f"{args.bundles} bundles, {megabytes:.1f} MB of NDJSON")
+    print(f"json_format:     {reference_time:.3f}s  {args.bundles / reference_time:8.1f} bundles/s")
+    print(f"FastJsonDecoder: {fast_time:.3f}s  {args.bundles / fast_time:8.1f} bundles/s")
+    print(f"speedup: {reference_time / fast_time:.1f}x")
+    print(f"LazySealedBundle (envelope only): {lazy_time:.3f}s  {args.bundles / lazy_time:8.1f} bundles/s")
+
+    if args.processes > 0:
+        with DecodePool(processes=args.processes) as pool:
+            # the first pass starts the worker processes. Serialized messages are measured,
+            # parsing them in the parent depends on the protobuf runtime in use.
+            for _ in pool.decode(lines, serialized=True):
+                pass
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                for _ in pool.decode(lines, serialized=True):
+                    pass
+            pool_time = (time.perf_counter() - started) / args.repeat
+        print(f"DecodePool ({args.processes} processes, serialized): {pool_time:.3f}s  {args.bundles / pool_time:8.1f} bundles/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,8 +33,9 @@ import time
 import threading
 
 from datetime import datetime, timedelta, timezone
+from typing import List
 
-from moonsense.models import Session, Chunk
+from moonsense.models import Session, Chunk, SealedBundle
 from moonsense.client import Client
 
 #
@@ -66,8 +67,7 @@ def process_features(client: Client, session: Session) -> None:
 # Bundles are the smallest unit of data that can be processed. They are
 # automatically assembled into chunks for efficient processing.
 #
-def process_bundles_chunk(client: Client, session: Session, chunk: Chunk) -> None:
-    bundles = list(client.read_chunk(session.session_id, chunk.chunk_id))
+def process_bundles_chunk(client: Client, session: Session, chunk: Chunk, bundles: List[SealedBundle]) -> None:
     logging.info(f"Chunk {chunk.chunk_id} has {len(bundles)} bundles")
 
 
@@ -96,24 +96,27 @@ def main():
 def worker(client: Client, session: Session) -> None:
     time.sleep(5)
 
-    processed = set(c.chunk_id for c in client.list_chunks(session.session_id))
+    # chunks persisted before the session was picked up are skipped
+    since = max((c.created_at.ToDatetime().replace(tzinfo=timezone.utc)
+                 for c in client.list_chunks(session.session_id)), default=None)
 
     process_signals(client, session)
     process_features(client, session)
 
-    while active(session):
-        for chunk in client.list_chunks(session.session_id):
-            if chunk.chunk_id not in processed:
-                logging.info(
-                    "Processing bundles chunk %s for session %s",
-                    chunk.chunk_id,
-                    session.session_id,
-                )
-                process_bundles_chunk(client, session, chunk)
-                processed.add(chunk.chunk_id)
-
-        time.sleep(30)
-        session = client.describe_session(session.session_id)
+    bundles = []
+
+    def chunk_done(chunk: Chunk) -> None:
+        logging.info(
+            "Processing bundles chunk %s for session %s",
+            chunk.chunk_id,
+            session.session_id,
+        )
+        process_bundles_chunk(client, session, chunk, bundles)
+        bundles.clear()
+
+    # polls while the session receives data and returns once it goes inactive
+    for bundle in client.follow_session(session, since=since, on_chunk=chunk_done):
+        bundles.append(bundle)
 
     logging.info("Session %s is inactive", session.session_id)
 
@@ -0,0 +1,585 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API Async Client
+
+An asyncio version of the 'Client' that lets a single event loop drive a large number
+of in-flight requests over a shared connection pool. Requires the optional 'aiohttp'
+dependency: pip install moonsense[async]
+"""
+
+import os
+import asyncio
+import pytz
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from google.protobuf import json_format
+from typing import AsyncIterable, Dict, Iterable, List, Tuple, Union
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .models import Session, Chunk, TokenSelfResponse, \
+    DataRegionsListResponse, SessionListResponse, ChunksListResponse, \
+    CardListResponse, Card, SealedBundle, SignalsResponse, \
+    Journey, JourneyListResponse, JourneyDetailResponse, SessionFeaturesResponse, \
+    JourneyFeaturesResponse
+
+from .models.journey_feedback_pb2 import JourneyFeedback
+
+from .cache import RegionCache
+from .ratelimit import RateLimiter, THROTTLED_STATUS_CODES
+from .decoder import JsonDecoder, ProtobufJsonDecoder
+from .lazy import BundleProjection, LazySealedBundle
+from . import Platform
+
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+class AsyncClient(object):
+    """ Moonsense Cloud API Async Client """
+
+    def __init__(
+        self,
+        secret_token: str = None,
+        root_domain: str = "moonsense.cloud",
+        protocol: str = "https",
+        default_region: str = "us-central1.gcp",
+        tries: int = 3,
+        max_concurrency: int = 100,
+        pool_size: int = 100,
+        region_cache_size: int = 10000,
+        region_cache_ttl: float = 3600,
+        rate_limiter: RateLimiter = None,
+        json_decoder: JsonDecoder = None
+    ) -> None:
+        """
+        Construct a new 'AsyncClient' object
+
+        :param secret_token: API secret token generated from the Moonsense Cloud web console
+        :param root_domain: Root API domain (defaults to moonsense.cloud)
+        :param protocol: Protocol to use when connecting to the API (defaults to https)
+        :param default_region: Default Moonsense Cloud Data Plane region to connect to
+        :param tries: Number of attempts made for retried calls (defaults to 3)
+        :param max_concurrency: Maximum number of requests in flight at once (defaults to 100)
+        :param pool_size: Maximum number of open connections per region host (defaults to 100).
+                          Requests to one region are capped by the smaller of the two values,
+                          so raise both together. A chunk holds its connection until it is
+                          read completely or the caller stops.
+        :param region_cache_size: Number of session to region mappings remembered by the client.
+                                  Set to 0 to always describe the session (defaults to 10000)
+        :param region_cache_ttl: Number of seconds a cached session region stays valid (defaults to 1h)
+        :param rate_limiter: Optional - The 'RateLimiter' pacing requests to each region. A limiter
+                             that adapts to throttled responses is created if 'None' is supplied.
+                             It can be shared with a 'Client' talking to the same regions.
+        :param json_decoder: Optional - The 'JsonDecoder' used for responses and bundle lines.
+                             Defaults to json_format. Pass a 'FastJsonDecoder' for CPU-bound consumers.
+        """
+        if aiohttp is None:
+            raise RuntimeError(
+                "AsyncClient requires aiohttp. Install it with: pip install moonsense[async]"
+            )
+
+        if secret_token is None:
+            secret_token = os.environ.get("MOONSENSE_SECRET_TOKEN", None)
+            if secret_token is None:
+                raise RuntimeError(
+                    "secret token must either be set as an input param or as an environment variable MOONSENSE_SECRET_TOKEN"
+                )
+        self._root_domain = root_domain
+        self._protocol = protocol
+        self._default_region = default_region
+
+        self._secret_token = secret_token
+        self._headers = {"Authorization": f"Bearer {self._secret_token}"}
+        self.tries = tries
+        self._max_concurrency = max_concurrency
+        self._pool_size = pool_size
+        self._regions = RegionCache(region_cache_size, region_cache_ttl)
+        self._rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self._json_decoder = json_decoder if json_decoder is not None else ProtobufJsonDecoder()
+
+        # the HTTP session and the semaphore are bound to the running event loop,
+        # so they are created on first use rather than here.
+        self._http = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def rate_limit_status(self) -> dict:
+        """
+        Report how close the client is to the rate limit of each region it talked to
+
+        :return: a dictionary keyed by host, see 'RateLimiter.status'
+        """
+        return self._rate_limiter.status()
+
+    async def close(self) -> None:
+        """
+        Close all pooled connections held by this client
+        """
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    def _get_http(self):
+        if self._http is None or self._http.closed:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self._pool_size)
+            self._http = aiohttp.ClientSession(connector=connector, headers=self._headers)
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._http
+
+    def _build_url(self, region: str) -> str:
+        if region == "":
+            return f"{self._protocol}://{self._root_domain}"
+        else:
+            return f"{self._protocol}://{region}.data-api.{self._root_domain}"
+
+    @staticmethod
+    def _flatten_params(params):
+        # requests expands list values into repeated keys, aiohttp does not.
+        flat = []
+        for key, value in params:
+            if isinstance(value, (list, tuple)):
+                flat.extend((key, str(v)) for v in value)
+            else:
+                flat.append((key, str(value)))
+        return flat
+
+    async def _request(self, method: str, endpoint: str, params=None, json=None, tries: int = 1,
+                       stream: bool = False):
+        # Like 'Client._request', requests are paced by the rate limiter of the target host
+        # and throttled responses (429/503) are retried with an exponential backoff that
+        # honors Retry-After. Client errors are retried up to 'tries' times. Returns the
+        # status and the text of the response, or the unread response if 'stream' is set,
+        # which the caller has to release.
+        http = self._get_http()
+        host = urlparse(endpoint).netloc
+        if params is not None:
+            params = self._flatten_params(params)
+
+        attempts = max(tries, self.tries)
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            await self._rate_limiter.acquire_async(host)
+            try:
+                async with self._semaphore:
+                    http_response = await http.request(method, endpoint, params=params, json=json)
+                    retry_after = http_response.headers.get("Retry-After")
+                    self._rate_limiter.on_response(host, http_response.status, retry_after)
+                    if http_response.status not in THROTTLED_STATUS_CODES or last_attempt:
+                        if stream:
+                            return http_response
+                        async with http_response:
+                            return http_response.status, await http_response.text()
+                    http_response.release()
+            except aiohttp.ClientError:
+                if attempt >= tries - 1:
+                    raise
+                await asyncio.sleep(self._rate_limiter.backoff(attempt))
+                continue
+            await asyncio.sleep(self._rate_limiter.backoff(attempt, retry_after))
+
+    async def _get_message(self, endpoint: str, message, error: str, params=None, tries: int = 1):
+        status, text = await self._request("GET", endpoint, params=params, tries=tries)
+        if status != 200:
+            raise RuntimeError(f"{error}. status code: {status}")
+        return self._json_decoder.decode(text, message)
+
+    def _decode_bundle(self, line: bytes, lazy: bool = False, projection: BundleProjection = None):
+        if lazy:
+            return LazySealedBundle.from_json(line, self._json_decoder, projection)
+        if projection is not None:
+            return projection.decode_json(line, self._json_decoder)
+        return self._json_decoder.decode(line, SealedBundle())
+
+    async def _resolve_session(self, session_id: Union[str, Session]) -> Tuple[str, str]:
+        if isinstance(session_id, Session):
+            self._regions.put(session_id.session_id, session_id.region_id)
+            if session_id.region_id:
+                return session_id.session_id, session_id.region_id
+            session_id = session_id.session_id
+
+        region = self._regions.get(session_id)
+        if region is None:
+            region = (await self.describe_session(session_id)).region_id
+        return session_id, region
+
+    async def list_regions(self) -> DataRegionsListResponse:
+        """
+        Retrieve the list of Data Plane regions in the Moonsense Cloud
+
+        :return: a list of dictionaries describing the regions
+        """
+        endpoint = "https://api." + self._root_domain + "/v2/regions"
+        _, text = await self._request("GET", endpoint)
+        return self._json_decoder.decode(text, DataRegionsListResponse())
+
+    async def whoami(self) -> TokenSelfResponse:
+        """
+        Describe the authentication token used to connect to the API
+
+        :return: a 'TokenSelfResponse' object with details
+        """
+        endpoint = self._build_url(self._default_region) + "/v2/tokens/self"
+        _, text = await self._request("GET", endpoint)
+        return self._json_decoder.decode(text, TokenSelfResponse())
+
+    async def list_journeys(
+        self,
+        journeys_per_page: int = 50,
+        platforms: List[Platform] = None,
+        since: datetime = None,
+        until: datetime = None) -> AsyncIterable[Journey]:
+        """
+        List journeys for the current project
+
+        :param journeys_per_page: The number of journeys to return per page
+        :param platforms: Optional - The list of 'Platform's to match. If 'None' is supplied,\
+                            all 'Platform's will be returned.
+        :param since: Optional - The start time to match.
+        :param until: Optional - The end time to match.
+        :return: an async generator of 'Journey' objects
+        """
+        endpoint = self._build_url(self._default_region) + "/v2/journeys"
+
+        while True:
+            params = [("per_page", journeys_per_page)]
+
+            if since is not None:
+                params.append(("filter[min_created_at]", pytz.utc.localize(since).isoformat()))
+
+            if until is not None:
+                params.append(("filter[max_created_at]", pytz.utc.localize(until).isoformat()))
+
+            if platforms is not None:
+                params.append(("filter[platforms][]", [p.value for p in platforms]))
+
+            response = await self._get_message(
+                endpoint, JourneyListResponse(), "unable to list journeys", params=params, tries=self.tries)
+            if len(response.journeys) == 0:
+                return  # no more journeys
+
+            for journey in response.journeys:
+                yield journey
+
+            if response.pagination.next_page is not None and response.pagination.next_page > 0:
+                # Start the next fetch 1microsecond after this one ended
+                until = response.journeys[-1].created_at.ToDatetime() - timedelta(microseconds=1)
+            else:
+                break
+
+    async def describe_journey(self, journey_id: str) -> JourneyDetailResponse:
+        """
+        Describe a specific journey
+
+        :param journey_id: The ID of the journey
+        :return: a 'Journey' object with details
+        """
+        endpoint = self._build_url(self._default_region) + f"/v2/journeys/{journey_id}"
+        return await self._get_message(endpoint, JourneyDetailResponse(), "unable to describe journey")
+
+    async def get_journey_feedback(self, journey_id: str) -> JourneyFeedback:
+        """
+        Fetches the feedback associated with a journey with the specified journeyId.
+
+        :param journey_id: The ID of the journey
+        :return: a 'JourneyFeedback' object with details
+        """
+        endpoint = self._build_url(self._default_region) + f"/v2/journeys/{journey_id}/feedback"
+        return await self._get_message(endpoint, JourneyFeedback(), "unable to get journey feedback")
+
+    async def add_journey_feedback(self, journey_id: str, feedback: JourneyFeedback):
+        """
+        Sets the feedback associated with a journey with the specified journeyId.
+
+        :param journey_id: The ID of the journey
+        :param feedback: The feedback to set. Feedback is additive. If the feedback type already
+            exists, it will be overwritten. If the feedback type does not exist, it will be added.
+        """
+        endpoint = self._build_url(self._default_region) + f"/v2/journeys/{journey_id}/feedback"
+        status, text = await self._request(
+            "POST", endpoint, json=json_format.MessageToDict(feedback, preserving_proto_field_name=True))
+        if status != 200:
+            raise RuntimeError(
+                f"unable to update journey feedback. status code: {status}, response: {text}"
+            )
+
+    async def list_sessions(
+        self,
+        labels: List[str] = None,
+        journey_id: str = None,
+        platforms: List[Platform] = None,
+        since: datetime = None,
+        until: datetime = None) -> AsyncIterable[Session]:
+        """
+        List sessions for the current project
+
+        :param labels: A list of labels to match.
+        :param journey_id: Optional - The journey id to match.
+        :param platforms: Optional - The list of 'Platform's to match. If 'None' is supplied,\
+                          all 'Platform's will be returned.
+        :param since: Optional - The start time to match.
+        :param until: Optional - The end time to match.
+        :return: an async generator of 'Session' objects
+        """
+        endpoint = self._build_url(self._default_region) + "/v2/sessions"
+
+        page = 1
+        while True:
+            params = [("per_page", "50"), ("page", page)]
+
+            if since is not None:
+                params.append(("filter[min_created_at]", pytz.utc.localize(since).isoformat()))
+
+            if until is not None:
+                params.append(("filter[max_created_at]", pytz.utc.localize(until).isoformat()))
+
+            if labels is not None:
+                params.append(("filter[labels][]", labels))
+
+            if journey_id is not None:
+                params.append(("filter[journey_id]", journey_id))
+
+            if platforms is not None:
+                params.append(("filter[platforms][]", [p.value for p in platforms]))
+
+            response = await self._get_message(
+                endpoint, SessionListResponse(), "unable to list sessions", params=params, tries=self.tries)
+            if len(response.sessions) == 0:
+                return  # no more sessions
+
+            for session in response.sessions:
+                self._regions.put(session.session_id, session.region_id)
+                yield session
+
+            if response.pagination.next_page is not None and response.pagination.next_page > 0:
+                page = response.pagination.current_page + 1
+            else:
+                break
+
+    async def describe_session(self, session_id, minimal=True) -> Session:
+        """
+        Describe a specific session
+
+        :param session_id: The ID of the session
+        :param minimal: If true, only total values are returned for counters
+        :return: a 'Session' object with details
+        """
+        view = "minimal" if minimal else "full"
+        endpoint = self._build_url(self._default_region) + f"/v2/sessions/{session_id}?view={view}"
+        session = await self._get_message(endpoint, Session(), "unable to describe session")
+        self._regions.put(session.session_id, session.region_id)
+        return session
+
+    async def describe_sessions(
+        self,
+        session_ids: Iterable[str],
+        minimal: bool = True) -> Tuple[Dict[str, Session], Dict[str, Exception]]:
+        """
+        Describe many sessions at once. Concurrency is bounded by the client's max_concurrency
+        and a failure for one session does not stop the others.
+
+        :param session_ids: The IDs of the sessions
+        :param minimal: If true, only total values are returned for counters
+        :return: a tuple of a dictionary mapping session ids to 'Session' objects and a dictionary
+                 mapping the session ids that could not be described to the raised exception
+        """
+        unique_ids = list(dict.fromkeys(session_ids))
+        results = await asyncio.gather(
+            *[self.describe_session(session_id, minimal) for session_id in unique_ids],
+            return_exceptions=True)
+
+        sessions = {}
+        errors = {}
+        for session_id, result in zip(unique_ids, results):
+            if isinstance(result, Exception):
+                errors[session_id] = result
+            else:
+                sessions[session_id] = result
+        return sessions, errors
+
+    async def update_session_labels(self, session_id, labels: List[str]) -> None:
+        """
+        Update the label on a session given the session_id.
+        Calling this method updates ALL labels for the given session_id.
+        """
+        endpoint = self._build_url(self._default_region) + f"/v2/sessions/{session_id}/labels"
+        payload = {"labels": [{"name": label} for label in labels]}
+
+        status, _ = await self._request("POST", endpoint, json=payload)
+        if status != 200:
+            raise RuntimeError(
+                f"unable to update session labels. status code: {status}"
+            )
+
+    async def list_chunks(self, session_id: Union[str, Session]) -> AsyncIterable[Chunk]:
+        """
+        List all the granular data chunks that are part of a session that were persisted in
+        in the Moonsense Cloud.
+
+        :param session_id: The ID of the session or a 'Session' object
+        :return: an async generator of 'Chunk' objects
+        """
+        session_id, region = await self._resolve_session(session_id)
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/chunks"
+
+        page = 1
+        while True:
+            response = await self._get_message(
+                endpoint, ChunksListResponse(), "unable to list session chunks",
+                params=[("per_page", "50"), ("page", page)])
+            if len(response.chunks) == 0:
+                return  # no chunks found for this session
+            for chunk in response.chunks:
+                yield chunk
+
+            if response.pagination.current_page < response.pagination.total_pages:
+                page = response.pagination.current_page + 1
+            else:
+                break
+
+    async def read_chunk(self, session_id: Union[str, Session], chunk_id, lazy: bool = False,
+                         fields: Iterable[str] = None) -> AsyncIterable[SealedBundle]:
+        """
+        Read all the bundles within a data chunk
+
+        :param session_id: The ID of the session or a 'Session' object
+        :param chunk_id: The ID of the chunk
+        :param lazy: If set to True, 'LazySealedBundle' views are returned that only decode
+                     the repeated sensor and event fields of a bundle when they are accessed.
+        :param fields: Optional - The repeated bundle fields to decode, e.g. ["accelerometer_data",
+                       "pointer_data"]. Every other sensor and event field is skipped. If 'None'
+                       is supplied, all fields are decoded.
+        :return: an async generator of bundles. The chunk read had to be persisted in the Moonsense Cloud first.
+        """
+        projection = BundleProjection(fields) if fields is not None else None
+        session_id, region = await self._resolve_session(session_id)
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/chunks/{chunk_id}"
+
+        # the semaphore is only held while the request is sent and while a block of the
+        # body is read, never while bundles are handed to the caller, so the caller can
+        # make other calls on this client from within the loop.
+        http_response = await self._request("GET", endpoint, stream=True)
+        try:
+            if http_response.status != 200:
+                raise RuntimeError(
+                    f"unable to read: {chunk_id}. status code: {http_response.status}"
+                )
+
+            pending = b""
+            while True:
+                async with self._semaphore:
+                    data = await http_response.content.read(READ_BUFFER_SIZE)
+                if not data:
+                    break
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        yield self._decode_bundle(line, lazy, projection)
+            if pending.strip():
+                yield self._decode_bundle(pending, lazy, projection)
+        finally:
+            http_response.release()
+
+    async def list_session_features(self, session_id: Union[str, Session], region=None) -> SessionFeaturesResponse:
+        """
+        Lists the features for a given session
+
+        :param session_id: The ID of the session or a 'Session' object
+        :param region: If not set, will look it up when run
+        :return: a 'SessionFeaturesResponse' object with details
+        """
+        if region is None:
+            session_id, region = await self._resolve_session(session_id)
+        elif isinstance(session_id, Session):
+            session_id = session_id.session_id
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/features"
+        return await self._get_message(endpoint, SessionFeaturesResponse(), "unable to list session features")
+
+    async def list_journey_features(self, journey_id, region=None) -> JourneyFeaturesResponse:
+        """
+        Lists the features for a given journey
+
+        :param journey_id: The ID of the journey
+        :param region: If not set, will look it up when run
+        :return: a 'JourneyFeaturesResponse' object with details
+        """
+        if region is None:
+            journey = await self.describe_journey(journey_id)
+            region = journey.journey.primary_region_id
+        endpoint = self._build_url(region) + f"/v2/journeys/{journey_id}/features"
+        return await self._get_message(endpoint, JourneyFeaturesResponse(), "unable to list journey features")
+
+    async def list_session_signals(self, session_id: Union[str, Session], region=None) -> SignalsResponse:
+        """
+        Lists the signals for a given session
+
+        :param session_id: The ID of the session or a 'Session' object
+        :param region: If not set, will look it up when run
+        :return: a 'SignalsResponse' object with details
+        """
+        if region is None:
+            session_id, region = await self._resolve_session(session_id)
+        elif isinstance(session_id, Session):
+            session_id = session_id.session_id
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/signals"
+        return await self._get_message(endpoint, SignalsResponse(), "unable to list session signals")
+
+    async def list_cards(self, session_id: Union[str, Session]) -> List[Card]:
+        """
+        List all the cards associated with a session
+
+        :param session_id: The ID of the session or a 'Session' object
+        :return: list of cards
+        """
+        session_id, region = await self._resolve_session(session_id)
+        region = region if self._default_region != "" else ""
+        endpoint = self._build_url(region) + "/v2/cards"
+
+        _, text = await self._request("GET", endpoint, params=[("session_id", session_id)])
+        response = self._json_decoder.decode(text, CardListResponse())
+        return response.cards
+
+    async def create_card(self, session_id: Union[str, Session], title, description, source_type="API") -> None:
+        """
+        Create a new card associated with this session ID
+
+        :param session_id: The ID of the session or a 'Session' object
+        :return: none
+        """
+        session_id, region = await self._resolve_session(session_id)
+        region = region if self._default_region != "" else ""
+        endpoint = self._build_url(region) + "/v2/cards"
+
+        status, text = await self._request("POST", endpoint, json={
+            "session_id": session_id,
+            "title": title,
+            "description": description,
+            "source_type": source_type,
+        })
+        if status != 200:
+            raise RuntimeError(
+                f"unable to create card. status code: {status} body: {text}"
+            )
@@ -0,0 +1,258 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API - Caches used by the client """
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+from .util import encode_varint, split_length_delimited
+
+# header of a cached chunk file, followed by the md5 digest of the payload
+CHUNK_CACHE_MAGIC = b"MSCC\x01"
+CHUNK_CACHE_SUFFIX = ".chunk"
+
+
+class RegionCache(object):
+    """ Bounded LRU cache with a TTL mapping session ids to their data plane region """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600) -> None:
+        """
+        Construct a new 'RegionCache' object
+
+        :param max_size: Maximum number of sessions to remember. The least recently used
+                         entry is evicted first.
+        :param ttl: Number of seconds an entry stays valid
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[str]:
+        """
+        Look up the region of a session
+
+        :param session_id: The ID of the session
+        :return: the region id or None if the session is unknown or the entry expired
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+
+            region_id, expires_at = entry
+            if expires_at < monotonic():
+                del self._entries[session_id]
+                return None
+
+            self._entries.move_to_end(session_id)
+            return region_id
+
+    def put(self, session_id: str, region_id: str) -> None:
+        """
+        Remember the region of a session
+
+        :param session_id: The ID of the session
+        :param region_id: The data plane region the session is stored in
+        """
+        if self._max_size <= 0 or not session_id or not region_id:
+            return
+
+        with self._lock:
+            self._entries[session_id] = (region_id, monotonic() + self._ttl)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Forget all cached regions
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class ChunkCache(object):
+    """
+    On-disk LRU cache of chunk bundles keyed by the md5 of the chunk. A chunk is stored
+    as a stream of length-delimited serialized 'SealedBundle' messages with a checksum
+    that is verified on every read.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024) -> None:
+        """
+        Construct a new 'ChunkCache' object
+
+        :param directory: The directory the chunks are stored in, created if missing.
+                          Chunks already present are reused.
+        :param max_bytes: Maximum size of all cached chunks. The least recently used
+                          chunk is evicted first (defaults to 1GB)
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._corrupted = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        # least recently used first, reads touch the files they hit
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(CHUNK_CACHE_SUFFIX):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def _path(self, md5: str) -> str:
+        # md5 values may be hex or base64, the file name must not depend on their alphabet
+        name = hashlib.sha1(md5.encode("utf-8")).hexdigest()
+        return os.path.join(self._directory, name + CHUNK_CACHE_SUFFIX)
+
+    def get(self, md5: str) -> Optional[List[bytes]]:
+        """
+        Read a chunk from the cache
+
+        :param md5: The md5 of the chunk
+        :return: the serialized bundles of the chunk or None if the chunk is not cached
+                 or failed the integrity check
+        """
+        path = self._path(md5)
+        with self._lock:
+            if path not in self._entries:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(path)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            data = None
+
+        header_size = len(CHUNK_CACHE_MAGIC) + 16
+        payload = data[header_size:] if data is not None else None
+        if data is None or not data.startswith(CHUNK_CACHE_MAGIC) or \
+                hashlib.md5(payload).digest() != data[len(CHUNK_CACHE_MAGIC):header_size]:
+            with self._lock:
+                self._corrupted += 1
+                self._misses += 1
+                self._remove(path)
+            return None
+
+        try:
+            bundles = list(split_length_delimited([payload]))
+        except RuntimeError:
+            bundles = None
+        with self._lock:
+            if bundles is None:
+                self._corrupted += 1
+                self._misses += 1
+                self._remove(path)
+            else:
+                self._hits += 1
+        return bundles
+
+    def put(self, md5: str, bundles: Iterable[bytes]) -> None:
+        """
+        Store a chunk in the cache
+
+        :param md5: The md5 of the chunk
+        :param bundles: The serialized bundles of the chunk
+        """
+        if not md5:
+            return
+
+        payload = b"".join(encode_varint(len(bundle)) + bundle for bundle in bundles)
+        data = CHUNK_CACHE_MAGIC + hashlib.md5(payload).digest() + payload
+        if len(data) > self._max_bytes:
+            return
+
+        path = self._path(md5)
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._size -= self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def _remove(self, path: str) -> None:
+        self._size -= self._entries.pop(path, 0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        while self._size > self._max_bytes and self._entries:
+            path = next(iter(self._entries))
+            self._remove(path)
+            self._evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Report the effectiveness of the cache
+
+        :return: a dictionary with the number of hits, misses, corrupted entries and evictions,
+                 the number of cached chunks and their total size in bytes
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "corrupted": self._corrupted,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        """
+        Remove all cached chunks
+        """
+        with self._lock:
+            for path in list(self._entries):
+                self._remove(path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -21,28 +21,55 @@ create Cards that will be displayed back in the Moonsense Recorder.
 """
 
 import os
+import json
+import heapq
+import threading
 import requests
-import tempfile
+from requests.adapters import HTTPAdapter
 import tarfile
-import shutil
+import zlib
 import pytz
+from time import sleep
+from urllib.parse import urlparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full
 from datetime import date, datetime, timedelta, timezone
 
-from google.protobuf import json_format
-from typing import Iterable, List
+from typing import Callable, Dict, Iterable, List, Tuple, Union
 
 from .models import Session, Chunk, TokenSelfResponse, \
     DataRegionsListResponse, SessionListResponse, ChunksListResponse, \
     CardListResponse, Card, SealedBundle, FeatureListResponse, SignalsResponse, \
     Journey, JourneyListResponse, JourneyDetailResponse, SessionFeaturesResponse, \
-    JourneyFeaturesResponse
+    JourneyFeaturesResponse, PaginatedFieldsResponse
 
 from .models.journey_feedback_pb2 import JourneyFeedback
 
+from .cache import ChunkCache, RegionCache
+from .ratelimit import RateLimiter, THROTTLED_STATUS_CODES
+from .metrics import TransferMetrics, TransferStats
+from .util import split_lines, split_length_delimited, IterableReader, create_temp_file
+from .decoder import JsonDecoder, ProtobufJsonDecoder
+from .lazy import BundleProjection, LazySealedBundle
+from .pipeline import DecodePool
 from .download import DownloadAllSessions
 from . import Platform
 
-from retry.api import retry_call
+
+READ_BUFFER_SIZE = 1024 * 1024
+PROTOBUF_CONTENT_TYPE = "application/x-protobuf"
+WIRE_FORMATS = ("json", "protobuf")
+SHARD_QUEUE_SIZE = 100
+_SHARD_DONE = object()
+PARTIAL_DOWNLOAD_SUFFIX = ".partial"
+# a read cut short by a dropped connection is lost, so archives are read in smaller pieces
+DOWNLOAD_BUFFER_SIZE = 64 * 1024
+# errors that leave a partial download worth resuming
+RESUMABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)
+# errors that make a partial download not worth resuming: a corrupt archive, or one that
+# doesn't hold exactly one file
+INVALID_ARCHIVE_ERRORS = (tarfile.TarError, zlib.error, EOFError, RuntimeError)
 
 
 class Client(object):
@@ -54,7 +81,16 @@ class Client(object):
         root_domain: str = "moonsense.cloud",
         protocol: str = "https",
         default_region: str = "us-central1.gcp",
-        tries: int = 3
+        tries: int = 3,
+        pool_size: int = 10,
+        region_cache_size: int = 10000,
+        region_cache_ttl: float = 3600,
+        rate_limiter: RateLimiter = None,
+        transfer_callback: Callable[[TransferMetrics], None] = None,
+        wire_format: str = "json",
+        json_decoder: JsonDecoder = None,
+        decode_pool: DecodePool = None,
+        chunk_cache: ChunkCache = None
     ) -> None:
         """
         Construct a new 'Client' object
@@ -63,7 +99,28 @@ class Client(object):
         :param root_domain: Root API domain (defaults to moonsense.cloud)
         :param protocol: Protocol to use when connecting to the API (defaults to https)
         :param default_region: Default Moonsense Cloud Data Plane region to connect to
+        :param tries: Number of attempts made for retried calls (defaults to 3)
+        :param pool_size: Number of keep-alive connections kept open per region host (defaults to 10)
+        :param region_cache_size: Number of session to region mappings remembered by the client.
+                                  Set to 0 to always describe the session (defaults to 10000)
+        :param region_cache_ttl: Number of seconds a cached session region stays valid (defaults to 1h)
+        :param rate_limiter: Optional - The 'RateLimiter' pacing requests to each region. A limiter
+                             that adapts to throttled responses is created if 'None' is supplied.
+        :param transfer_callback: Optional - Called with the 'TransferMetrics' of every API call once
+                                  its body has been read, e.g. to export bandwidth metrics
+        :param wire_format: Either "json" (default) or "protobuf". In "protobuf" mode responses are
+                            requested as binary protobuf and decoded without JSON parsing. Endpoints
+                            that don't offer protobuf transparently fall back to JSON.
+        :param json_decoder: Optional - The 'JsonDecoder' used for JSON responses and bundle lines.
+                             Defaults to json_format. Pass a 'FastJsonDecoder' for CPU-bound consumers.
+        :param decode_pool: Optional - A 'DecodePool' that decodes the JSON bundle lines of 'read_chunk'
+                            and 'read_session' on multiple cores. It is not closed by the client.
+        :param chunk_cache: Optional - A 'ChunkCache' storing chunks read through 'read_chunk' on disk,
+                            so chunks that are read again are not downloaded again.
         """
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"wire_format must be one of {WIRE_FORMATS}, got: {wire_format}")
+
         if secret_token is None:
             secret_token = os.environ.get("MOONSENSE_SECRET_TOKEN", None)
             if secret_token is None:
@@ -78,6 +135,279 @@ class Client(object):
         self._headers = {"headers": {
             "Authorization": f"Bearer {self._secret_token}"}}
         self.tries = tries
+        self._pool_size = pool_size
+        self._http = self._new_http_session()
+        self._regions = RegionCache(region_cache_size, region_cache_ttl)
+        self._rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self._transfer_callback = transfer_callback
+        self._transfer_stats = TransferStats()
+        self._wire_format = wire_format
+        self._json_decoder = json_decoder if json_decoder is not None else ProtobufJsonDecoder()
+        self._decode_pool = decode_pool
+        self._chunk_cache = chunk_cache
+
+    def _new_http_session(self) -> requests.Session:
+        # A single Session is shared by all methods and threads. The adapter keeps a
+        # thread-safe pool of keep-alive connections per host, so repeated calls to a
+        # region skip the TCP and TLS handshakes.
+        http = requests.Session()
+        # requests already offers every content encoding urllib3 can decode while
+        # streaming: gzip and deflate, br with the optional 'brotli' package and, from
+        # urllib3 2 on, zstd with the optional 'zstandard' package. See the 'compression'
+        # extra.
+        adapter = HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size)
+        http.mount("https://", adapter)
+        http.mount("http://", adapter)
+        return http
+
+    def _grow_pool(self, size: int) -> None:
+        # Keeps at least 'size' connections per host, so that as many threads can share
+        # this client without opening and discarding connections on every request.
+        if size <= self._pool_size:
+            return
+        self._pool_size = size
+        replaced = self._http.get_adapter("https://")
+        adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+        # idle connections are closed right away, connections in use once they are returned
+        replaced.close()
+
+    def _request(
+        self,
+        method: str,
+        endpoint: str,
+        authenticate: bool = True,
+        retry_connection_errors: bool = True,
+        **kwargs) -> requests.Response:
+        # Every API call goes through here. Requests are paced by the rate limiter of the
+        # target host, and throttled responses (429/503) are retried with an exponential
+        # backoff that honors Retry-After. Connection errors are only retried for GETs,
+        # unless the caller retries them itself.
+        host = urlparse(endpoint).netloc
+        headers = kwargs.pop("headers", None) or {}
+        if authenticate:
+            headers = {**self._headers["headers"], **headers}
+        kwargs["headers"] = headers
+
+        for attempt in range(self.tries):
+            last_attempt = attempt == self.tries - 1
+            self._rate_limiter.acquire(host)
+            try:
+                http_response = self._http.request(method, endpoint, **kwargs)
+            except requests.ConnectionError:
+                if last_attempt or method != "GET" or not retry_connection_errors:
+                    raise
+                sleep(self._rate_limiter.backoff(attempt))
+                continue
+
+            retry_after = http_response.headers.get("Retry-After")
+            self._rate_limiter.on_response(host, http_response.status_code, retry_after)
+            if http_response.status_code not in THROTTLED_STATUS_CODES or last_attempt:
+                if not kwargs.get("stream", False):
+                    self._record_transfer(http_response, len(http_response.content))
+                return http_response
+
+            http_response.close()
+            sleep(self._rate_limiter.backoff(attempt, retry_after))
+
+    def _accept_headers(self, delimited: bool = False) -> dict:
+        # In protobuf mode ask for binary messages, keeping JSON as the fallback the
+        # server may answer with. Streams of messages are length-delimited.
+        if self._wire_format != "protobuf":
+            return {}
+        media_type = PROTOBUF_CONTENT_TYPE + ("; delimited=true" if delimited else "")
+        return {"Accept": f"{media_type}, application/json;q=0.9"}
+
+    @staticmethod
+    def _is_protobuf(http_response: requests.Response) -> bool:
+        return http_response.headers.get("Content-Type", "").startswith(PROTOBUF_CONTENT_TYPE)
+
+    def _parse(self, http_response: requests.Response, message):
+        # Decodes a response into 'message' based on the content type the server picked.
+        if self._is_protobuf(http_response):
+            message.ParseFromString(http_response.content)
+            return message
+        return self._json_decoder.decode(http_response.content, message)
+
+    @staticmethod
+    def _decode_record(data: bytes, lazy: bool = False, projection: BundleProjection = None):
+        if lazy:
+            return LazySealedBundle.from_protobuf(data, projection)
+        if projection is not None:
+            return projection.decode_protobuf(data)
+        return SealedBundle.FromString(data)
+
+    def _decode_bundle(self, line: bytes, lazy: bool = False, projection: BundleProjection = None):
+        if lazy:
+            return LazySealedBundle.from_json(line, self._json_decoder, projection)
+        if projection is not None:
+            return projection.decode_json(line, self._json_decoder)
+        return self._json_decoder.decode(line, SealedBundle())
+
+    def _iter_content(self, http_response: requests.Response, chunk_size: int = READ_BUFFER_SIZE) -> Iterable[bytes]:
+        # Decompresses a streamed response chunk by chunk and records its transfer
+        # metrics once the body has been consumed.
+        decoded_bytes = 0
+        for buffer in http_response.iter_content(chunk_size=chunk_size):
+            decoded_bytes += len(buffer)
+            yield buffer
+        self._record_transfer(http_response, decoded_bytes)
+
+    def _record_transfer(self, http_response: requests.Response, decoded_bytes: int) -> None:
+        metrics = TransferMetrics(
+            http_response.request.method,
+            http_response.url,
+            http_response.status_code,
+            http_response.headers.get("Content-Encoding", ""),
+            http_response.raw.tell() if http_response.raw is not None else decoded_bytes,
+            decoded_bytes)
+        self._transfer_stats.add(metrics)
+        if self._transfer_callback is not None:
+            self._transfer_callback(metrics)
+
+    def transfer_stats(self) -> dict:
+        """
+        Report the bytes received by this client so far
+
+        :return: a dictionary keyed by content encoding with the number of requests, the bytes
+                 received over the wire and the bytes after decompression
+        """
+        return self._transfer_stats.snapshot()
+
+    def rate_limit_status(self) -> dict:
+        """
+        Report how close the client is to the rate limit of each region it talked to
+
+        :return: a dictionary keyed by host, see 'RateLimiter.status'
+        """
+        return self._rate_limiter.status()
+
+    def close(self) -> None:
+        """
+        Close all pooled connections held by this client
+        """
+        self._http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _resolve_session(self, session_id: Union[str, Session]) -> Tuple[str, str]:
+        # Data plane calls need the region a session is stored in. Prefer the region
+        # carried by a 'Session' object, then the cache, and only describe the session
+        # as a last resort.
+        if isinstance(session_id, Session):
+            self._regions.put(session_id.session_id, session_id.region_id)
+            if session_id.region_id:
+                return session_id.session_id, session_id.region_id
+            session_id = session_id.session_id
+
+        region = self._regions.get(session_id)
+        if region is None:
+            region = self.describe_session(session_id).region_id
+        return session_id, region
+
+    def _iter_pages(self, fetch_page, has_next_page, prefetch: int):
+        # Yields page responses in server order. With prefetch enabled, the total page
+        # count from the first response is used to keep up to 'prefetch' later pages
+        # in flight while the caller consumes the current one.
+        response = fetch_page(1)
+        yield response
+
+        page = response.pagination.current_page + 1
+        total_pages = response.pagination.total_pages
+        if prefetch > 0 and has_next_page(response) and page <= total_pages:
+            self._grow_pool(prefetch)
+            pending = deque()
+            with ThreadPoolExecutor(max_workers=prefetch) as executor:
+                try:
+                    while pending or page <= total_pages:
+                        while page <= total_pages and len(pending) < prefetch:
+                            pending.append(executor.submit(fetch_page, page))
+                            page += 1
+                        response = pending.popleft().result()
+                        yield response
+                finally:
+                    for future in pending:
+                        future.cancel()
+
+            if not has_next_page(response):
+                return
+            # more pages showed up while listing, continue one page at a time.
+            page = response.pagination.current_page + 1
+
+        while has_next_page(response):
+            response = fetch_page(page)
+            yield response
+            page = response.pagination.current_page + 1
+
+    def _list_sharded(self, list_window, since: datetime, until: datetime, shards: int, item_id):
+        # Splits [since, until] into windows that are listed by one thread each, then
+        # k-way merges the per-window streams newest first. Adjacent windows share their
+        # boundary instant, so items created exactly on it are dropped the second time.
+        if since is None or until is None:
+            raise ValueError("since and until are required when listing with shards")
+        if since > until:
+            raise ValueError("Since value larger than until value")
+
+        step = (until - since) / shards
+        edges = [since + step * i for i in range(shards)] + [until]
+        windows = [(edges[i], edges[i + 1]) for i in reversed(range(shards))]
+        stop_event = threading.Event()
+
+        def put(queue: Queue, item) -> bool:
+            while not stop_event.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def produce(queue: Queue, window_since: datetime, window_until: datetime) -> None:
+            try:
+                for item in list_window(window_since, window_until):
+                    if not put(queue, item):
+                        return
+                put(queue, _SHARD_DONE)
+            except Exception as e:
+                put(queue, e)
+
+        def consume(queue: Queue):
+            while True:
+                item = queue.get()
+                if item is _SHARD_DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        queues = []
+        for window_since, window_until in windows:
+            queue = Queue(maxsize=SHARD_QUEUE_SIZE)
+            queues.append(queue)
+            threading.Thread(target=produce, args=(queue, window_since, window_until), daemon=True).start()
+
+        def newest_first(item):
+            return (-item.created_at.seconds, -item.created_at.nanos)
+
+        try:
+            last_key = None
+            seen = set()
+            for item in heapq.merge(*[consume(queue) for queue in queues], key=newest_first):
+                key = newest_first(item)
+                if key != last_key:
+                    last_key = key
+                    seen.clear()
+                elif item_id(item) in seen:
+                    continue
+                seen.add(item_id(item))
+                yield item
+        finally:
+            stop_event.set()
 
     def _build_url(self, region: str) -> str:
         if region == "":
@@ -97,7 +427,7 @@ class Client(object):
         :return: a list of dictionaries describing the regions
         """
         endpoint = "https://api." + self._root_domain + "/v2/regions"
-        return json_format.Parse(requests.get(endpoint).text, DataRegionsListResponse(), ignore_unknown_fields=True)
+        return self._json_decoder.decode(self._request("GET", endpoint, authenticate=False).text, DataRegionsListResponse())
 
     def whoami(self) -> TokenSelfResponse:
         """
@@ -106,15 +436,16 @@ class Client(object):
         :return: a 'TokenSelfResponse' object with details
         """
         endpoint = self._build_url(self._default_region) + "/v2/tokens/self"
-        r = requests.get(endpoint, **self._headers)
-        return json_format.Parse(r.text, TokenSelfResponse(), ignore_unknown_fields=True)
+        r = self._request("GET", endpoint, headers=self._accept_headers())
+        return self._parse(r, TokenSelfResponse())
 
     def list_journeys(
         self,
         journeys_per_page: int = 50,
         platforms: List[Platform] = None,
         since: datetime = None,
-        until: datetime = None) -> Iterable[Journey]:
+        until: datetime = None,
+        shards: int = 1) -> Iterable[Journey]:
         """
         List journeys for the current project
 
@@ -123,8 +454,18 @@ class Client(object):
                             all 'Platform's will be returned.
         :param since: Optional - The start time to match.
         :param until: Optional - The end time to match.
+        :param shards: The number of time windows [since, until] is split into. Windows are listed
+                       concurrently and merged back in reverse chronological order. Requires both
+                       since and until when larger than 1. Defaults to 1.
         :return: a generator of 'Journey' objects
         """
+        if shards > 1:
+            yield from self._list_sharded(
+                lambda window_since, window_until: self.list_journeys(
+                    journeys_per_page, platforms, window_since, window_until),
+                since, until, shards, lambda journey: journey.journey_id)
+            return
+
         endpoint = self._build_url(self._default_region) + "/v2/journeys"
 
         page = 1
@@ -143,14 +484,13 @@ class Client(object):
             if platforms is not None:
                 params.append(("filter[platforms][]", platforms))
 
-            http_response = retry_call(requests.get, fargs=[endpoint, params], fkwargs=self._headers, tries=self.tries)
+            http_response = self._request("GET", endpoint, params=params, headers=self._accept_headers())
 
             if http_response.status_code != 200:
                 raise RuntimeError(
                     f"unable to list journeys. status code: {http_response.status_code}"
                 )
-            response = json_format.Parse(
-                http_response.text, JourneyListResponse(), ignore_unknown_fields=True)
+            response = self._parse(http_response, JourneyListResponse())
             if len(response.journeys) == 0:
                 return  # no more journeys
 
@@ -173,13 +513,13 @@ class Client(object):
         endpoint = self._build_url(
             self._default_region) + f"/v2/journeys/{journey_id}"
 
-        http_response = requests.get(endpoint, **self._headers)
+        http_response = self._request("GET", endpoint, headers=self._accept_headers())
         if http_response.status_code != 200:
             raise RuntimeError(
                 f"unable to describe journey. status code: {http_response.status_code}"
             )
 
-        return json_format.Parse(http_response.text, JourneyDetailResponse(), ignore_unknown_fields=True)
+        return self._parse(http_response, JourneyDetailResponse())
 
 
     def get_journey_feedback(self, journey_id: str) -> JourneyFeedback:
@@ -192,13 +532,13 @@ class Client(object):
         endpoint = self._build_url(
             self._default_region) + f"/v2/journeys/{journey_id}/feedback"
 
-        http_response = requests.get(endpoint, **self._headers)
+        http_response = self._request("GET", endpoint, headers=self._accept_headers())
         if http_response.status_code != 200:
             raise RuntimeError(
                 f"unable to get journey feedback. status code: {http_response.status_code}"
             )
 
-        return json_format.Parse(http_response.text, JourneyFeedback(), ignore_unknown_fields=True)
+        return self._parse(http_response, JourneyFeedback())
 
 
     def add_journey_feedback(self, journey_id: str, feedback: JourneyFeedback):
@@ -213,7 +553,7 @@ class Client(object):
         endpoint = self._build_url(
             self._default_region) + f"/v2/journeys/{journey_id}/feedback"
 
-        http_response = requests.post(endpoint, json=feedback, **self._headers)
+        http_response = self._request("POST", endpoint, json=feedback)
 
         if http_response.status_code != 200:
             raise RuntimeError(
@@ -226,7 +566,10 @@ class Client(object):
         journey_id: str = None,
         platforms: List[Platform] = None,
         since: datetime = None,
-        until: datetime = None) -> Iterable[Session]:
+        until: datetime = None,
+        per_page: int = 50,
+        prefetch: int = 0,
+        shards: int = 1) -> Iterable[Session]:
 
         """
         List sessions for the current project
@@ -237,50 +580,63 @@ class Client(object):
                           all 'Platform's will be returned.
         :param since: Optional - The start time to match.
         :param until: Optional - The end time to match.
+        :param per_page: The number of sessions to request per page (defaults to 50)
+        :param prefetch: The number of pages fetched ahead in parallel while the current page is
+                         consumed. Sessions are still returned in server order. Defaults to 0 -
+                         pages are fetched one after the other.
+        :param shards: The number of time windows [since, until] is split into. Windows are listed
+                       concurrently and merged back in reverse chronological order. Requires both
+                       since and until when larger than 1. Defaults to 1.
         :return: a generator of 'Session' objects
         """
+        if shards > 1:
+            yield from self._list_sharded(
+                lambda window_since, window_until: self.list_sessions(
+                    labels, journey_id, platforms, window_since, window_until, per_page, prefetch),
+                since, until, shards, lambda session: session.session_id)
+            return
+
         endpoint = self._build_url(self._default_region) + "/v2/sessions"
 
-        page = 1
-        while True:
-            params = [("per_page", "50"), ("page", page)]
+        filters = []
+        if since is not None:
+            since_with_tz = pytz.utc.localize(since)
+            filters.append(("filter[min_created_at]", since_with_tz.isoformat()))
 
-            if since is not None:
-                since_with_tz = pytz.utc.localize(since)
-                params.append(("filter[min_created_at]", since_with_tz.isoformat()))
+        if until is not None:
+            until_with_tz = pytz.utc.localize(until)
+            filters.append(("filter[max_created_at]", until_with_tz.isoformat()))
 
-            if until is not None:
-                until_with_tz = pytz.utc.localize(until)
-                params.append(("filter[max_created_at]", until_with_tz.isoformat()))
+        if labels is not None:
+            filters.append(("filter[labels][]", labels))
 
-            if labels is not None:
-                params.append(("filter[labels][]", labels))
+        if journey_id is not None:
+            filters.append(("filter[journey_id]", journey_id))
 
-            if journey_id is not None:
-                params.append(("filter[journey_id]", journey_id))
+        if platforms is not None:
+            filters.append(("filter[platforms][]", [p.value for p in platforms]))
 
-            if platforms is not None:
-                params.append(("filter[platforms][]", [p.value for p in platforms]))
-
-            http_response = retry_call(requests.get, fargs=[endpoint, params], fkwargs=self._headers, tries=self.tries)
+        def fetch_page(page: int) -> SessionListResponse:
+            params = [("per_page", str(per_page)), ("page", page)] + filters
+            http_response = self._request("GET", endpoint, params=params, headers=self._accept_headers())
 
             if http_response.status_code != 200:
                 raise RuntimeError(
                     f"unable to list sessions. status code: {http_response.status_code}"
                 )
-            response = json_format.Parse(
-                http_response.text, SessionListResponse(), ignore_unknown_fields=True)
+            return self._parse(http_response, SessionListResponse())
+
+        def has_next_page(response: SessionListResponse) -> bool:
+            return response.pagination.next_page is not None and response.pagination.next_page > 0
+
+        for response in self._iter_pages(fetch_page, has_next_page, prefetch):
             if len(response.sessions) == 0:
                 return  # no more sessions
 
             for session in response.sessions:
+                self._regions.put(session.session_id, session.region_id)
                 yield session
 
-            if response.pagination.next_page is not None and response.pagination.next_page > 0:
-                page = response.pagination.current_page + 1
-            else:
-                break
-
     def describe_session(self, session_id, minimal=True) -> Session:
         """
         Describe a specific session
@@ -293,13 +649,51 @@ class Client(object):
         endpoint = self._build_url(
             self._default_region) + f"/v2/sessions/{session_id}?view={view}"
 
-        http_response = requests.get(endpoint, **self._headers)
+        http_response = self._request("GET", endpoint, headers=self._accept_headers())
         if http_response.status_code != 200:
             raise RuntimeError(
                 f"unable to describe session. status code: {http_response.status_code}"
             )
 
-        return json_format.Parse(http_response.text, Session(), ignore_unknown_fields=True)
+        session = self._parse(http_response, Session())
+        self._regions.put(session.session_id, session.region_id)
+        return session
+
+    def describe_sessions(
+        self,
+        session_ids: Iterable[str],
+        concurrency: int = 10,
+        minimal: bool = True) -> Tuple[Dict[str, Session], Dict[str, Exception]]:
+        """
+        Describe many sessions at once. Requests are spread over the pooled connections
+        and a failure for one session does not stop the others.
+
+        :param session_ids: The IDs of the sessions
+        :param concurrency: The number of sessions described in parallel (defaults to 10). The
+                            connection pool is grown to match if it is smaller.
+        :param minimal: If true, only total values are returned for counters
+        :return: a tuple of a dictionary mapping session ids to 'Session' objects and a dictionary
+                 mapping the session ids that could not be described to the raised exception
+        """
+        sessions = {}
+        errors = {}
+        unique_ids = list(dict.fromkeys(session_ids))
+        if len(unique_ids) == 0:
+            return sessions, errors
+
+        self._grow_pool(concurrency)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(self.describe_session, session_id, minimal): session_id
+                for session_id in unique_ids
+            }
+            for future, session_id in futures.items():
+                try:
+                    sessions[session_id] = future.result()
+                except Exception as e:
+                    errors[session_id] = e
+
+        return sessions, errors
 
     def update_session_labels(self, session_id, labels: List[str]) -> None:
         """
@@ -315,85 +709,283 @@ class Client(object):
         for label in labels:
             payload["labels"].append({"name" : label})
 
-        http_response = requests.post(endpoint, json=payload, **self._headers)
+        http_response = self._request("POST", endpoint, json=payload)
 
         if http_response.status_code != 200:
             raise RuntimeError(
                 f"unable to update session labels. status code: {http_response.status_code}"
             )
 
-    def list_chunks(self, session_id) -> Iterable[Chunk]:
+    def list_chunks(
+        self,
+        session_id: Union[str, Session],
+        per_page: int = 50,
+        prefetch: int = 0) -> Iterable[Chunk]:
         """
         List all the granular data chunks that are part of a session that were persisted in
         in the Moonsense Cloud.
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
+        :param per_page: The number of chunks to request per page (defaults to 50)
+        :param prefetch: The number of pages fetched ahead in parallel while the current page is
+                         consumed. Chunks are still returned in server order. Defaults to 0.
         :return: a generator of 'Chunk' objects
         """
-        session = self.describe_session(session_id)
+        session_id, region = self._resolve_session(session_id)
         endpoint = (
-            self._build_url(session.region_id) +
+            self._build_url(region) +
             f"/v2/sessions/{session_id}/chunks"
         )
-        page = 1
-        while True:
-            http_response = requests.get(
-                endpoint, params=[("per_page", "50"), ("page", page)], **self._headers
+
+        def fetch_page(page: int) -> ChunksListResponse:
+            http_response = self._request(
+                "GET", endpoint, params=[("per_page", str(per_page)), ("page", page)],
+                headers=self._accept_headers()
             )
             if http_response.status_code != 200:
                 raise RuntimeError(
                     f"unable to list session chunks. status code: {http_response.status_code}"
                 )
 
-            response = json_format.Parse(
-                http_response.text, ChunksListResponse(), ignore_unknown_fields=True)
+            return self._parse(http_response, ChunksListResponse())
+
+        def has_next_page(response: ChunksListResponse) -> bool:
+            return response.pagination.current_page < response.pagination.total_pages
+
+        for response in self._iter_pages(fetch_page, has_next_page, prefetch):
             if len(response.chunks) == 0:
                 return  # no chunks found for this session
             for chunk in response.chunks:
                 yield chunk
 
-            if response.pagination.current_page < response.pagination.total_pages:
-                page = response.pagination.current_page + 1
-            else:
-                break
-
-    def read_chunk(self, session_id, chunk_id) -> Iterable[SealedBundle]:
+    def read_chunk(self, session_id: Union[str, Session], chunk_id: Union[str, Chunk], lazy: bool = False,
+                   fields: Iterable[str] = None) -> Iterable[SealedBundle]:
         """
-        Read all the bundles within a data chunk :param chunk: session data chunk object
+        Read all the bundles within a data chunk
+
+        :param session_id: The ID of the session or a 'Session' object
+        :param chunk_id: The ID of the chunk or a 'Chunk' object. The chunk cache of the client
+                         is only used for 'Chunk' objects since they carry the md5 of the chunk.
+        :param lazy: If set to True, 'LazySealedBundle' views are returned that only decode
+                     the repeated sensor and event fields of a bundle when they are accessed.
+        :param fields: Optional - The repeated bundle fields to decode, e.g. ["accelerometer_data",
+                       "pointer_data"]. Every other sensor and event field is skipped. If 'None'
+                       is supplied, all fields are decoded.
         :return: generator of bundles. The chunk read had to be persisted in the Moonsense Cloud first.
         """
-        session = self.describe_session(session_id)
+        md5 = None
+        if isinstance(chunk_id, Chunk):
+            md5, chunk_id = chunk_id.md5, chunk_id.chunk_id
+        projection = BundleProjection(fields) if fields is not None else None
+        session_id, region = self._resolve_session(session_id)
         endpoint = self._build_url(
-            session.region_id) + f"/v2/sessions/{session_id}/chunks/{chunk_id}"
-        http_response = requests.get(endpoint, stream=True, **self._headers)
-        if http_response.status_code != 200:
-            raise RuntimeError(
-                f"unable to read: {chunk_id}. status code: {http_response.status_code}"
-            )
-        for line in http_response.iter_lines(chunk_size=1024 * 1024):
-            yield json_format.Parse(line, SealedBundle(), ignore_unknown_fields=True)
+            region) + f"/v2/sessions/{session_id}/chunks/{chunk_id}"
+
+        if self._chunk_cache is not None and md5:
+            records = self._chunk_cache.get(md5)
+            if records is None:
+                # the whole chunk is cached, projections are applied when reading it back
+                records = list(self._iter_chunk_records(endpoint, chunk_id))
+                self._chunk_cache.put(md5, records)
+            for data in records:
+                yield self._decode_record(data, lazy, projection)
+            return
+
+        # the response is closed even if the caller stops early, so the connection
+        # is handed back to the pool.
+        with self._request("GET", endpoint, stream=True, headers=self._accept_headers(delimited=True)) as http_response:
+            if http_response.status_code != 200:
+                raise RuntimeError(
+                    f"unable to read: {chunk_id}. status code: {http_response.status_code}"
+                )
+            if self._is_protobuf(http_response):
+                for data in split_length_delimited(self._iter_content(http_response)):
+                    yield self._decode_record(data, lazy, projection)
+            elif self._decode_pool is not None and not lazy:
+                yield from self._decode_pool.decode(split_lines(self._iter_content(http_response)), fields)
+            else:
+                for line in split_lines(self._iter_content(http_response)):
+                    yield self._decode_bundle(line, lazy, projection)
+
+    def _read_chunk_lines(self, session_id: Union[str, Session], chunk_id: str) -> Iterable[bytes]:
+        # Reads a chunk as the JSON lines sent by the server, without decoding them, for
+        # callers that store the chunk as is.
+        session_id, region = self._resolve_session(session_id)
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/chunks/{chunk_id}"
+        with self._request("GET", endpoint, stream=True) as http_response:
+            if http_response.status_code != 200:
+                raise RuntimeError(
+                    f"unable to read: {chunk_id}. status code: {http_response.status_code}"
+                )
+            yield from split_lines(self._iter_content(http_response))
+
+    def _iter_chunk_records(self, endpoint: str, chunk_id: str) -> Iterable[bytes]:
+        # Reads a chunk as serialized 'SealedBundle' messages, the form the chunk cache stores.
+        with self._request("GET", endpoint, stream=True, headers=self._accept_headers(delimited=True)) as http_response:
+            if http_response.status_code != 200:
+                raise RuntimeError(
+                    f"unable to read: {chunk_id}. status code: {http_response.status_code}"
+                )
+            if self._is_protobuf(http_response):
+                yield from split_length_delimited(self._iter_content(http_response))
+            elif self._decode_pool is not None:
+                yield from self._decode_pool.decode(split_lines(self._iter_content(http_response)), serialized=True)
+            else:
+                for line in split_lines(self._iter_content(http_response)):
+                    yield self._json_decoder.decode(line, SealedBundle()).SerializeToString()
+
+    def read_session_chunks(
+        self,
+        session_id: Union[str, Session],
+        workers: int = 4,
+        max_buffered_chunks: int = None,
+        lazy: bool = False,
+        fields: Iterable[str] = None) -> Iterable[SealedBundle]:
+        """
+        Read all the bundles of a session chunk by chunk, reading several chunks in parallel.
+
+        :param session_id: The ID of the session or a 'Session' object
+        :param workers: The number of chunks read concurrently. Defaults to 4. The connection
+                        pool is grown to match if it is smaller.
+        :param max_buffered_chunks: The maximum number of chunks read ahead of the chunk currently
+                                    returned, which caps the memory used. Defaults to twice 'workers'.
+        :param lazy: If set to True, 'LazySealedBundle' views are returned, see 'read_chunk'.
+        :param fields: Optional - The repeated bundle fields to decode, see 'read_chunk'.
+        :return: a generator of bundles, ordered by the creation time of their chunk.
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if max_buffered_chunks is None:
+            max_buffered_chunks = 2 * workers
+        if max_buffered_chunks < workers:
+            raise ValueError("max_buffered_chunks must be at least workers")
+
+        session_id, _ = self._resolve_session(session_id)
+        chunks = sorted(
+            self.list_chunks(session_id),
+            key=lambda chunk: (chunk.created_at.seconds, chunk.created_at.nanos))
+
+        def read(chunk: Chunk) -> List[SealedBundle]:
+            return list(self.read_chunk(session_id, chunk, lazy=lazy, fields=fields))
+
+        # chunks complete in any order but are returned in creation order, a chunk that
+        # finished early waits in 'pending' until all chunks before it were returned.
+        pending = deque()
+        remaining = iter(chunks)
+        self._grow_pool(workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while True:
+                    while len(pending) < max_buffered_chunks:
+                        chunk = next(remaining, None)
+                        if chunk is None:
+                            break
+                        pending.append(executor.submit(read, chunk))
+                    if not pending:
+                        return
+                    for bundle in pending.popleft().result():
+                        yield bundle
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def follow_session(
+        self,
+        session_id: Union[str, Session],
+        since: datetime = None,
+        on_chunk: Callable[[Chunk], None] = None,
+        inactive_after: float = 90,
+        min_interval: float = 1,
+        max_interval: float = 30,
+        lazy: bool = False,
+        fields: Iterable[str] = None) -> Iterable[SealedBundle]:
+        """
+        Follow a live session and read the bundles of its chunks as they are persisted.
+        Stops once the session has not received data for 'inactive_after' seconds and
+        all of its chunks were read.
+
+        :param session_id: The ID of the session or a 'Session' object
+        :param since: Optional - Chunk watermark to resume from. Chunks created at or before it are
+                      skipped. Pass the 'created_at' of the last chunk handed to 'on_chunk'.
+        :param on_chunk: Optional - Called with each 'Chunk' once all of its bundles were returned
+        :param inactive_after: Number of seconds without new events after which the session is
+                               considered inactive (defaults to 90)
+        :param min_interval: Seconds between polls while the session receives data (defaults to 1)
+        :param max_interval: Upper bound in seconds the poll interval backs off to while the session
+                             is idle (defaults to 30)
+        :param lazy: If set to True, 'LazySealedBundle' views are returned, see 'read_chunk'.
+        :param fields: Optional - The repeated bundle fields to decode, see 'read_chunk'.
+        :return: a generator of bundles, ordered by the creation time of their chunk.
+        """
+        session_id, _ = self._resolve_session(session_id)
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+        processed = set()
+        # creation time of the newest chunk read so far
+        watermark = since
+        # newest event of the session when a listing last found no new chunk. Events
+        # timestamped before a chunk was persisted can still land in a later chunk, so
+        # the chunks are listed again whenever the newest event moves, until a listing
+        # comes back without anything new.
+        settled_event = None
+        interval = min_interval
+        last_newest_event = None
+        while True:
+            session = self.describe_session(session_id)
+            newest_event = session.newest_event.ToDatetime().replace(tzinfo=timezone.utc)
+            inactive = datetime.now(timezone.utc) - newest_event > timedelta(seconds=inactive_after)
+
+            if watermark is None or newest_event >= watermark or newest_event != settled_event or inactive:
+                chunks = sorted(
+                    (chunk for chunk in self.list_chunks(session_id)
+                     if chunk.chunk_id not in processed and
+                     (since is None or chunk.created_at.ToDatetime().replace(tzinfo=timezone.utc) > since)),
+                    key=lambda chunk: (chunk.created_at.seconds, chunk.created_at.nanos))
+                if len(chunks) == 0:
+                    settled_event = newest_event
+                for chunk in chunks:
+                    for bundle in self.read_chunk(session_id, chunk, lazy=lazy, fields=fields):
+                        yield bundle
+                    processed.add(chunk.chunk_id)
+                    created_at = chunk.created_at.ToDatetime().replace(tzinfo=timezone.utc)
+                    watermark = created_at if watermark is None else max(watermark, created_at)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+
+            if inactive:
+                return
+
+            # poll quickly while events keep arriving and back off while the session is idle
+            if newest_event != last_newest_event:
+                interval = min_interval
+            else:
+                interval = min(max_interval, interval * 2)
+            last_newest_event = newest_event
+            sleep(interval)
 
-    def list_session_features(self, session_id, region=None) -> SessionFeaturesResponse:
+    def list_session_features(self, session_id: Union[str, Session], region=None) -> SessionFeaturesResponse:
         """
         Lists the features for a given session
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
         :param region: If not set, will look it up when run
         :return: a 'SessionFeaturesResponse' object with details
         """
         if region == None:
-            session = self.describe_session(session_id)
-            region = session.region_id
+            session_id, region = self._resolve_session(session_id)
+        elif isinstance(session_id, Session):
+            session_id = session_id.session_id
         endpoint = self._build_url(
             region) + f"/v2/sessions/{session_id}/features"
 
-        http_response = requests.get(endpoint, **self._headers)
+        http_response = self._request("GET", endpoint, headers=self._accept_headers())
         if http_response.status_code != 200:
             raise RuntimeError(
                 f"unable to list session features. status code: {http_response.status_code}"
             )
 
-        return json_format.Parse(http_response.text, SessionFeaturesResponse(), ignore_unknown_fields=True)
+        return self._parse(http_response, SessionFeaturesResponse())
 
     def list_journey_features(self, journey_id, region=None) -> JourneyFeaturesResponse:
         """
@@ -410,97 +1002,233 @@ class Client(object):
         endpoint = self._build_url(
             region) + f"/v2/journeys/{journey_id}/features"
 
-        http_response = requests.get(endpoint, **self._headers)
+        http_response = self._request("GET", endpoint, headers=self._accept_headers())
         if http_response.status_code != 200:
             raise RuntimeError(
                 f"unable to list journey features. status code: {http_response.status_code}"
             )
 
-        return json_format.Parse(http_response.text, JourneyFeaturesResponse(), ignore_unknown_fields=True)
+        return self._parse(http_response, JourneyFeaturesResponse())
 
 
-    def list_session_signals(self, session_id, region=None) -> SignalsResponse:
+    def list_session_signals(self, session_id: Union[str, Session], region=None) -> SignalsResponse:
         """
         Lists the signals for a given session
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
         :param region: If not set, will look it up when run
-        :return: a 'FeatureListResponse' object with details
+        :return: a 'SignalsResponse' object with details
         """
         if region == None:
-            session = self.describe_session(session_id)
-            region = session.region_id
-        session = self.describe_session(session_id)
+            session_id, region = self._resolve_session(session_id)
+        elif isinstance(session_id, Session):
+            session_id = session_id.session_id
         endpoint = self._build_url(
             region) + f"/v2/sessions/{session_id}/signals"
 
-        http_response = requests.get(endpoint, **self._headers)
+        http_response = self._request("GET", endpoint, headers=self._accept_headers())
         if http_response.status_code != 200:
             raise RuntimeError(
                 f"unable to list session signals. status code: {http_response.status_code}"
             )
 
-        return json_format.Parse(http_response.text, SignalsResponse(), ignore_unknown_fields=True)
-
-    def _download_file(self, session_id, http_response, output_file):
-        # create temporary director for writing and unpacking tar.gz file.
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            temp_output_file = os.path.join(tmpdirname, "temp-" + session_id + ".tar.gz")
-
-            # write the response of the API to a tar.gz file.
-            with open(temp_output_file, "wb") as temp_tar_fd:
-                for buffer in http_response.iter_content(chunk_size=1024 * 1024):
-                    temp_tar_fd.write(buffer)
-
-            # open the tar file
-            with tarfile.open(temp_output_file, mode='r:gz') as temp_tar:
-                # choose a path to extract the tar.gz archive.
-                temp_extract_path = os.path.join(tmpdirname, "extracted")
-                temp_tar_contents = temp_tar.getmembers()
-                if len(temp_tar_contents) != 1:
-                        raise RuntimeError("Expected to download just one file but got many")
-
-                extracted_file_name = temp_tar_contents[0].name
-                # extract the archive.
-                temp_tar.extractall(temp_extract_path)
-                # move the only file in the archive to the final user-inputted path.
-                shutil.move(os.path.join(tmpdirname, "extracted", extracted_file_name), output_file)
-
+        return self._parse(http_response, SignalsResponse())
+
+    def _iter_archive_member(self, chunks: Iterable[bytes], on_member=None) -> Iterable[bytes]:
+        # Streams the content of the single file inside a tar.gz stream without
+        # writing anything to disk. 'on_member' is called with its 'TarInfo' first.
+        with tarfile.open(fileobj=IterableReader(chunks), mode="r|gz") as archive:
+            member = archive.next()
+            if member is None:
+                return
+            if on_member is not None:
+                on_member(member)
+
+            extracted = archive.extractfile(member)
+            while True:
+                buffer = extracted.read(READ_BUFFER_SIZE)
+                if not buffer:
+                    break
+                yield buffer
+
+            if archive.next() is not None:
+                raise RuntimeError("Expected to download just one file but got many")
+
+    def _extract_archive(self, chunks: Iterable[bytes], output_file: str) -> None:
+        # stream the single file of the tar.gz archive straight into a temporary file next
+        # to the output file, then atomically rename it into place once complete. The file
+        # gets the mode of the archive member, like tarfile extraction does.
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        fd, temp_output_file = create_temp_file(
+            output_dir, prefix="." + os.path.basename(output_file) + ".", suffix=".part")
+        modes = []
+        try:
+            with os.fdopen(fd, "wb") as temp_fd:
+                for buffer in self._iter_archive_member(chunks, lambda member: modes.append(member.mode)):
+                    temp_fd.write(buffer)
+            if modes:
+                os.chmod(temp_output_file, modes[0] & 0o777)
+            os.replace(temp_output_file, output_file)
+        except BaseException:
+            os.remove(temp_output_file)
+            raise
+
+    @staticmethod
+    def _load_partial_download(partial_file: str, state_file: str) -> Union[dict, None]:
+        # Returns the validators of a resumable partial archive, leftovers that can't be
+        # resumed are removed.
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+            size = os.path.getsize(partial_file)
+            if state.get("etag") and (state.get("length") is None or size <= state["length"]):
+                return state
+        except (OSError, ValueError):
+            pass
+        Client._remove_partial_download(partial_file, state_file)
+        return None
+
+    @staticmethod
+    def _remove_partial_download(partial_file: str, state_file: str) -> None:
+        for path in (state_file, partial_file):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _fetch_archive(self, endpoint: str, name: str, partial_file: str, state_file: str) -> Iterable[bytes]:
+        # Appends the missing bytes of the archive to the partial file and yields them. A
+        # partial archive is resumed with a Range request that only succeeds if its ETag
+        # still matches, otherwise the server sends the whole archive again.
+        state = self._load_partial_download(partial_file, state_file)
+        offset = os.path.getsize(partial_file) if state is not None else 0
+        length = state["length"] if state is not None else None
+        # ranges are byte offsets into the archive as stored, so it must not be re-encoded
+        headers = {"Accept-Encoding": "identity"}
+        if state is not None:
+            if length is not None and offset == length:
+                return
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = state["etag"]
+
+        # connection errors are retried by the caller, which resumes from the partial archive
+        with self._request("GET", endpoint, stream=True, headers=headers,
+                           retry_connection_errors=False) as http_response:
+            if http_response.status_code == 206 and state is not None:
+                expected = f"bytes {offset}-"
+                content_range = http_response.headers.get("Content-Range", "")
+                if not content_range.startswith(expected) or \
+                        (length is not None and not content_range.endswith(f"/{length}")):
+                    self._remove_partial_download(partial_file, state_file)
+                    raise RuntimeError(
+                        f"unable to resume download of {name}: unexpected Content-Range {content_range}")
+                mode = "ab"
+            elif http_response.status_code == 200:
+                # first request, or the archive changed since the partial download
+                offset = 0
+                mode = "wb"
+                etag = http_response.headers.get("ETag")
+                content_length = http_response.headers.get("Content-Length")
+                length = int(content_length) if content_length is not None else None
+                self._remove_partial_download(partial_file, state_file)
+                # weak ETags and re-encoded responses can't be resumed byte for byte
+                if etag and not etag.startswith("W/") and "Content-Encoding" not in http_response.headers:
+                    with open(state_file, "w") as f:
+                        json.dump({"etag": etag, "length": length}, f)
+            elif http_response.status_code == 416:
+                # the partial archive doesn't fit the archive on the server anymore
+                self._remove_partial_download(partial_file, state_file)
+                raise requests.exceptions.ConnectionError(f"unable to resume download of {name}")
+            else:
+                raise RuntimeError(
+                    f"unable to read: {name}. status code: {http_response.status_code}")
+
+            with open(partial_file, mode) as f:
+                for buffer in self._iter_content(http_response, DOWNLOAD_BUFFER_SIZE):
+                    f.write(buffer)
+                    f.flush()
+                    offset += len(buffer)
+                    yield buffer
+
+        if length is not None and offset > length:
+            self._remove_partial_download(partial_file, state_file)
+            raise RuntimeError(f"unable to download {name}: received {offset} of {length} bytes")
+        if length is not None and offset < length:
+            raise requests.exceptions.ConnectionError(
+                f"incomplete download of {name}: received {offset} of {length} bytes")
+
+    def _download_file(self, endpoint: str, output_file: str, name: str) -> None:
+        # The archive is extracted while it downloads and a copy is kept in a partial file
+        # next to the output file. If the connection drops, the partial archive is resumed
+        # with Range requests, in this call or a later one, and extracted once complete.
+        # The first request and the resumes share a budget of 'tries' requests.
+        partial_file = output_file + PARTIAL_DOWNLOAD_SUFFIX
+        state_file = partial_file + ".json"
+
+        attempt = 0
+        if self._load_partial_download(partial_file, state_file) is None:
+            chunks = self._fetch_archive(endpoint, name, partial_file, state_file)
+            try:
+                self._extract_archive(chunks, output_file)
+                self._remove_partial_download(partial_file, state_file)
+                return
+            except RESUMABLE_ERRORS:
+                attempt = 1
+                if attempt == self.tries:
+                    raise
+            except INVALID_ARCHIVE_ERRORS:
+                # other errors, like an interrupt, keep the partial archive for the next call
+                self._remove_partial_download(partial_file, state_file)
+                raise
+            finally:
+                chunks.close()
 
-    def download_session(self, session_id, output_file) -> None:
+        while True:
+            if attempt > 0:
+                sleep(self._rate_limiter.backoff(attempt - 1))
+            try:
+                for _ in self._fetch_archive(endpoint, name, partial_file, state_file):
+                    pass
+                break
+            except RESUMABLE_ERRORS:
+                attempt += 1
+                if attempt >= self.tries:
+                    raise
+
+        try:
+            with open(partial_file, "rb") as f:
+                self._extract_archive(iter(lambda: f.read(READ_BUFFER_SIZE), b""), output_file)
+        except INVALID_ARCHIVE_ERRORS:
+            self._remove_partial_download(partial_file, state_file)
+            raise
+        self._remove_partial_download(partial_file, state_file)
+
+    def download_session(self, session_id: Union[str, Session], output_file) -> None:
         """
         Download and consolidate all data ingested so far for a session into a single file - one JSON per line.
+        An interrupted download is resumed from where it stopped on the next call.
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
         :param output_file: The path to the output file
         """
-        session = self.describe_session(session_id, minimal=True)
-
-        endpoint = self._build_url(session.region_id) + f"/v2/sessions/{session_id}/bundles"
-        http_response = requests.get(endpoint, stream=True, **self._headers)
-        if http_response.status_code != 200:
-            raise RuntimeError(
-                f"unable to read: {session_id}. status code: {http_response.status_code}")
+        session_id, region = self._resolve_session(session_id)
 
-        self._download_file(session_id, http_response, output_file)
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/bundles"
+        self._download_file(endpoint, output_file, session_id)
 
 
-    def download_pcap_data(self, session_id, output_file) -> None:
+    def download_pcap_data(self, session_id: Union[str, Session], output_file) -> None:
         """
-        Download a consolidated PCAP file with all the network packet data captured by the Moonsense Cloud
+        Download a consolidated PCAP file with all the network packet data captured by the Moonsense Cloud.
+        An interrupted download is resumed from where it stopped on the next call.
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
         :param output_file: The path to the output file
         """
-        session = self.describe_session(session_id, minimal=True)
+        session_id, region = self._resolve_session(session_id)
 
-        endpoint = self._build_url(session.region_id) + f"/v2/sessions/{session_id}/network-telemetry/packets"
-        http_response = requests.get(endpoint, stream=True, **self._headers)
-        if http_response.status_code != 200:
-            raise RuntimeError(
-                f"unable to read: {session_id}. status code: {http_response.status_code}")
-
-        self._download_file(session_id, http_response, output_file)
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/network-telemetry/packets"
+        self._download_file(endpoint, output_file, session_id)
 
 
     def download_all_sessions(
@@ -512,7 +1240,9 @@ class Client(object):
         incremental: bool,
         labels: list[str],
         platforms: List[Platform] = None,
-        with_journey_id: bool = False) -> None:
+        with_journey_id: bool = False,
+        engine: str = None,
+        sync: bool = False) -> None:
         """
         Download all sessions from a project based on the provided filters.
 
@@ -528,66 +1258,148 @@ class Client(object):
                             web, ios, android or None for all.
         :param with_journey_id: If set to True, organizes the downloaded sessions by date and
                             journey id. Default: False.
+        :param engine: Either "process" to download in a pool of processes or "thread" to keep
+                       all downloads in flight in this process, sharing the pooled connections
+                       of this client. The connection pool is grown to the download parallelism
+                       when using threads. Ctrl-C stops the threads right away and the
+                       interrupted downloads are resumed by the next run. Defaults to the
+                       MOONSENSE_DOWNLOAD_ENGINE environment variable or "process".
+        :param sync: If set to True, sessions already downloaded are brought up to date by
+                     appending only the chunks persisted since they were written. Sessions
+                     downloaded for the first time are written chunk by chunk. Can't be
+                     combined with incremental. Default: False.
         """
         DownloadAllSessions(self).download(
-            output, until, since, skip_days, incremental, labels, platforms, with_journey_id)
+            output, until, since, skip_days, incremental, labels, platforms, with_journey_id, engine, sync)
 
 
-    def read_session(self, session_id) -> Iterable[SealedBundle]:
+    def read_session(self, session_id: Union[str, Session], lazy: bool = False,
+                     fields: Iterable[str] = None) -> Iterable[SealedBundle]:
         """
         Read all data points from a session that were sent so far.
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
+        :param lazy: If set to True, 'LazySealedBundle' views are returned that only decode
+                     the repeated sensor and event fields of a bundle when they are accessed.
+        :param fields: Optional - The repeated bundle fields to decode, e.g. ["accelerometer_data",
+                       "pointer_data"]. Every other sensor and event field is skipped. If 'None'
+                       is supplied, all fields are decoded.
         :return: a generator of dict entries
         """
+        projection = BundleProjection(fields) if fields is not None else None
+        session_id, region = self._resolve_session(session_id)
 
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            temp_output_file = os.path.join(tmpdirname, "temp-" + session_id + ".json")
-            self.download_session(session_id, temp_output_file)
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/bundles"
+        # the archive is decompressed, unpacked and split into lines in a single pass
+        # while it downloads, bundles are returned as soon as their line is complete.
+        with self._request("GET", endpoint, stream=True) as http_response:
+            if http_response.status_code != 200:
+                raise RuntimeError(
+                    f"unable to read: {session_id}. status code: {http_response.status_code}")
 
-            with open(temp_output_file, "r") as temp_file:
-                for line in temp_file.readlines():
-                    yield json_format.Parse(line, SealedBundle(), ignore_unknown_fields=True)
+            lines = split_lines(self._iter_archive_member(self._iter_content(http_response)))
+            if self._decode_pool is not None and not lazy:
+                yield from self._decode_pool.decode(lines, fields)
+                return
+            for line in lines:
+                yield self._decode_bundle(line, lazy, projection)
 
 
-    def list_cards(self, session_id) -> List[Card]:
+    def read_session_fields(
+        self,
+        session_id: Union[str, Session],
+        fields: Iterable[str],
+        since_cursor: int = 0,
+        prefetch: bool = True) -> Iterable[PaginatedFieldsResponse]:
+        """
+        Read selected bundle fields of a session page by page, following the bundle cursor.
+
+        :param session_id: The ID of the session or a 'Session' object
+        :param fields: The repeated bundle fields to read, e.g. ["accelerometer_data"]
+        :param since_cursor: The bundle cursor to resume from, i.e. the 'from_bundle_cursor' of the
+                             last page that was consumed. Defaults to 0 - the start of the session.
+        :param prefetch: If set to True, the next page is requested while the current one is
+                         consumed. Default: True.
+        :return: a generator of 'PaginatedFieldsResponse' pages. The 'bundle' of a page holds the
+                 requested fields and its 'from_bundle_cursor' the cursor to resume after it.
+        """
+        fields = sorted(BundleProjection(fields).fields)
+        if len(fields) == 0:
+            raise ValueError("at least one field is required")
+        session_id, region = self._resolve_session(session_id)
+        endpoint = self._build_url(region) + f"/v2/sessions/{session_id}/fields"
+
+        def fetch_page(cursor: int) -> PaginatedFieldsResponse:
+            params = [("fields", field) for field in fields] + [("from_bundle_cursor", cursor)]
+            http_response = self._request("GET", endpoint, params=params, headers=self._accept_headers())
+            if http_response.status_code != 200:
+                raise RuntimeError(
+                    f"unable to read session fields. status code: {http_response.status_code}")
+            return self._parse(http_response, PaginatedFieldsResponse())
+
+        # the cursor of a page is only known once the previous page arrived, so at most
+        # one page is requested ahead.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            cursor = since_cursor
+            pending = None
+            try:
+                response = fetch_page(cursor)
+                while True:
+                    # the last page does not advance the cursor
+                    has_next_page = response.from_bundle_cursor > cursor
+                    if has_next_page and prefetch:
+                        pending = executor.submit(fetch_page, response.from_bundle_cursor)
+                    if response.bundle.ByteSize() > 0:
+                        yield response
+                    if not has_next_page:
+                        return
+
+                    cursor = response.from_bundle_cursor
+                    if pending is not None:
+                        response, pending = pending.result(), None
+                    else:
+                        response = fetch_page(cursor)
+            finally:
+                if pending is not None:
+                    pending.cancel()
+
+    def list_cards(self, session_id: Union[str, Session]) -> List[Card]:
         """
         List all the cards associated with a session
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
         :return: list of cards
         """
-        session = self.describe_session(session_id)
-        region = session.region_id if self._default_region != "" else ""
+        session_id, region = self._resolve_session(session_id)
+        region = region if self._default_region != "" else ""
 
         endpoint = self._build_url(
             region) + "/v2/cards?session_id=" + session_id
-        http_response = requests.get(endpoint, **self._headers)
+        http_response = self._request("GET", endpoint, headers=self._accept_headers())
 
-        response = json_format.Parse(
-            http_response.text, CardListResponse(), ignore_unknown_fields=True)
+        response = self._parse(http_response, CardListResponse())
         return response.cards
 
-    def create_card(self, session_id, title, description, source_type="API") -> None:
+    def create_card(self, session_id: Union[str, Session], title, description, source_type="API") -> None:
         """
         Create a new card associated with this session ID
 
-        :param session_id: The ID of the session
+        :param session_id: The ID of the session or a 'Session' object
         :return: none
         """
-        session = self.describe_session(session_id)
-        region = session.region_id if self._default_region != "" else ""
+        session_id, region = self._resolve_session(session_id)
+        region = region if self._default_region != "" else ""
         endpoint = self._build_url(region) + "/v2/cards"
 
-        http_response = requests.post(
+        http_response = self._request(
+            "POST",
             endpoint,
             json={
-                "session_id": session.session_id,
+                "session_id": session_id,
                 "title": title,
                 "description": description,
                 "source_type": source_type,
             },
-            **self._headers,
         )
 
         if http_response.status_code != 200:
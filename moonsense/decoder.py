@@ -0,0 +1,349 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API - JSON to protobuf message decoders
+
+The client decodes every API response and every bundle line through a 'JsonDecoder'.
+'ProtobufJsonDecoder' is the reference implementation built on json_format. The
+'FastJsonDecoder' produces the same messages but pairs a fast JSON tokenizer (orjson
+when installed) with per message type decoders compiled once from the descriptors.
+"""
+
+import base64
+import json
+import threading
+
+from google.protobuf import json_format
+from google.protobuf.descriptor import FieldDescriptor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_INT_TYPES = frozenset([
+    FieldDescriptor.TYPE_INT32, FieldDescriptor.TYPE_INT64,
+    FieldDescriptor.TYPE_UINT32, FieldDescriptor.TYPE_UINT64,
+    FieldDescriptor.TYPE_SINT32, FieldDescriptor.TYPE_SINT64,
+    FieldDescriptor.TYPE_FIXED32, FieldDescriptor.TYPE_FIXED64,
+    FieldDescriptor.TYPE_SFIXED32, FieldDescriptor.TYPE_SFIXED64,
+])
+_FLOAT_TYPES = frozenset([FieldDescriptor.TYPE_DOUBLE, FieldDescriptor.TYPE_FLOAT])
+
+# well known types with a string JSON representation that can be parsed directly.
+# every other well known type is handed to json_format.
+_WKT_FROM_STRING = frozenset([
+    "google.protobuf.Timestamp", "google.protobuf.Duration", "google.protobuf.FieldMask",
+])
+_WKT_PREFIX = "google.protobuf."
+
+# JSON values of these types are stored without conversion
+_NATIVE_TYPES = {
+    FieldDescriptor.CPPTYPE_INT32: int,
+    FieldDescriptor.CPPTYPE_INT64: int,
+    FieldDescriptor.CPPTYPE_UINT32: int,
+    FieldDescriptor.CPPTYPE_UINT64: int,
+    FieldDescriptor.CPPTYPE_DOUBLE: float,
+    FieldDescriptor.CPPTYPE_FLOAT: float,
+    FieldDescriptor.CPPTYPE_BOOL: bool,
+    FieldDescriptor.CPPTYPE_STRING: str,
+}
+
+
+class JsonDecoder(object):
+    """ Decodes JSON documents into protobuf messages """
+
+    def decode(self, data, message):
+        """
+        Decode a JSON document into a message
+
+        :param data: The JSON document as str or bytes
+        :param message: The message to merge the document into
+        :return: the message
+        """
+        raise NotImplementedError()
+
+    def loads(self, data):
+        """
+        Tokenize a JSON document without decoding it into a message
+
+        :param data: The JSON document as str or bytes
+        :return: the document as plain python values
+        """
+        return json.loads(data)
+
+    def decode_value(self, value, message):
+        """
+        Decode a document returned by 'loads' into a message
+
+        :param value: The document as plain python values
+        :param message: The message to merge the document into
+        :return: the message
+        """
+        return self.decode(json.dumps(value), message)
+
+
+class ProtobufJsonDecoder(JsonDecoder):
+    """ Reference decoder built on google.protobuf.json_format """
+
+    def decode(self, data, message):
+        return json_format.Parse(data, message, ignore_unknown_fields=True)
+
+    def decode_value(self, value, message):
+        return json_format.ParseDict(value, message, ignore_unknown_fields=True)
+
+
+def _field_error(name, error) -> json_format.ParseError:
+    # conversion errors are reported like json_format does, as a ParseError
+    return json_format.ParseError(f"Failed to parse {name} field: {error}.")
+
+
+def _to_int(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, float) and not value.is_integer():
+        raise json_format.ParseError(f"Couldn't parse integer: {value}")
+    if isinstance(value, str) and " " in value:
+        raise json_format.ParseError(f"Couldn't parse integer: \"{value}\"")
+    if isinstance(value, bool):
+        raise json_format.ParseError(f"Couldn't parse integer: {value}")
+    return int(value)
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise json_format.ParseError(f"Couldn't parse float: {value}")
+    return float(value)
+
+
+def _to_bool(value):
+    if not isinstance(value, bool):
+        raise json_format.ParseError(f"Expected true or false without quotes: {value}")
+    return value
+
+
+def _to_str(value):
+    if not isinstance(value, str):
+        raise json_format.ParseError(f"Expected string: {value}")
+    return value
+
+
+def _to_bytes(value):
+    encoded = value.encode("utf-8")
+    return base64.urlsafe_b64decode(encoded + b"=" * (4 - len(encoded) % 4))
+
+
+def _scalar_converter(field):
+    if field.type in _INT_TYPES:
+        return _to_int
+    if field.type in _FLOAT_TYPES:
+        return _to_float
+    if field.type == FieldDescriptor.TYPE_BOOL:
+        return _to_bool
+    if field.type == FieldDescriptor.TYPE_STRING:
+        return _to_str
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return _to_bytes
+
+    enum_type = field.enum_type
+
+    def to_enum(value):
+        enum_value = enum_type.values_by_name.get(value)
+        if enum_value is not None:
+            return enum_value.number
+        try:
+            # proto3 enums are open, unknown numbers are kept
+            return int(value)
+        except (TypeError, ValueError):
+            raise json_format.ParseError(f"Invalid enum value {value} for enum type {enum_type.full_name}")
+
+    return to_enum
+
+
+def _map_key_converter(field):
+    if field.type == FieldDescriptor.TYPE_BOOL:
+        def to_bool_key(key):
+            if key not in ("true", "false"):
+                raise json_format.ParseError(f"Expected \"true\" or \"false\", not {key}")
+            return key == "true"
+        return to_bool_key
+    if field.type in _INT_TYPES:
+        return int
+    return _to_str
+
+
+class FastJsonDecoder(JsonDecoder):
+    """ Descriptor driven decoder producing the same messages as 'ProtobufJsonDecoder' """
+
+    def __init__(self) -> None:
+        self._loads = orjson.loads if orjson is not None else json.loads
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def decode(self, data, message):
+        value = self._loads(data)
+        self._decode_into(message, value)
+        return message
+
+    def loads(self, data):
+        return self._loads(data)
+
+    def decode_value(self, value, message):
+        self._decode_into(message, value)
+        return message
+
+    def _decode_into(self, message, value) -> None:
+        if not isinstance(value, dict):
+            raise json_format.ParseError(
+                f"Expected JSON object for {message.DESCRIPTOR.full_name}, got: {type(value).__name__}")
+
+        handlers = self._handlers(message.DESCRIPTOR)
+        for key, item in value.items():
+            handler = handlers.get(key)
+            # unknown keys are ignored and null resets a field to its default
+            if handler is not None and item is not None:
+                try:
+                    handler(message, item)
+                except (ValueError, TypeError) as e:
+                    raise _field_error(key, e) from e
+
+    def _handlers(self, descriptor) -> dict:
+        handlers = self._compiled.get(descriptor)
+        if handlers is None:
+            handlers = self._compile(descriptor)
+        return handlers
+
+    def _compile(self, descriptor) -> dict:
+        # Handlers only reference other message types through _decode_into, so a type
+        # is compiled without recursing and published once complete.
+        with self._lock:
+            handlers = self._compiled.get(descriptor)
+            if handlers is not None:
+                return handlers
+
+            handlers = {}
+            for field in descriptor.fields:
+                handler = self._field_handler(field)
+                handlers[field.name] = handler
+                handlers[field.json_name] = handler
+
+            self._compiled[descriptor] = handlers
+            return handlers
+
+    def _field_handler(self, field):
+        name = field.name
+        decode_into = self._decode_into
+        message_type = field.message_type
+
+        if message_type is not None and message_type.GetOptions().map_entry:
+            return self._map_handler(field)
+
+        if message_type is not None and message_type.full_name.startswith(_WKT_PREFIX):
+            from_string = message_type.full_name in _WKT_FROM_STRING
+
+            def decode_wkt(target, value):
+                if from_string:
+                    target.FromJsonString(value)
+                else:
+                    json_format.ParseDict(value, target, ignore_unknown_fields=True)
+
+            if field.label == FieldDescriptor.LABEL_REPEATED:
+                def set_repeated_wkt(message, value):
+                    add = getattr(message, name).add
+                    for item in value:
+                        decode_wkt(add(), item)
+                return set_repeated_wkt
+
+            def set_wkt(message, value):
+                target = getattr(message, name)
+                target.SetInParent()
+                decode_wkt(target, value)
+            return set_wkt
+
+        if message_type is not None:
+            if field.label == FieldDescriptor.LABEL_REPEATED:
+                item_handlers = []
+
+                # repeated sensor samples dominate bundles, so the per item loop of
+                # _decode_into is inlined here with the item handlers resolved once.
+                def set_repeated_message(message, value):
+                    if not item_handlers:
+                        item_handlers.append(self._handlers(message_type))
+                    handlers = item_handlers[0]
+                    add = getattr(message, name).add
+                    for item in value:
+                        if type(item) is not dict:
+                            decode_into(add(), item)
+                            continue
+                        target = add()
+                        for key, item_value in item.items():
+                            handler = handlers.get(key)
+                            if handler is not None and item_value is not None:
+                                try:
+                                    handler(target, item_value)
+                                except (ValueError, TypeError) as e:
+                                    raise _field_error(key, e) from e
+                return set_repeated_message
+
+            def set_message(message, value):
+                target = getattr(message, name)
+                target.SetInParent()
+                decode_into(target, value)
+            return set_message
+
+        convert = _scalar_converter(field)
+
+        if field.label == FieldDescriptor.LABEL_REPEATED:
+            def set_repeated_scalar(message, value):
+                if None in value:
+                    raise json_format.ParseError(f"null is not allowed to be used as an element in {name}")
+                getattr(message, name).extend([convert(item) for item in value])
+            return set_repeated_scalar
+
+        native_type = None if field.type == FieldDescriptor.TYPE_BYTES else _NATIVE_TYPES.get(field.cpp_type)
+
+        def set_scalar(message, value):
+            setattr(message, name, value if type(value) is native_type else convert(value))
+        return set_scalar
+
+    def _map_handler(self, field):
+        name = field.name
+        decode_into = self._decode_into
+        key_field = field.message_type.fields_by_name["key"]
+        value_field = field.message_type.fields_by_name["value"]
+        convert_key = _map_key_converter(key_field)
+
+        if value_field.message_type is not None and value_field.message_type.full_name.startswith(_WKT_PREFIX):
+            def set_wkt_map(message, value):
+                target = getattr(message, name)
+                for key, item in value.items():
+                    json_format.ParseDict(item, target[convert_key(key)], ignore_unknown_fields=True)
+            return set_wkt_map
+
+        if value_field.message_type is not None:
+            def set_message_map(message, value):
+                target = getattr(message, name)
+                for key, item in value.items():
+                    decode_into(target[convert_key(key)], item)
+            return set_message_map
+
+        convert_value = _scalar_converter(value_field)
+
+        def set_scalar_map(message, value):
+            target = getattr(message, name)
+            for key, item in value.items():
+                target[convert_key(key)] = convert_value(item)
+        return set_scalar_map
@@ -18,18 +18,26 @@ limitations under the License.
 
 
 import os
+import hashlib
+import shutil
 import signal
 import json
+import tempfile
+import threading
 from time import time, sleep
 from functools import partial
 
 from datetime import date, datetime, timedelta
 from multiprocessing import Process, JoinableQueue, Event
-from queue import Empty
+from queue import Empty, Queue
+from typing import Union
 
 from google.protobuf.json_format import MessageToJson
 from retry import retry
 
+from .models import Chunk, Session
+from .manifest import DownloadManifest, MANIFEST_FILENAME, STATUS_COMPLETE
+from .util import create_temp_file
 from . import Platform
 
 MISSING_JOURNEY_ID = "missing-journey-id"
@@ -37,6 +45,21 @@ GRACE_PERIOD = 2
 KILL_PERIOD = 30
 
 MAX_TIMESTAMP_FILENAME = "max_timestamp"
+STAGING_DIRNAME = ".staging"
+
+DOWNLOAD_ENGINES = ("process", "thread")
+DEFAULT_THREAD_PARALLELISM = 64
+
+# serializes updates of max_timestamp files by the download threads of a process
+_max_timestamp_lock = threading.Lock()
+
+
+def _file_md5(path: str) -> str:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for buffer in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(buffer)
+    return digest.hexdigest()
 
 
 class DownloadAllSessions(object):
@@ -46,55 +69,175 @@ class DownloadAllSessions(object):
         self.moonsense_client = moonsense_client
         self.queue = JoinableQueue(maxsize=25)
         self.stop_event = Event()
+        self.manifest = None
+        self.sync = False
 
     @retry(Exception, tries=3, delay=0)
     def download_data_into_folder(
         self,
         datadir: str,
         with_journey_id: bool,
-        session_id: str) -> None:
-
-        session = None
-        try:
-            session = self.moonsense_client.describe_session(session_id)
-        except Exception as e:
-            print("Error encountered while describing session", e)
-            raise e
+        session: Union[str, Session]) -> None:
 
-
-        journey_id = session.journey_id
-        if journey_id is None or len(journey_id) == 0:
-            journey_id = MISSING_JOURNEY_ID
+        # listed sessions are passed through as is, only bare ids are described
+        if not isinstance(session, Session):
+            try:
+                session = self.moonsense_client.describe_session(session)
+            except Exception as e:
+                print("Error encountered while describing session", e)
+                raise e
+        session_id = session.session_id
 
         session_as_json = MessageToJson(session)
 
         created_at = datetime.fromtimestamp(session.created_at.seconds).date()
         formatted_created_at = created_at.strftime("%Y-%m-%d")
 
+        session_dir_path = self._session_dir_path(datadir, session, with_journey_id)
+
+        if self.sync and self._sync_session_folder(session, session_dir_path):
+            return
+
         print("Downloading session", session_id, "created at", formatted_created_at)
 
-        session_dir_path = os.path.join(datadir, formatted_created_at, session.session_id)
-        if with_journey_id:
-            session_dir_path = os.path.join(datadir,
-                created_at.strftime("%Y-%m-%d"),
-                journey_id,
-                session.session_id)
+        # files are written to a staging folder that survives failed attempts, so
+        # interrupted archives are resumed, and the folder is renamed into place once
+        # every file is complete.
+        staging_dir_path = os.path.join(datadir, STAGING_DIRNAME, session_id)
+        os.makedirs(staging_dir_path, exist_ok=True)
 
-        metadata_path = os.path.join(session_dir_path, "metadata.json")
+        metadata_path = os.path.join(staging_dir_path, "metadata.json")
         with open(metadata_path, "w") as metadata_file:
             metadata_file.write(session_as_json)
 
-        raw_sealed_bundles_path = os.path.join(session_dir_path, "raw_sealed_bundles.json")
-        pcap_path = os.path.join(session_dir_path, "packets.pcap")
+        raw_sealed_bundles_path = os.path.join(staging_dir_path, "raw_sealed_bundles.json")
+        pcap_path = os.path.join(staging_dir_path, "packets.pcap")
 
+        chunks = []
         try:
-            self.moonsense_client.download_session(session_id, raw_sealed_bundles_path)
+            if self.sync:
+                # the bundle file is written chunk by chunk so later syncs can append to it
+                with open(raw_sealed_bundles_path, "wb") as f:
+                    for chunk in self._list_chunks(session):
+                        self._write_chunk(session, chunk, f)
+                        chunks.append((chunk.chunk_id, chunk.md5, f.tell()))
+            else:
+                self.moonsense_client.download_session(session, raw_sealed_bundles_path)
+            written = [metadata_path, raw_sealed_bundles_path]
             if 'packet' in session.counters:
-                self.moonsense_client.download_pcap_data(session_id, pcap_path)
+                self.moonsense_client.download_pcap_data(session, pcap_path)
+                written.append(pcap_path)
         except Exception as e:
             print("Error encountered while downloading session", e)
+            if self.manifest is not None:
+                self.manifest.fail(session_id, str(e))
             raise e
 
+        size = sum(os.path.getsize(path) for path in written)
+        checksums = {os.path.basename(path): _file_md5(path) for path in written}
+
+        if self.manifest is not None:
+            # chunks recorded for an earlier copy don't describe the new one
+            self.manifest.replace_chunks(session_id, [])
+        self._commit_session_dir(datadir, staging_dir_path, session_dir_path)
+
+        if self.manifest is not None:
+            self.manifest.replace_chunks(session_id, chunks)
+            self.manifest.complete(session_id, size, checksums)
+        self._advance_max_timestamp_file(datadir, formatted_created_at, session.created_at.seconds)
+
+    def _sync_session_folder(self, session: Session, session_dir_path: str) -> bool:
+        # Appends the chunks persisted since the bundle file of a downloaded session was
+        # written. Returns False if the file can't be brought up to date that way: it was
+        # not written chunk by chunk or a chunk it holds changed since.
+        session_id = session.session_id
+        status = self.manifest.status(session_id)
+        if status is None or status["status"] != STATUS_COMPLETE:
+            return False
+        recorded = self.manifest.chunks(session_id)
+        if len(recorded) == 0:
+            return False
+
+        raw_sealed_bundles_path = os.path.join(session_dir_path, "raw_sealed_bundles.json")
+        committed_size = max(end_offset for _, end_offset in recorded.values())
+        try:
+            if os.path.getsize(raw_sealed_bundles_path) < committed_size:
+                return False
+        except OSError:
+            return False
+
+        listed = self._list_chunks(session)
+        listed_md5 = {chunk.chunk_id: chunk.md5 for chunk in listed}
+        if any(listed_md5.get(chunk_id) != md5 for chunk_id, (md5, _) in recorded.items()):
+            return False
+
+        new_chunks = [chunk for chunk in listed if chunk.chunk_id not in recorded]
+        print("Syncing session", session_id, "with", len(new_chunks), "new chunks")
+        if len(new_chunks) == 0:
+            return True
+
+        with open(raw_sealed_bundles_path, "r+b") as f:
+            # drops whatever an interrupted sync appended after the last recorded chunk
+            f.truncate(committed_size)
+            f.seek(committed_size)
+            for chunk in new_chunks:
+                self._write_chunk(session, chunk, f)
+                f.flush()
+                os.fsync(f.fileno())
+                self.manifest.add_chunk(session_id, chunk.chunk_id, chunk.md5, f.tell())
+
+        metadata_path = os.path.join(session_dir_path, "metadata.json")
+        fd, temp_metadata_path = create_temp_file(session_dir_path, prefix=".metadata.json.")
+        with os.fdopen(fd, "w") as metadata_file:
+            metadata_file.write(MessageToJson(session))
+        os.replace(temp_metadata_path, metadata_path)
+
+        written = [metadata_path, raw_sealed_bundles_path]
+        if 'packet' in session.counters:
+            # packet captures are consolidated by the server and fetched again as a whole
+            pcap_path = os.path.join(session_dir_path, "packets.pcap")
+            self.moonsense_client.download_pcap_data(session, pcap_path)
+            written.append(pcap_path)
+
+        self.manifest.complete(
+            session_id,
+            sum(os.path.getsize(path) for path in written),
+            {os.path.basename(path): _file_md5(path) for path in written})
+        return True
+
+    def _list_chunks(self, session: Session) -> list[Chunk]:
+        return sorted(
+            self.moonsense_client.list_chunks(session),
+            key=lambda chunk: (chunk.created_at.seconds, chunk.created_at.nanos))
+
+    def _write_chunk(self, session: Session, chunk: Chunk, f) -> None:
+        # one JSON document per line, as sent by the server like the consolidated archive
+        for line in self.moonsense_client._read_chunk_lines(session, chunk.chunk_id):
+            f.write(line)
+            f.write(b"\n")
+
+    @staticmethod
+    def _commit_session_dir(datadir: str, staging_dir_path: str, session_dir_path: str) -> None:
+        os.makedirs(os.path.dirname(session_dir_path), exist_ok=True)
+        replaced_dir_path = None
+        if os.path.isdir(session_dir_path):
+            # a session downloaded again replaces the earlier copy
+            replaced_dir_path = tempfile.mkdtemp(dir=os.path.join(datadir, STAGING_DIRNAME), prefix=".replaced-")
+            os.replace(session_dir_path, os.path.join(replaced_dir_path, "session"))
+        os.replace(staging_dir_path, session_dir_path)
+        if replaced_dir_path is not None:
+            shutil.rmtree(replaced_dir_path, ignore_errors=True)
+
+    @staticmethod
+    def _session_dir_path(datadir: str, session: Session, with_journey_id: bool) -> str:
+        created_at_str = datetime.fromtimestamp(session.created_at.seconds).date().strftime("%Y-%m-%d")
+        if with_journey_id:
+            journey_id = session.journey_id
+            if journey_id is None or len(journey_id) == 0:
+                journey_id = MISSING_JOURNEY_ID
+            return os.path.join(datadir, created_at_str, journey_id, session.session_id)
+        return os.path.join(datadir, created_at_str, session.session_id)
+
     def download_session(self, queue, stop_event, datadir, with_journey_id):
         signal.signal(signal.SIGINT, signal.SIG_IGN)
 
@@ -113,8 +256,8 @@ class DownloadAllSessions(object):
                 continue
 
             try:
-                session_id = msg
-                self.download_data_into_folder(datadir, with_journey_id, session_id)
+                session = Session.FromString(msg)
+                self.download_data_into_folder(datadir, with_journey_id, session)
             finally:
                 queue.task_done()
 
@@ -162,10 +305,22 @@ class DownloadAllSessions(object):
         return max_timestamp
 
 
-    def _write_max_timestamp_file(self, datadir: str, created_at_str: str, max_timestamp: int):
+    def _advance_max_timestamp_file(self, datadir: str, created_at_str: str, created_at: int):
+        # only ever raised, by sessions that are committed. Worker processes may still
+        # race, which can only leave a lower value behind and makes the next run list more.
         max_timestamp_file_path = os.path.join(datadir, created_at_str, MAX_TIMESTAMP_FILENAME)
-        with open(max_timestamp_file_path, "w") as f:
-            f.write(str(max_timestamp))
+        with _max_timestamp_lock:
+            try:
+                with open(max_timestamp_file_path, "r") as f:
+                    if int(f.read()) >= created_at:
+                        return
+            except (OSError, ValueError):
+                pass
+
+            fd, temp_file_path = create_temp_file(os.path.join(datadir, created_at_str), prefix=".max_timestamp.")
+            with os.fdopen(fd, "w") as f:
+                f.write(str(created_at))
+            os.replace(temp_file_path, max_timestamp_file_path)
 
 
     def download(
@@ -177,7 +332,9 @@ class DownloadAllSessions(object):
         incremental: bool,
         labels: list[str],
         platforms: list[Platform],
-        with_journey_id: bool = False) -> None:
+        with_journey_id: bool = False,
+        engine: str = None,
+        sync: bool = False) -> None:
         """
         Download all sessions from a project based on the provided filters.
 
@@ -195,7 +352,17 @@ class DownloadAllSessions(object):
                          web, ios, android or None for all.
         :param with_journey_id: If set to True, organizes the downloaded sessions by date and
                             journey id. Default: False.
+        :param engine: Either "process" to download in a pool of processes or "thread" to keep
+                       all downloads in flight in this process. Defaults to the
+                       MOONSENSE_DOWNLOAD_ENGINE environment variable or "process".
+        :param sync: If set to True, sessions already downloaded are brought up to date by
+                     appending the chunks persisted since, and sessions downloaded for the
+                     first time are written chunk by chunk. Can't be combined with incremental.
         """
+        if sync and incremental:
+            raise ValueError("sync and incremental can't be combined")
+        self.sync = sync
+
         localdir = os.getcwd()
         datadir = os.path.join(localdir, "data")
         # if output is present, check if it's absolute or relative
@@ -215,13 +382,41 @@ class DownloadAllSessions(object):
         if not os.path.isdir(datadir):
             os.makedirs(datadir, exist_ok=True)
 
-        # MOONSENSE_DOWNLOAD_PARALLELISM is the number of parallel processes to use
-        # if not set, use the number of cores * 2    
-        number_of_processes = int(os.environ.get("MOONSENSE_DOWNLOAD_PARALLELISM", os.cpu_count() * 2))
+        # MOONSENSE_DOWNLOAD_ENGINE is either "process" to download with a pool of processes
+        # or "thread" to download with a pool of threads in this process
+        # if not set, processes are used
+        if engine is None:
+            engine = os.environ.get("MOONSENSE_DOWNLOAD_ENGINE", "process")
+        if engine not in DOWNLOAD_ENGINES:
+            raise ValueError(f"engine must be one of {DOWNLOAD_ENGINES}, got: {engine}")
+
+        # MOONSENSE_DOWNLOAD_PARALLELISM is the number of parallel downloads
+        # if not set, use the number of cores * 2 processes or 64 threads
+        default_parallelism = os.cpu_count() * 2 if engine == "process" else DEFAULT_THREAD_PARALLELISM
+        parallelism = int(os.environ.get("MOONSENSE_DOWNLOAD_PARALLELISM", default_parallelism))
+
+        # MOONSENSE_LIST_SHARDS is the number of time windows listed concurrently
+        # if not set, sessions are listed sequentially
+        list_shards = int(os.environ.get("MOONSENSE_LIST_SHARDS", 1))
+
+        self.manifest = DownloadManifest(os.path.join(datadir, MANIFEST_FILENAME))
 
         max_timestamp = None
+        retried = []
+        windows = []
         if incremental:
-            max_timestamp = self.get_max_timestamp(datadir, with_journey_id)
+            # sessions that were listed by an earlier run but not downloaded completely
+            # and the time ranges an interrupted run did not finish listing
+            retried = self.manifest.unfinished()
+            windows = [(window_id, datetime.fromtimestamp(window_since), datetime.fromtimestamp(window_until))
+                       for window_id, window_since, window_until in self.manifest.windows()]
+            max_timestamp = self.manifest.watermark()
+            if max_timestamp is None:
+                # manifests written before listing progress was recorded
+                max_timestamp = self.manifest.max_created_at()
+            if max_timestamp is None:
+                # output directories written before the manifest existed
+                max_timestamp = self.get_max_timestamp(datadir, with_journey_id)
             if max_timestamp is not None:
                 max_timestamp = datetime.fromtimestamp(int(max_timestamp))
                 # if we have a max_timestamp, we need to add 1 second to it
@@ -229,34 +424,52 @@ class DownloadAllSessions(object):
                 max_timestamp = max_timestamp + timedelta(seconds=1)
                 since = max_timestamp
 
-        if since > until:
+        if since <= until:
+            window_id = self.manifest.open_window(int(since.timestamp()), int(until.timestamp()))
+            windows.insert(0, (window_id, since, until))
+        elif len(retried) == 0 and len(windows) == 0:
             raise ValueError("Since value larger than until value")
 
-        all_procs = []
-        for process_count in range(number_of_processes):
-            local_process = Process(target=self.download_session,
-                daemon=True,
-                args=((self.queue, self.stop_event, datadir, with_journey_id)))
-            all_procs.append(local_process)
-            local_process.start()
+        sessions = self._sessions_to_download(
+            windows, skip_days, labels, platforms, list_shards, retried, skip_listed=incremental)
 
-        session_counter = 0
+        try:
+            if engine == "thread":
+                self._download_with_threads(sessions, datadir, with_journey_id, parallelism)
+            else:
+                self._download_with_processes(sessions, datadir, with_journey_id, parallelism)
+        finally:
+            self.manifest.close()
+
+    def _sessions_to_download(
+        self,
+        windows: list[tuple],
+        skip_days: list[date],
+        labels: list[str],
+        platforms: list[Platform],
+        list_shards: int,
+        retried: list[Session],
+        skip_listed: bool):
+        # lists the sessions of every (window_id, since, until) window newest first, after
+        # the sessions left unfinished by an earlier run. A window is narrowed in the
+        # manifest as it is listed and closed once listed completely.
         filter_by_labels = labels if len(labels) > 0 else None
 
-        max_timestamp_per_day = {}
+        if len(retried) > 0:
+            print("Retrying {} unfinished sessions".format(len(retried)))
+        yield from retried
+        retried_ids = set(session.session_id for session in retried)
 
-        print("Downloading sessions from {} to {}".format(since, until))
+        for window_id, since, until in windows:
+            print("Downloading sessions from {} to {}".format(since, until))
 
-        try:
             # listing is in reverse chronological order - newest are first.
             for session in self.moonsense_client.list_sessions(filter_by_labels, platforms=platforms, since=since,
-                                                               until=until):
-                journey_id = session.journey_id
-                if journey_id is None or len(journey_id) == 0:
-                    journey_id = MISSING_JOURNEY_ID
+                                                               until=until, shards=list_shards):
+                if session.session_id in retried_ids:
+                    continue
 
                 created_at_datetime = datetime.fromtimestamp(session.created_at.seconds)
-                created_at_timestamp = int(created_at_datetime.timestamp())
 
                 if skip_days is not None:
                     matched = False
@@ -275,28 +488,32 @@ class DownloadAllSessions(object):
                 if created_at_datetime < since:
                     break
 
-                created_at_str = created_at_datetime.date().strftime("%Y-%m-%d")
+                # sessions listed before an interruption are either complete or retried
+                if skip_listed and self.manifest.status(session.session_id) is not None:
+                    self.manifest.narrow_window(window_id, session.created_at.seconds)
+                    continue
 
-                session_dir_path = os.path.join(datadir, created_at_str, session.session_id)
-                if with_journey_id:
-                    session_dir_path = os.path.join(datadir,
-                        created_at_str,
-                        journey_id,
-                        session.session_id)
-
-                if not os.path.isdir(session_dir_path):
-                    os.makedirs(session_dir_path)
-
-                if created_at_str in max_timestamp_per_day:
-                    if created_at_timestamp > max_timestamp_per_day[created_at_str]:
-                        max_timestamp_per_day[created_at_str] = created_at_timestamp
-                        self._write_max_timestamp_file(datadir, created_at_str, created_at_timestamp)
-                else:
-                    max_timestamp_per_day[created_at_str] = created_at_timestamp
-                    self._write_max_timestamp_file(datadir, created_at_str, created_at_timestamp)
+                self.manifest.add(session)
+                self.manifest.narrow_window(window_id, session.created_at.seconds)
+                yield session
 
-                session_counter += 1
-                self.queue.put(session.session_id)
+            # downloads of the window may still be in flight, they are retried from the
+            # manifest if they don't complete
+            self.manifest.close_window(window_id)
+
+    def _download_with_processes(self, sessions, datadir: str, with_journey_id: bool, number_of_processes: int):
+        all_procs = []
+        for process_count in range(number_of_processes):
+            local_process = Process(target=self.download_session,
+                daemon=True,
+                args=((self.queue, self.stop_event, datadir, with_journey_id)))
+            all_procs.append(local_process)
+            local_process.start()
+
+        try:
+            for session in sessions:
+                # sessions cross the process boundary in their compact binary form
+                self.queue.put(session.SerializeToString())
 
             for local_process in all_procs:
                 self.queue.put(None)
@@ -313,3 +530,57 @@ class DownloadAllSessions(object):
                     for p in alive_procs:
                         p.kill()
                 sleep(.01)
+
+    def _download_with_threads(self, sessions, datadir: str, with_journey_id: bool, number_of_threads: int):
+        # Downloads wait on the network almost all of the time, so a single process keeps
+        # many of them in flight over the pooled connections of the client. At most twice
+        # as many sessions as threads are queued, which bounds the memory used while
+        # listing runs ahead. gzip decompression releases the GIL and runs in parallel
+        # on the download threads.
+        #
+        # The threads are daemons so that Ctrl-C exits right away instead of waiting for
+        # every download in flight. An abandoned download is left in its staging folder
+        # and resumed by the next run.
+        self.moonsense_client._grow_pool(number_of_threads)
+
+        work = Queue(maxsize=2 * number_of_threads)
+        failures = []
+
+        def download_sessions():
+            while True:
+                session = work.get()
+                try:
+                    if session is None:
+                        return
+                    if not self.stop_event.is_set():
+                        self.download_data_into_folder(datadir, with_journey_id, session)
+                except Exception as e:
+                    # errors are already reported by download_data_into_folder
+                    failures.append(e)
+                finally:
+                    work.task_done()
+
+        threads = [threading.Thread(target=download_sessions, daemon=True) for _ in range(number_of_threads)]
+        for thread in threads:
+            thread.start()
+
+        def finish():
+            for _ in threads:
+                work.put(None)
+            for thread in threads:
+                thread.join()
+
+        try:
+            for session in sessions:
+                work.put(session)
+            finish()
+        except KeyboardInterrupt:
+            self.stop_event.set()
+            raise
+        except Exception:
+            # sessions already handed out are committed before a listing error is raised
+            finish()
+            raise
+
+        if len(failures) > 0:
+            print("Failed to download {} sessions".format(len(failures)))
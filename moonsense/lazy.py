@@ -0,0 +1,305 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API - Lazily decoded and projected bundles
+
+A 'LazySealedBundle' decodes the envelope of a sealed bundle (session id, server time,
+journey id, ...) and the scalar fields of its bundle (index, client time, battery, ...)
+up front. The repeated sensor and event arrays, which make up almost all of a bundle,
+are only decoded the first time they are accessed.
+
+A 'BundleProjection' drops the repeated arrays a caller does not read before they are
+decoded, so no messages are allocated for them.
+"""
+
+from typing import Iterable
+
+from google.protobuf.descriptor import FieldDescriptor
+
+from .models import SealedBundle
+from .models.bundle_v2_pb2 import Bundle
+from .util import split_fields, _read_varint
+
+_BUNDLE_FIELD = SealedBundle.DESCRIPTOR.fields_by_name["bundle"]
+
+_ENVELOPE_FIELDS = frozenset(
+    field.name for field in SealedBundle.DESCRIPTOR.fields if field is not _BUNDLE_FIELD)
+
+_DEFERRED_FIELDS = [
+    field for field in Bundle.DESCRIPTOR.fields if field.label == FieldDescriptor.LABEL_REPEATED]
+_DEFERRED_NUMBERS = frozenset(field.number for field in _DEFERRED_FIELDS)
+_DEFERRED_KEYS = frozenset(
+    [field.name for field in _DEFERRED_FIELDS] + [field.json_name for field in _DEFERRED_FIELDS])
+
+_EAGER_BUNDLE_FIELDS = frozenset(
+    field.name for field in Bundle.DESCRIPTOR.fields if field.label != FieldDescriptor.LABEL_REPEATED)
+
+
+def _payloads(records: bytes) -> bytes:
+    # concatenated payloads of serialized length-delimited fields, the way protobuf
+    # merges a message field that occurs more than once.
+    payloads = []
+    pos = 0
+    while pos < len(records):
+        _, pos = _read_varint(records, pos)
+        length, pos = _read_varint(records, pos)
+        payloads.append(records[pos:pos + length])
+        pos += length
+    return b"".join(payloads)
+
+
+class BundleProjection(object):
+    """ Selects the repeated 'Bundle' fields that are decoded, the scalar fields are always kept """
+
+    def __init__(self, fields: Iterable[str]) -> None:
+        """
+        Construct a new 'BundleProjection' object
+
+        :param fields: The names of the repeated 'Bundle' fields to decode,
+                       e.g. ["accelerometer_data", "pointer_data"]
+        """
+        if isinstance(fields, str):
+            fields = [fields]
+        selected = []
+        for name in fields:
+            field = Bundle.DESCRIPTOR.fields_by_name.get(name)
+            if field is None:
+                raise ValueError(f"unknown bundle field: {name}")
+            selected.append(field)
+
+        self.fields = frozenset(field.name for field in selected)
+        skipped = [field for field in _DEFERRED_FIELDS if field.name not in self.fields]
+        self._skipped_keys = frozenset(
+            [field.name for field in skipped] + [field.json_name for field in skipped])
+        self._skipped_numbers = frozenset(field.number for field in skipped)
+
+    def select_json(self, value):
+        """
+        Drop the skipped fields from a tokenized JSON bundle
+
+        :param value: The bundle as plain python values
+        :return: the bundle without the skipped fields
+        """
+        if not isinstance(value, dict):
+            return value
+        return {key: item for key, item in value.items() if key not in self._skipped_keys}
+
+    def select_protobuf(self, data: bytes) -> bytes:
+        """
+        Drop the skipped fields from a serialized bundle
+
+        :param data: The serialized 'Bundle'
+        :return: the serialized bundle without the skipped fields
+        """
+        return split_fields(data, self._skipped_numbers)[0]
+
+    def decode_json(self, data, decoder) -> SealedBundle:
+        """
+        Decode a sealed bundle from its JSON representation
+
+        :param data: The JSON document as str or bytes
+        :param decoder: The 'JsonDecoder' used to decode the document
+        :return: the sealed bundle with the selected repeated fields only
+        """
+        value = decoder.loads(data)
+        if isinstance(value, dict) and value.get(_BUNDLE_FIELD.name) is not None:
+            value[_BUNDLE_FIELD.name] = self.select_json(value[_BUNDLE_FIELD.name])
+        return decoder.decode_value(value, SealedBundle())
+
+    def decode_protobuf(self, data: bytes) -> SealedBundle:
+        """
+        Decode a sealed bundle from its binary protobuf representation
+
+        :param data: The serialized sealed bundle
+        :return: the sealed bundle with the selected repeated fields only
+        """
+        envelope_data, bundle_records = split_fields(data, (_BUNDLE_FIELD.number,))
+        sealed_bundle = SealedBundle.FromString(envelope_data)
+        if bundle_records:
+            sealed_bundle.bundle.SetInParent()
+            sealed_bundle.bundle.MergeFromString(self.select_protobuf(_payloads(bundle_records)))
+        return sealed_bundle
+
+
+class LazyBundle(object):
+    """ Read-only view of a 'Bundle' that decodes its repeated fields on first access """
+
+    __slots__ = ("_message", "_load")
+
+    def __init__(self, message: Bundle, load=None) -> None:
+        """
+        Construct a new 'LazyBundle' object
+
+        :param message: The bundle with its scalar fields decoded
+        :param load: Optional - Callable merging the deferred fields into the bundle
+        """
+        self._message = message
+        self._load = load
+
+    def materialize(self) -> Bundle:
+        """
+        Decode the deferred fields
+
+        :return: the fully decoded bundle
+        """
+        if self._load is not None:
+            load, self._load = self._load, None
+            load(self._message)
+        return self._message
+
+    @property
+    def is_materialized(self) -> bool:
+        return self._load is None
+
+    def __getattr__(self, name):
+        if name in _EAGER_BUNDLE_FIELDS:
+            return getattr(self._message, name)
+        return getattr(self.materialize(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyBundle):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __str__(self) -> str:
+        return str(self.materialize())
+
+    def __repr__(self) -> str:
+        return repr(self.materialize())
+
+
+class LazySealedBundle(object):
+    """
+    Read-only view of a 'SealedBundle' that can be used wherever the attributes of a
+    sealed bundle are read. Use 'materialize' to obtain a regular 'SealedBundle'.
+    """
+
+    __slots__ = ("_envelope", "_bundle", "_materialized")
+
+    def __init__(self, envelope: SealedBundle, bundle: LazyBundle = None) -> None:
+        """
+        Construct a new 'LazySealedBundle' object
+
+        :param envelope: The sealed bundle without its 'bundle' field
+        :param bundle: Optional - The lazily decoded bundle, 'None' if the sealed bundle has none
+        """
+        self._envelope = envelope
+        self._bundle = bundle
+        self._materialized = None
+
+    @classmethod
+    def from_json(cls, data, decoder, projection: BundleProjection = None) -> "LazySealedBundle":
+        """
+        Decode a sealed bundle from its JSON representation
+
+        :param data: The JSON document as str or bytes
+        :param decoder: The 'JsonDecoder' used to decode the document
+        :param projection: Optional - The repeated bundle fields to keep, all of them if 'None'
+        :return: the lazy sealed bundle
+        """
+        value = decoder.loads(data)
+        bundle_value = value.pop(_BUNDLE_FIELD.name, None) if isinstance(value, dict) else None
+        envelope = decoder.decode_value(value, SealedBundle())
+        if bundle_value is None:
+            return cls(envelope)
+
+        if not isinstance(bundle_value, dict):
+            # let the decoder report the invalid value
+            decoder.decode_value(bundle_value, Bundle())
+        if projection is not None:
+            bundle_value = projection.select_json(bundle_value)
+
+        eager = {}
+        deferred = {}
+        for key, item in bundle_value.items():
+            if key in _DEFERRED_KEYS:
+                deferred[key] = item
+            else:
+                eager[key] = item
+
+        message = decoder.decode_value(eager, Bundle())
+        if not deferred:
+            return cls(envelope, LazyBundle(message))
+        return cls(envelope, LazyBundle(message, lambda target: decoder.decode_value(deferred, target)))
+
+    @classmethod
+    def from_protobuf(cls, data: bytes, projection: BundleProjection = None) -> "LazySealedBundle":
+        """
+        Decode a sealed bundle from its binary protobuf representation
+
+        :param data: The serialized sealed bundle
+        :param projection: Optional - The repeated bundle fields to keep, all of them if 'None'
+        :return: the lazy sealed bundle
+        """
+        envelope_data, bundle_records = split_fields(data, (_BUNDLE_FIELD.number,))
+        envelope = SealedBundle.FromString(envelope_data)
+        if not bundle_records:
+            return cls(envelope)
+
+        bundle_data = _payloads(bundle_records)
+        if projection is not None:
+            bundle_data = projection.select_protobuf(bundle_data)
+        eager, deferred = split_fields(bundle_data, _DEFERRED_NUMBERS)
+        message = Bundle.FromString(eager)
+        if not deferred:
+            return cls(envelope, LazyBundle(message))
+        return cls(envelope, LazyBundle(message, lambda target: target.MergeFromString(deferred)))
+
+    @property
+    def bundle(self) -> LazyBundle:
+        if self._bundle is None:
+            return LazyBundle(Bundle())
+        return self._bundle
+
+    def materialize(self) -> SealedBundle:
+        """
+        Decode the deferred fields
+
+        :return: the fully decoded sealed bundle
+        """
+        if self._materialized is None:
+            sealed_bundle = SealedBundle()
+            sealed_bundle.CopyFrom(self._envelope)
+            if self._bundle is not None:
+                sealed_bundle.bundle.SetInParent()
+                sealed_bundle.bundle.CopyFrom(self._bundle.materialize())
+            self._materialized = sealed_bundle
+        return self._materialized
+
+    @property
+    def is_materialized(self) -> bool:
+        return self._bundle is None or self._bundle.is_materialized
+
+    def HasField(self, field_name: str) -> bool:
+        if field_name == _BUNDLE_FIELD.name:
+            return self._bundle is not None
+        return self._envelope.HasField(field_name)
+
+    def __getattr__(self, name):
+        if name in _ENVELOPE_FIELDS:
+            return getattr(self._envelope, name)
+        return getattr(self.materialize(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, LazySealedBundle):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __str__(self) -> str:
+        return str(self.materialize())
+
+    def __repr__(self) -> str:
+        return repr(self.materialize())
@@ -0,0 +1,315 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API - Download manifest
+
+A SQLite database in the output directory of a bulk download that records every
+session with its status, size and checksums. Incremental runs query it for the
+watermark and for the sessions that still have to be downloaded.
+
+Listing progress is recorded as well. A run opens a window for the time range it
+lists and narrows it as sessions are listed, newest first. The window is closed and
+the watermark advanced once the whole range is listed, so a run that is killed part
+way leaves the window behind and the next run lists only what is left of it.
+
+Sessions refreshed chunk by chunk also record every chunk appended to their bundle
+file, with the length of the file once it was written.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+from .models import Session
+
+MANIFEST_FILENAME = ".moonsense-manifest.sqlite3"
+
+STATUS_PENDING = "pending"
+STATUS_COMPLETE = "complete"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at INTEGER NOT NULL,
+    newest_event INTEGER,
+    journey_id TEXT,
+    status TEXT NOT NULL,
+    bytes INTEGER,
+    checksums TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at INTEGER NOT NULL,
+    session BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_created_at ON sessions (created_at);
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions (status);
+CREATE TABLE IF NOT EXISTS listing_windows (
+    window_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    since INTEGER NOT NULL,
+    until INTEGER NOT NULL,
+    newest INTEGER
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    session_id TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    md5 TEXT,
+    end_offset INTEGER NOT NULL,
+    PRIMARY KEY (session_id, chunk_id)
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+"""
+
+_WATERMARK_KEY = "watermark"
+
+
+class DownloadManifest(object):
+    """ Records the download state of sessions in a SQLite database """
+
+    def __init__(self, path: str) -> None:
+        """
+        Construct a new 'DownloadManifest' object
+
+        :param path: The path to the database file, created if missing
+        """
+        self._path = path
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connect().executescript(_SCHEMA)
+
+    def __getstate__(self):
+        # worker processes that are spawned rather than forked get a fresh connection
+        return {"path": self._path}
+
+    def __setstate__(self, state) -> None:
+        self.__init__(state["path"])
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection can't be shared with forked worker processes, each opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self._path, timeout=30, isolation_level=None,
+                                               check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def add(self, session: Session) -> None:
+        """
+        Record a session that is about to be downloaded. A session already in the
+        manifest keeps its status until it is downloaded again.
+
+        :param session: The session
+        """
+        self._execute(
+            "INSERT INTO sessions (session_id, created_at, newest_event, journey_id, status, updated_at, session) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET newest_event = excluded.newest_event, "
+            "journey_id = excluded.journey_id, session = excluded.session, updated_at = excluded.updated_at",
+            (session.session_id, session.created_at.seconds, session.newest_event.seconds, session.journey_id,
+             STATUS_PENDING, int(time()), session.SerializeToString()))
+
+    def complete(self, session_id: str, size: int, checksums: Dict[str, str]) -> None:
+        """
+        Mark a session as downloaded
+
+        :param session_id: The ID of the session
+        :param size: The number of bytes written for the session
+        :param checksums: The md5 of every file written, keyed by file name
+        """
+        self._execute(
+            "UPDATE sessions SET status = ?, bytes = ?, checksums = ?, error = NULL, "
+            "attempts = attempts + 1, updated_at = ? WHERE session_id = ?",
+            (STATUS_COMPLETE, size, json.dumps(checksums, sort_keys=True), int(time()), session_id))
+
+    def fail(self, session_id: str, error: str) -> None:
+        """
+        Mark a session as failed so the next incremental run retries it
+
+        :param session_id: The ID of the session
+        :param error: A description of the error
+        """
+        self._execute(
+            "UPDATE sessions SET status = ?, error = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE session_id = ?",
+            (STATUS_FAILED, error, int(time()), session_id))
+
+    def status(self, session_id: str) -> Optional[dict]:
+        """
+        Look up the download state of a session
+
+        :param session_id: The ID of the session
+        :return: a dictionary with the recorded columns or None if the session is unknown
+        """
+        rows = self._execute(
+            "SELECT session_id, created_at, newest_event, journey_id, status, bytes, checksums, attempts, error "
+            "FROM sessions WHERE session_id = ?", (session_id,))
+        if not rows:
+            return None
+        keys = ("session_id", "created_at", "newest_event", "journey_id", "status", "bytes", "checksums",
+                "attempts", "error")
+        status = dict(zip(keys, rows[0]))
+        status["checksums"] = json.loads(status["checksums"]) if status["checksums"] else {}
+        return status
+
+    def max_created_at(self) -> Optional[int]:
+        """
+        :return: the creation time in seconds of the newest downloaded session or None if
+                 no session was downloaded yet
+        """
+        rows = self._execute("SELECT MAX(created_at) FROM sessions WHERE status = ?", (STATUS_COMPLETE,))
+        return rows[0][0]
+
+    def unfinished(self) -> List[Session]:
+        """
+        :return: the sessions that are pending or failed, newest first
+        """
+        rows = self._execute(
+            "SELECT session FROM sessions WHERE status != ? ORDER BY created_at DESC", (STATUS_COMPLETE,))
+        return [Session.FromString(row[0]) for row in rows]
+
+    def chunks(self, session_id: str) -> Dict[str, Tuple[str, int]]:
+        """
+        Look up the chunks written to the bundle file of a session
+
+        :param session_id: The ID of the session
+        :return: a dictionary of (md5, end offset) tuples keyed by chunk ID
+        """
+        rows = self._execute("SELECT chunk_id, md5, end_offset FROM chunks WHERE session_id = ?", (session_id,))
+        return {chunk_id: (md5, end_offset) for chunk_id, md5, end_offset in rows}
+
+    def add_chunk(self, session_id: str, chunk_id: str, md5: str, end_offset: int) -> None:
+        """
+        Record a chunk appended to the bundle file of a session
+
+        :param session_id: The ID of the session
+        :param chunk_id: The ID of the chunk
+        :param md5: The md5 of the chunk as listed
+        :param end_offset: The length of the bundle file once the chunk was written
+        """
+        self._execute(
+            "INSERT OR REPLACE INTO chunks (session_id, chunk_id, md5, end_offset) VALUES (?, ?, ?, ?)",
+            (session_id, chunk_id, md5, end_offset))
+
+    def replace_chunks(self, session_id: str, chunks: List[Tuple[str, str, int]]) -> None:
+        """
+        Replace the chunks recorded for a session whose bundle file was written again
+
+        :param session_id: The ID of the session
+        :param chunks: The (chunk_id, md5, end_offset) tuples of the new file, empty if
+                       the file was not written chunk by chunk
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("DELETE FROM chunks WHERE session_id = ?", (session_id,))
+                connection.executemany(
+                    "INSERT INTO chunks (session_id, chunk_id, md5, end_offset) VALUES (?, ?, ?, ?)",
+                    [(session_id, chunk_id, md5, end_offset) for chunk_id, md5, end_offset in chunks])
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def watermark(self) -> Optional[int]:
+        """
+        :return: the creation time in seconds of the newest session of all the time ranges
+                 listed completely or None if no listing completed yet
+        """
+        rows = self._execute("SELECT value FROM state WHERE key = ?", (_WATERMARK_KEY,))
+        return rows[0][0] if rows else None
+
+    def open_window(self, since: int, until: int) -> int:
+        """
+        Record a time range that is about to be listed
+
+        :param since: The start of the range in seconds
+        :param until: The end of the range in seconds
+        :return: the ID of the window
+        """
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT INTO listing_windows (since, until) VALUES (?, ?)", (since, until))
+            return cursor.lastrowid
+
+    def windows(self) -> List[Tuple[int, int, int]]:
+        """
+        :return: the windows left behind by interrupted runs as (window_id, since, until)
+                 tuples, newest first
+        """
+        return self._execute("SELECT window_id, since, until FROM listing_windows ORDER BY until DESC")
+
+    def narrow_window(self, window_id: int, created_at: int) -> None:
+        """
+        Record that a window is listed down to a session. Only the whole seconds of the
+        creation time are kept and sessions created later in the same second may not be
+        listed yet, so the remaining range ends one second after it. Sessions listed
+        again when it is resumed are skipped as known.
+
+        :param window_id: The ID of the window
+        :param created_at: The creation time in whole seconds of the session
+        """
+        self._execute(
+            "UPDATE listing_windows SET until = ?, newest = MAX(COALESCE(newest, ?), ?) WHERE window_id = ?",
+            (created_at + 1, created_at, created_at, window_id))
+
+    def close_window(self, window_id: int) -> None:
+        """
+        Remove a window that is listed completely and advance the watermark
+
+        The window may be closed while sessions listed in it are still downloading or failed.
+        They are not lost to the watermark: every listed session is added first and stays
+        in 'unfinished' until it is complete, so the next incremental run retries it.
+
+        :param window_id: The ID of the window
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    "SELECT newest FROM listing_windows WHERE window_id = ?", (window_id,)).fetchall()
+                connection.execute("DELETE FROM listing_windows WHERE window_id = ?", (window_id,))
+                if rows and rows[0][0] is not None:
+                    connection.execute(
+                        "INSERT INTO state (key, value) VALUES (?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)",
+                        (_WATERMARK_KEY, rows[0][0]))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        """
+        Close the connection of this process
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
@@ -0,0 +1,91 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API - Transfer metrics """
+
+import threading
+
+
+class TransferMetrics(object):
+    """ Bytes transferred by a single API call """
+
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        status_code: int,
+        content_encoding: str,
+        wire_bytes: int,
+        decoded_bytes: int) -> None:
+        """
+        Construct a new 'TransferMetrics' object
+
+        :param method: The HTTP method of the call
+        :param url: The URL of the call
+        :param status_code: The HTTP status code of the response
+        :param content_encoding: The content encoding the server picked, empty if uncompressed
+        :param wire_bytes: The number of body bytes received over the network
+        :param decoded_bytes: The number of body bytes after decompression
+        """
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.content_encoding = content_encoding
+        self.wire_bytes = wire_bytes
+        self.decoded_bytes = decoded_bytes
+
+    @property
+    def compression_ratio(self) -> float:
+        """
+        :return: decoded bytes per byte on the wire, 1.0 for uncompressed or empty bodies
+        """
+        if self.wire_bytes == 0:
+            return 1.0
+        return self.decoded_bytes / self.wire_bytes
+
+    def __repr__(self) -> str:
+        return (f"TransferMetrics({self.method} {self.url} status={self.status_code} "
+                f"encoding={self.content_encoding or 'identity'} wire={self.wire_bytes} "
+                f"decoded={self.decoded_bytes})")
+
+
+class TransferStats(object):
+    """ Thread-safe running totals of 'TransferMetrics' grouped by content encoding """
+
+    def __init__(self) -> None:
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, metrics: TransferMetrics) -> None:
+        """
+        Add the metrics of one call to the totals
+
+        :param metrics: The 'TransferMetrics' of the call
+        """
+        encoding = metrics.content_encoding or "identity"
+        with self._lock:
+            totals = self._totals.setdefault(encoding, {"requests": 0, "wire_bytes": 0, "decoded_bytes": 0})
+            totals["requests"] += 1
+            totals["wire_bytes"] += metrics.wire_bytes
+            totals["decoded_bytes"] += metrics.decoded_bytes
+
+    def snapshot(self) -> dict:
+        """
+        :return: a dictionary keyed by content encoding with the number of requests, the bytes
+                 received over the wire and the bytes after decompression
+        """
+        with self._lock:
+            return {encoding: dict(totals) for encoding, totals in self._totals.items()}
@@ -0,0 +1,141 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API - Multi-core decoding of NDJSON bundle streams
+
+Decoding bundle JSON is CPU-bound and holds the GIL, so a single client thread can't
+use more than one core for it. A 'DecodePool' sends batches of raw lines to worker
+processes, which decode them and send back serialized protobuf messages. Batches are
+sized in bytes so a round trip to a worker is amortized over many bundles, and the
+results are returned in the order of the input lines.
+
+Parsing the returned messages is cheap with the C implementations of protobuf (upb or
+cpp). With the pure python implementation, consumers that forward bundles elsewhere
+should ask for the serialized messages instead.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Union
+
+from .decoder import FastJsonDecoder
+from .lazy import BundleProjection
+from .models import SealedBundle
+
+# decoder of the current worker process, created by _init_worker
+_worker_decoder = None
+
+
+def _init_worker(decoder_class) -> None:
+    global _worker_decoder
+    _worker_decoder = decoder_class()
+
+
+def _decode_batch(lines: List[bytes], projection: Optional[BundleProjection]) -> List[bytes]:
+    if projection is not None:
+        return [projection.decode_json(line, _worker_decoder).SerializeToString() for line in lines]
+    return [_worker_decoder.decode(line, SealedBundle()).SerializeToString() for line in lines]
+
+
+class DecodePool(object):
+    """ Process pool decoding NDJSON bundle lines in parallel """
+
+    def __init__(
+        self,
+        processes: int = None,
+        batch_bytes: int = 1024 * 1024,
+        max_pending_batches: int = None,
+        decoder_class=FastJsonDecoder) -> None:
+        """
+        Construct a new 'DecodePool' object
+
+        :param processes: The number of worker processes. Defaults to the number of CPUs.
+        :param batch_bytes: The amount of raw JSON sent to a worker at once (defaults to 1MB)
+        :param max_pending_batches: The maximum number of batches submitted but not yet returned,
+                                    which caps the memory used. Defaults to twice 'processes'.
+        :param decoder_class: The 'JsonDecoder' class instantiated in every worker process
+                              (defaults to 'FastJsonDecoder')
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes < 1:
+            raise ValueError("processes must be at least 1")
+        if batch_bytes < 1:
+            raise ValueError("batch_bytes must be at least 1")
+
+        self._processes = processes
+        self._batch_bytes = batch_bytes
+        self._max_pending_batches = max_pending_batches if max_pending_batches is not None else 2 * processes
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(decoder_class,))
+
+    def _batches(self, lines: Iterable[bytes]) -> Iterable[List[bytes]]:
+        batch = []
+        size = 0
+        for line in lines:
+            batch.append(line)
+            size += len(line)
+            if size >= self._batch_bytes:
+                yield batch
+                batch = []
+                size = 0
+        if batch:
+            yield batch
+
+    def decode(
+        self,
+        lines: Iterable[bytes],
+        fields: Iterable[str] = None,
+        serialized: bool = False) -> Iterable[Union[SealedBundle, bytes]]:
+        """
+        Decode NDJSON bundle lines in the worker processes
+
+        :param lines: An iterable of JSON documents, one sealed bundle each
+        :param fields: Optional - The repeated bundle fields to decode, see 'Client.read_chunk'
+        :param serialized: If set to True, the serialized protobuf messages are returned as is
+                           instead of being parsed into 'SealedBundle' objects
+        :return: a generator of bundles in the order of the input lines
+        """
+        projection = BundleProjection(fields) if fields is not None else None
+        pending = deque()
+        try:
+            for batch in self._batches(lines):
+                pending.append(self._executor.submit(_decode_batch, batch, projection))
+                while len(pending) >= self._max_pending_batches:
+                    yield from self._results(pending.popleft(), serialized)
+            while pending:
+                yield from self._results(pending.popleft(), serialized)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _results(future, serialized: bool):
+        for data in future.result():
+            yield data if serialized else SealedBundle.FromString(data)
+
+    def close(self) -> None:
+        """
+        Stop the worker processes
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
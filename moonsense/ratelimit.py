@@ -0,0 +1,225 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Moonsense Cloud API - Adaptive client side rate limiting """
+
+import asyncio
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep
+from typing import Dict, Optional
+
+THROTTLED_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header value
+
+    :param value: Either a number of seconds or an HTTP date
+    :return: the number of seconds to wait or None if the value is missing or invalid
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class _HostState(object):
+
+    def __init__(self) -> None:
+        self.rate = None
+        self.tokens = 0.0
+        self.refilled_at = monotonic()
+        self.blocked_until = 0.0
+        self.sent = deque()
+        self.throttled = 0
+
+
+class RateLimiter(object):
+    """ Token bucket rate limiter with AIMD rate adaptation, kept per host """
+
+    def __init__(
+        self,
+        max_rate: float = None,
+        min_rate: float = 1.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0) -> None:
+        """
+        Construct a new 'RateLimiter' object
+
+        Requests are not paced until the server throttles a host with a 429 or 503. The
+        rate for that host is then cut to a fraction of the observed request rate and
+        grows back additively with every successful response.
+
+        :param max_rate: Optional - Upper bound in requests per second for each host. If 'None'
+                         is supplied, requests are only paced after the first throttled response.
+        :param min_rate: Lower bound in requests per second the rate is never cut below
+        :param increase: Requests per second added to the rate for every second of successful requests
+        :param decrease: Factor the rate is multiplied with on every throttled response
+        :param backoff_base: Delay in seconds before the first retry, doubled on every attempt
+        :param backoff_max: Maximum delay in seconds between two retries
+        """
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+            state.rate = self._max_rate
+        return state
+
+    @staticmethod
+    def _observed_rate(state: _HostState, now: float) -> int:
+        # number of requests sent to the host over the last second
+        while state.sent and state.sent[0] < now - 1:
+            state.sent.popleft()
+        return len(state.sent)
+
+    @classmethod
+    def _record_sent(cls, state: _HostState, now: float) -> None:
+        # only the last second is kept, so the history stays bounded in long runs
+        state.sent.append(now)
+        cls._observed_rate(state, now)
+
+    def _try_acquire(self, host: str) -> float:
+        # takes a token for the host if one is available, otherwise returns how long to
+        # wait before trying again
+        with self._lock:
+            state = self._state(host)
+            now = monotonic()
+            wait = state.blocked_until - now
+            if wait > 0:
+                return wait
+            if state.rate is None:
+                self._record_sent(state, now)
+                return 0.0
+
+            state.tokens = min(max(1.0, state.rate), state.tokens + (now - state.refilled_at) * state.rate)
+            state.refilled_at = now
+            if state.tokens >= 1:
+                state.tokens -= 1
+                self._record_sent(state, now)
+                return 0.0
+            return (1 - state.tokens) / state.rate
+
+    def acquire(self, host: str) -> None:
+        """
+        Block until a request to the host is allowed
+
+        :param host: The host the request is sent to
+        """
+        while True:
+            wait = self._try_acquire(host)
+            if wait <= 0:
+                return
+            sleep(wait)
+
+    async def acquire_async(self, host: str) -> None:
+        """
+        Wait without blocking the event loop until a request to the host is allowed
+
+        :param host: The host the request is sent to
+        """
+        while True:
+            wait = self._try_acquire(host)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def on_response(self, host: str, status_code: int, retry_after: Optional[str] = None) -> None:
+        """
+        Adapt the rate of a host to the outcome of a request
+
+        :param host: The host the request was sent to
+        :param status_code: The HTTP status code of the response
+        :param retry_after: Optional - The Retry-After header of the response
+        """
+        with self._lock:
+            state = self._state(host)
+            now = monotonic()
+            if status_code in THROTTLED_STATUS_CODES:
+                state.throttled += 1
+                observed = max(self._observed_rate(state, now), self._min_rate)
+                current = observed if state.rate is None else min(state.rate, observed)
+                state.rate = max(self._min_rate, current * self._decrease)
+                state.tokens = min(state.tokens, 0.0)
+
+                delay = parse_retry_after(retry_after)
+                if delay is not None:
+                    state.blocked_until = max(state.blocked_until, now + delay)
+            elif state.rate is not None and status_code < 500:
+                state.rate += self._increase / max(state.rate, 1.0)
+                if self._max_rate is not None:
+                    state.rate = min(state.rate, self._max_rate)
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Compute the delay before retrying a request
+
+        :param attempt: The number of attempts made so far, starting at 0
+        :param retry_after: Optional - The Retry-After header of the last response
+        :return: an exponential delay with jitter in seconds, at least as long as Retry-After
+        """
+        delay = min(self._backoff_max, self._backoff_base * (2 ** attempt))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        requested = parse_retry_after(retry_after)
+        if requested is not None:
+            delay = max(delay, requested)
+        return delay
+
+    def status(self) -> Dict[str, dict]:
+        """
+        Report how close each host is to its rate limit
+
+        :return: a dictionary keyed by host with the current allowed rate ('None' if unpaced),
+                 the observed rate over the last second, the utilization of the allowed rate,
+                 the number of throttled responses and the seconds left in a Retry-After pause
+        """
+        with self._lock:
+            now = monotonic()
+            report = {}
+            for host, state in self._hosts.items():
+                observed = self._observed_rate(state, now)
+                report[host] = {
+                    "rate": state.rate,
+                    "observed_rate": observed,
+                    "utilization": observed / state.rate if state.rate else 0.0,
+                    "throttled": state.throttled,
+                    "blocked_for": max(0.0, state.blocked_until - now),
+                }
+            return report
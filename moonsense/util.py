@@ -14,6 +14,174 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import io
+import os
+import secrets
 from enum import Enum
 import google.protobuf.json_format
-json_format = google.protobuf.json_format
\ No newline at end of file
+json_format = google.protobuf.json_format
+
+def create_temp_file(directory: str, prefix: str = "", suffix: str = ""):
+    """
+    Create a new file with a unique name, like tempfile.mkstemp, but with the
+    permissions open() would give it: 0666 minus the current umask. mkstemp makes
+    files readable by their owner only, which a rename into place would keep.
+
+    :param directory: The directory to create the file in
+    :param prefix: The start of the file name
+    :param suffix: The end of the file name
+    :return: a tuple of the open file descriptor and the path of the file
+    """
+    while True:
+        path = os.path.join(directory, prefix + secrets.token_hex(8) + suffix)
+        try:
+            return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), path
+        except FileExistsError:
+            continue
+
+
+def split_lines(chunks):
+    """
+    Split a stream of byte chunks into lines, skipping empty lines
+
+    :param chunks: An iterable of bytes
+    :return: a generator of lines without the trailing newline
+    """
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def _read_varint(buffer, pos: int):
+    # returns (value, position after the varint) or None when the buffer ends mid varint
+    result = 0
+    shift = 0
+    while pos < len(buffer):
+        byte = buffer[pos]
+        result |= (byte & 0x7f) << shift
+        pos += 1
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise RuntimeError("invalid varint in length-delimited message stream")
+    return None
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    Encode a non-negative integer as a protobuf varint
+
+    :param value: The integer to encode
+    :return: the encoded bytes
+    """
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def split_length_delimited(chunks):
+    """
+    Split a stream of byte chunks into varint length-delimited protobuf messages
+
+    :param chunks: An iterable of bytes
+    :return: a generator of serialized messages
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while True:
+            header = _read_varint(buffer, pos)
+            if header is None:
+                break
+            length, start = header
+            if start + length > len(buffer):
+                break
+            yield bytes(buffer[start:start + length])
+            pos = start + length
+        del buffer[:pos]
+
+    if len(buffer) > 0:
+        raise RuntimeError("length-delimited message stream ended in the middle of a message")
+
+
+def split_fields(data: bytes, field_numbers):
+    """
+    Partition a serialized protobuf message by field number without parsing it
+
+    :param data: The serialized message
+    :param field_numbers: A set of field numbers to split off
+    :return: a tuple of the serialized remaining fields and the serialized selected fields,
+             each of them is a valid message of the same type
+    """
+    kept = []
+    selected = []
+    pos = 0
+    while pos < len(data):
+        start = pos
+        header = _read_varint(data, pos)
+        if header is None:
+            raise RuntimeError("truncated protobuf message")
+        tag, pos = header
+        wire_type = tag & 0x7
+        if wire_type == 0:
+            header = _read_varint(data, pos)
+            if header is None:
+                raise RuntimeError("truncated protobuf message")
+            pos = header[1]
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 2:
+            header = _read_varint(data, pos)
+            if header is None:
+                raise RuntimeError("truncated protobuf message")
+            length, pos = header
+            pos += length
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise RuntimeError(f"unsupported protobuf wire type: {wire_type}")
+        if pos > len(data):
+            raise RuntimeError("truncated protobuf message")
+
+        if tag >> 3 in field_numbers:
+            selected.append(data[start:pos])
+        else:
+            kept.append(data[start:pos])
+    return b"".join(kept), b"".join(selected)
+
+
+class IterableReader(io.RawIOBase):
+    """ Read-only file object over an iterable of bytes, e.g. a streamed HTTP body """
+
+    def __init__(self, chunks) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while len(self._buffer) == 0:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
@@ -35,6 +35,12 @@ setup(
         "click>=8.1,<9",
         "retry>=0.9,<1",
     ],
+    extras_require={
+        "async": ["aiohttp>=3.8,<4"],
+        # urllib3 decodes zstd from version 2 on, which needs requests 2.30 or later
+        "compression": ["brotli>=1,<2", "zstandard>=0.18", "urllib3>=2,<3", "requests>=2.30,<3"],
+        "fast": ["orjson>=3,<4"],
+    },
     url="https://github.com/moonsense/python-sdk.git",
     author="Moonsense Team",
     author_email="support@moonsense.io",
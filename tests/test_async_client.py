@@ -0,0 +1,207 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import asyncio
+import datetime
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from moonsense.async_client import AsyncClient
+from moonsense.ratelimit import RateLimiter
+
+from .test_client import MOCK_SECRET_TOKEN, generate_test_session, generate_test_sessions_list, \
+    generate_chunk_payload, generate_bundle
+
+
+# The tests run against a local stand-in server. An empty default region makes the
+# client address the root domain directly, which is the local server.
+async def start_server(routes) -> TestServer:
+    app = web.Application()
+    app.add_routes(routes)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    return server
+
+
+def new_async_client(server: TestServer, **kwargs) -> AsyncClient:
+    return AsyncClient(MOCK_SECRET_TOKEN, f"{server.host}:{server.port}", "http", "", **kwargs)
+
+
+def test_async_list_sessions_with_pagination():
+    pages = {
+        "1": generate_test_sessions_list(count=2, current_page=1, total_pages=2, total_count=4),
+        "2": generate_test_sessions_list(count=2, current_page=2, total_pages=2, total_count=4),
+    }
+
+    async def list_sessions(request):
+        assert request.headers["Authorization"] == "Bearer " + MOCK_SECRET_TOKEN
+        return web.json_response(pages[request.query["page"]])
+
+    async def run():
+        server = await start_server([web.get("/v2/sessions", list_sessions)])
+        try:
+            async with new_async_client(server) as c:
+                return [s async for s in c.list_sessions()]
+        finally:
+            await server.close()
+
+    result = asyncio.run(run())
+    assert len(result) == 4
+    assert result[0].session_id == pages["1"]["sessions"][0]["session_id"]
+    assert result[3].session_id == pages["2"]["sessions"][1]["session_id"]
+
+
+def test_async_list_and_read_chunks():
+    test_session = generate_test_session("test_session_id1", "test_app_id", region_id="")
+    created_at = datetime.datetime.now()
+
+    async def describe_session(request):
+        return web.json_response(test_session)
+
+    async def list_chunks(request):
+        return web.json_response({
+            "session_id": "test_session_id1",
+            "chunks": [{"chunk_id": "chunk_id1", "md5": "abcd", "created_at": created_at.isoformat() + "Z"}],
+            "pagination": {"current_page": 1, "total_pages": 1}
+        })
+
+    async def read_chunk(request):
+        return web.Response(
+            body=generate_chunk_payload([
+                generate_bundle("test_session_id1", 1),
+                generate_bundle("test_session_id1", 2)
+            ]),
+            headers={"Content-Encoding": "gzip"})
+
+    async def run():
+        server = await start_server([
+            web.get("/v2/sessions/test_session_id1", describe_session),
+            web.get("/v2/sessions/test_session_id1/chunks", list_chunks),
+            web.get("/v2/sessions/test_session_id1/chunks/chunk_id1", read_chunk),
+        ])
+        try:
+            async with new_async_client(server) as c:
+                chunks = [chunk async for chunk in c.list_chunks("test_session_id1")]
+                bundles = [b async for b in c.read_chunk("test_session_id1", chunks[0].chunk_id)]
+                return chunks, bundles
+        finally:
+            await server.close()
+
+    chunks, bundles = asyncio.run(run())
+    assert len(chunks) == 1
+    assert chunks[0].md5 == "abcd"
+    assert [b.bundle.index for b in bundles] == [1, 2]
+
+
+def test_async_bounded_concurrency():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def describe_session(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return web.json_response(generate_test_session(request.match_info["session_id"]))
+
+    async def run():
+        server = await start_server([web.get("/v2/sessions/{session_id}", describe_session)])
+        try:
+            async with new_async_client(server, max_concurrency=3) as c:
+                return await asyncio.gather(*[c.describe_session(f"session{i}") for i in range(10)])
+        finally:
+            await server.close()
+
+    result = asyncio.run(run())
+    assert [s.session_id for s in result] == [f"session{i}" for i in range(10)]
+    assert max_in_flight == 3
+
+
+def test_async_describe_sessions():
+    async def describe_session(request):
+        session_id = request.match_info["session_id"]
+        if session_id == "missing":
+            return web.json_response({}, status=404)
+        return web.json_response(generate_test_session(session_id))
+
+    async def run():
+        server = await start_server([web.get("/v2/sessions/{session_id}", describe_session)])
+        try:
+            async with new_async_client(server) as c:
+                return await c.describe_sessions(["session1", "missing", "session2"])
+        finally:
+            await server.close()
+
+    sessions, errors = asyncio.run(run())
+    assert sorted(sessions.keys()) == ["session1", "session2"]
+    assert list(errors.keys()) == ["missing"]
+
+
+def test_async_calls_while_reading_a_chunk():
+    # the caller scores every bundle while the chunk is read, with a single request slot
+    async def read_chunk(request):
+        return web.Response(
+            body=generate_chunk_payload([generate_bundle("test_session_id1", i) for i in range(1, 4)]),
+            headers={"Content-Encoding": "gzip"})
+
+    async def describe_session(request):
+        return web.json_response(generate_test_session(request.match_info["session_id"], region_id=""))
+
+    async def run():
+        server = await start_server([
+            web.get("/v2/sessions/test_session_id1/chunks/chunk_id1", read_chunk),
+            web.get("/v2/sessions/{session_id}", describe_session),
+        ])
+        try:
+            async with new_async_client(server, max_concurrency=1) as c:
+                described = []
+                async for bundle in c.read_chunk("test_session_id1", "chunk_id1"):
+                    session = await c.describe_session(f"session{bundle.bundle.index}")
+                    described.append(session.session_id)
+                return described
+        finally:
+            await server.close()
+
+    described = asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert described == ["session1", "session2", "session3"]
+
+
+def test_async_retries_throttled_requests():
+    requests = 0
+
+    async def describe_session(request):
+        nonlocal requests
+        requests += 1
+        if requests <= 2:
+            return web.json_response({}, status=429 if requests == 1 else 503, headers={"Retry-After": "0"})
+        return web.json_response(generate_test_session(request.match_info["session_id"]))
+
+    async def run():
+        server = await start_server([web.get("/v2/sessions/{session_id}", describe_session)])
+        try:
+            limiter = RateLimiter(min_rate=100.0, backoff_base=0.001)
+            async with new_async_client(server, rate_limiter=limiter) as c:
+                return await c.describe_session("session1"), c.rate_limit_status()
+        finally:
+            await server.close()
+
+    session, status = asyncio.run(run())
+    assert session.session_id == "session1"
+    assert requests == 3
+    assert [host["throttled"] for host in status.values()] == [2]
@@ -24,13 +24,24 @@ import tarfile
 import gzip
 
 import json
+import threading
+import time
+import pytest
+import requests
 import responses
 from responses import matchers
 import datetime
 
 import shortuuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from google.protobuf import json_format
+from google.protobuf.internal.encoder import _VarintBytes
 
 from moonsense import client
+from moonsense.cache import ChunkCache, RegionCache
+from moonsense.decoder import FastJsonDecoder
+from moonsense.ratelimit import RateLimiter, parse_retry_after
+from moonsense.models import Chunk, Session, SealedBundle
 
 PROTOCOL = "https"
 ROOT_DOMAIN = "moonsense.dev"
@@ -118,7 +129,8 @@ def generate_bundle(session_id, bundle_index=1):
         "session_id": session_id
     }
 
-def test_regions():
+@pytest.mark.parametrize("json_decoder", [None, FastJsonDecoder()])
+def test_regions(json_decoder):
     with responses.RequestsMock() as rsps:
         rsps.add(
             responses.GET,
@@ -135,7 +147,7 @@ def test_regions():
             content_type="application/json",
         )
 
-        c = new_client()
+        c = client.Client(MOCK_SECRET_TOKEN, ROOT_DOMAIN, PROTOCOL, DEFAULT_REGION, json_decoder=json_decoder)
         assert "europe-west1.gcp" in [r.name for r in c.list_regions().regions]
 
 
@@ -265,6 +277,10 @@ def test_list_and_read_chunks():
         
         assert count == 2
 
+        bundles = list(c.read_chunk("test_session_id1", chunks[0].chunk_id, lazy=True))
+        assert [b.bundle.index for b in bundles] == [1, 2]
+        assert bundles[0].session_id == "test_session_id1"
+
 
 def test_download_session():
     test_session = generate_test_session("test_session_id1", "test_app_id")
@@ -291,6 +307,8 @@ def test_download_session():
             output_file = os.path.join(tmpdirname, "test_session_id1.json")
             c.download_session("test_session_id1", output_file)
             assert os.path.getsize(output_file) == len(payload)
+            # the file keeps the mode of the archive member
+            assert os.stat(output_file).st_mode & 0o777 == 0o644
 
 
 def test_download_packets():
@@ -352,6 +370,9 @@ def test_read_session():
             count += 1
         assert count == 3
 
+        bundles = list(c.read_session("test_session_id1", fields=["accelerometer_data"]))
+        assert [b.bundle.index for b in bundles] == [1, 2, 3]
+
 
 def test_set_and_retrieve_labels():
     test_session_id = "test_session_id1"
@@ -416,3 +437,771 @@ def test_set_and_retrieve_labels():
 
         sorted_labels = sorted(labels)
         assert sorted_labels == ["label1", "updated_label1", "updated_label2"]
+
+
+def test_client_reuses_pooled_session():
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/tokens/self",
+            body=json.dumps({"app_id": "test_app_id"}),
+            status=200,
+            content_type="application/json",
+        )
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/tokens/self",
+            body=json.dumps({"app_id": "test_app_id"}),
+            status=200,
+            content_type="application/json",
+        )
+
+        with client.Client(MOCK_SECRET_TOKEN, ROOT_DOMAIN, PROTOCOL, DEFAULT_REGION, pool_size=4) as c:
+            adapter = c._http.get_adapter("https://us-central1.gcp.data-api.moonsense.dev")
+            assert adapter._pool_maxsize == 4
+
+            c.whoami()
+            c.whoami()
+            assert len(rsps.calls) == 2
+            assert rsps.calls[0].request.headers["Authorization"] == "Bearer " + MOCK_SECRET_TOKEN
+
+
+def test_region_cache_skips_describe_session():
+    test_session = generate_test_session("test_session_id1", "test_app_id", region_id="europe-west1.gcp")
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions?per_page=50&page=1",
+            body=json.dumps({
+                "sessions": [test_session],
+                "pagination": {"current_page": 1, "per_page": 50, "total_pages": 1, "total_count": 1}
+            }),
+            status=200,
+            content_type="application/json",
+        )
+
+        for chunk_id in ["chunk_id1", "chunk_id2"]:
+            rsps.add(
+                responses.GET,
+                f"https://europe-west1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1/chunks/{chunk_id}",
+                body=generate_chunk_payload([generate_bundle("test_session_id1", 1)]),
+                headers={'Content-Encoding': 'gzip'},
+                status=200,
+                content_type="application/json",
+            )
+
+        c = new_client()
+        sessions = list(c.list_sessions())
+        assert len(list(c.read_chunk("test_session_id1", "chunk_id1"))) == 1
+        assert len(list(c.read_chunk(sessions[0], "chunk_id2"))) == 1
+        # one listing and two chunk reads, no describe calls
+        assert len(rsps.calls) == 3
+
+
+def test_region_cache_eviction_and_ttl():
+    regions = RegionCache(max_size=2, ttl=3600)
+    regions.put("session1", "us-central1.gcp")
+    regions.put("session2", "us-central1.gcp")
+    assert regions.get("session1") == "us-central1.gcp"
+    regions.put("session3", "europe-west1.gcp")
+
+    # session2 was the least recently used entry
+    assert regions.get("session2") is None
+    assert regions.get("session1") == "us-central1.gcp"
+    assert regions.get("session3") == "europe-west1.gcp"
+
+    expired = RegionCache(max_size=2, ttl=-1)
+    expired.put("session1", "us-central1.gcp")
+    assert expired.get("session1") is None
+
+
+def test_list_sessions_with_prefetch():
+    pages = [generate_test_sessions_list(count=2, current_page=page, total_pages=4, total_count=8)
+             for page in range(1, 5)]
+
+    with responses.RequestsMock() as rsps:
+        for page in range(1, 5):
+            rsps.add(
+                responses.GET,
+                f"https://us-central1.gcp.data-api.moonsense.dev/v2/sessions?per_page=2&page={page}",
+                body=json.dumps(pages[page - 1]),
+                status=200,
+                content_type="application/json",
+            )
+
+        c = new_client()
+        result = list(c.list_sessions(per_page=2, prefetch=2))
+        expected = [s["session_id"] for page in pages for s in page["sessions"]]
+        assert [s.session_id for s in result] == expected
+
+
+def test_list_sessions_sharded():
+    created = [
+        datetime.datetime(2022, 1, 2, 12),
+        datetime.datetime(2022, 1, 2, 0),  # exactly on the boundary between the two windows
+        datetime.datetime(2022, 1, 1, 20),
+        datetime.datetime(2022, 1, 1, 6),
+    ]
+    sessions = [generate_test_session(f"session{i}", "test_app_id", created_at=c) for i, c in enumerate(created)]
+
+    def list_window(request):
+        min_created_at = datetime.datetime.fromisoformat(request.params["filter[min_created_at]"]).replace(tzinfo=None)
+        max_created_at = datetime.datetime.fromisoformat(request.params["filter[max_created_at]"]).replace(tzinfo=None)
+        matched = [s for s, c in zip(sessions, created) if min_created_at <= c <= max_created_at]
+        return (200, {}, json.dumps({
+            "sessions": matched,
+            "pagination": {"current_page": 1, "per_page": 50, "total_pages": 1, "total_count": len(matched)}
+        }))
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions",
+            callback=list_window,
+            content_type="application/json",
+        )
+
+        c = new_client()
+        result = list(c.list_sessions(
+            since=datetime.datetime(2022, 1, 1), until=datetime.datetime(2022, 1, 3), shards=2))
+        assert [s.session_id for s in result] == ["session0", "session1", "session2", "session3"]
+        assert len(rsps.calls) == 2
+
+
+def test_describe_sessions():
+    with responses.RequestsMock() as rsps:
+        for session_id in ["session1", "session2"]:
+            rsps.add(
+                responses.GET,
+                f"https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/{session_id}?view=minimal",
+                body=json.dumps(generate_test_session(session_id, "test_app_id", region_id="europe-west1.gcp")),
+                status=200,
+                content_type="application/json",
+            )
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/missing?view=minimal",
+            body="{}",
+            status=404,
+            content_type="application/json",
+        )
+        rsps.add(
+            responses.GET,
+            "https://europe-west1.gcp.data-api.moonsense.dev/v2/sessions/session1/chunks/chunk_id1",
+            body=generate_chunk_payload([generate_bundle("session1", 1)]),
+            headers={'Content-Encoding': 'gzip'},
+            status=200,
+            content_type="application/json",
+        )
+
+        c = new_client()
+        sessions, errors = c.describe_sessions(["session1", "session2", "missing", "session1"], concurrency=2)
+        assert sorted(sessions.keys()) == ["session1", "session2"]
+        assert list(errors.keys()) == ["missing"]
+
+        # the region is known now, reading a chunk does not describe the session again
+        assert len(list(c.read_chunk("session1", "chunk_id1"))) == 1
+        assert len(rsps.calls) == 4
+
+
+
+def test_describe_sessions_grows_the_connection_pool(monkeypatch):
+    c = new_client()
+    replaced = c._http.get_adapter("https://")
+    closed = []
+    monkeypatch.setattr(replaced, "close", lambda: closed.append(replaced))
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/session1?view=minimal",
+            body=json.dumps(generate_test_session("session1", "test_app_id")),
+            status=200,
+            content_type="application/json",
+        )
+        sessions, _ = c.describe_sessions(["session1"], concurrency=32)
+
+    assert list(sessions.keys()) == ["session1"]
+    assert c._http.get_adapter("https://")._pool_maxsize == 32
+    assert closed == [replaced]
+
+
+def test_throttled_requests_are_retried():
+    test_session = generate_test_session("test_session_id1", "test_app_id")
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1?view=minimal",
+            body="",
+            status=429,
+            headers={"Retry-After": "0"},
+        )
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1?view=minimal",
+            body="",
+            status=503,
+        )
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1?view=minimal",
+            body=json.dumps(test_session),
+            status=200,
+            content_type="application/json",
+        )
+
+        c = client.Client(MOCK_SECRET_TOKEN, ROOT_DOMAIN, PROTOCOL, DEFAULT_REGION,
+                          rate_limiter=RateLimiter(min_rate=100.0, backoff_base=0.001))
+        session = c.describe_session("test_session_id1")
+        assert session.session_id == "test_session_id1"
+        assert len(rsps.calls) == 3
+
+        status = c.rate_limit_status()["us-central1.gcp.data-api.moonsense.dev"]
+        assert status["throttled"] == 2
+        assert status["rate"] >= 100.0
+
+
+def test_rate_limiter_adapts_rate():
+    limiter = RateLimiter(min_rate=2.0, decrease=0.5, backoff_base=1.0, backoff_max=4.0)
+    for _ in range(10):
+        limiter.acquire("host")
+    assert limiter.status()["host"]["rate"] is None
+
+    limiter.on_response("host", 429, "2")
+    status = limiter.status()["host"]
+    assert status["rate"] == 5.0
+    assert status["blocked_for"] > 1.0
+
+    limiter.on_response("host", 200)
+    assert limiter.status()["host"]["rate"] > 5.0
+
+    assert 0.5 <= limiter.backoff(0) <= 1.0
+    assert 2.0 <= limiter.backoff(10) <= 4.0
+    assert limiter.backoff(0, "3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_rate_limiter_history_is_bounded(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("moonsense.ratelimit.monotonic", lambda: now[0])
+    limiter = RateLimiter()
+    for _ in range(10000):
+        now[0] += 0.01
+        limiter.acquire("host")
+    # only the requests of the last second are remembered
+    assert len(limiter._hosts["host"].sent) <= 101
+
+
+def test_transfer_metrics():
+    test_session = generate_test_session("test_session_id1", "test_app_id")
+    payload = generate_chunk_payload([generate_bundle("test_session_id1", i) for i in range(100)])
+    transfers = []
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1?view=minimal",
+            body=json.dumps(test_session),
+            status=200,
+            content_type="application/json",
+        )
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1/chunks/chunk_id1",
+            body=payload,
+            headers={'Content-Encoding': 'gzip'},
+            status=200,
+            content_type="application/json",
+        )
+
+        c = client.Client(MOCK_SECRET_TOKEN, ROOT_DOMAIN, PROTOCOL, DEFAULT_REGION,
+                          transfer_callback=transfers.append)
+        assert len(list(c.read_chunk("test_session_id1", "chunk_id1"))) == 100
+        assert "gzip" in rsps.calls[1].request.headers["Accept-Encoding"]
+
+        assert [t.content_encoding for t in transfers] == ["", "gzip"]
+        assert transfers[1].wire_bytes == len(payload)
+        assert transfers[1].decoded_bytes > transfers[1].wire_bytes
+        assert transfers[1].compression_ratio > 1
+
+        stats = c.transfer_stats()
+        assert stats["gzip"]["requests"] == 1
+        assert stats["gzip"]["wire_bytes"] == len(payload)
+        assert stats["identity"]["decoded_bytes"] == len(json.dumps(test_session))
+
+
+class LocalServer(object):
+    """ Local stand-in for the API. 'routes' maps a path to a function taking the
+    request's Accept header and returning a (content type, body) tuple. """
+
+    def __init__(self, routes):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                route = routes.get(self.path.split("?")[0])
+                if route is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                content_type, body = route(self.headers.get("Accept", ""))
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def new_client(self, **kwargs):
+        # an empty default region makes the client address the root domain directly
+        host, port = self.server.server_address
+        return client.Client(MOCK_SECRET_TOKEN, f"{host}:{port}", "http", "", **kwargs)
+
+
+def test_protobuf_wire_format():
+    session = json_format.ParseDict(generate_test_session("test_session_id1", region_id=""), Session(),
+                                    ignore_unknown_fields=True)
+    bundles = [json_format.ParseDict(generate_bundle("test_session_id1", i), SealedBundle()) for i in range(3)]
+
+    def describe_session(accept):
+        if "application/x-protobuf" in accept:
+            return "application/x-protobuf", session.SerializeToString()
+        return "application/json", json_format.MessageToJson(session).encode()
+
+    def read_chunk(accept):
+        assert "delimited=true" in accept
+        payload = b"".join(_VarintBytes(b.ByteSize()) + b.SerializeToString() for b in bundles)
+        return "application/x-protobuf; delimited=true", payload
+
+    def list_features(accept):
+        # endpoints without protobuf support answer with JSON
+        return "application/json", json.dumps({"session_id": "test_session_id1"}).encode()
+
+    with LocalServer({
+        "/v2/sessions/test_session_id1": describe_session,
+        "/v2/sessions/test_session_id1/chunks/chunk_id1": read_chunk,
+        "/v2/sessions/test_session_id1/features": list_features,
+    }) as server:
+        c = server.new_client(wire_format="protobuf")
+        assert c.describe_session("test_session_id1") == session
+        assert list(c.read_chunk("test_session_id1", "chunk_id1")) == bundles
+        assert list(c.read_chunk("test_session_id1", "chunk_id1", lazy=True)) == bundles
+        assert list(c.read_chunk("test_session_id1", "chunk_id1", fields=["pointer_data"])) == bundles
+        assert c.list_session_features("test_session_id1").session_id == "test_session_id1"
+
+        c = server.new_client()
+        assert c.describe_session("test_session_id1") == session
+
+
+def test_read_session_streams_without_temp_files(monkeypatch):
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("read_session must not write to disk")
+
+    monkeypatch.setattr(tempfile, "TemporaryDirectory", no_temp_files)
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", no_temp_files)
+
+    test_session = generate_test_session("test_session_id1", "test_app_id")
+    # large enough for lines to span several read buffers
+    payload = "\n".join(json.dumps(generate_bundle("test_session_id1", i)) for i in range(25000))
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1?view=minimal",
+            body=json.dumps(test_session),
+            status=200,
+            content_type="application/json")
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1/bundles",
+            body=generate_downloadable_payload(payload),
+            status=200,
+            content_type="application/json")
+
+        c = new_client()
+        indexes = [envelope.bundle.index for envelope in c.read_session("test_session_id1")]
+        assert indexes == list(range(25000))
+
+
+def test_download_session_is_atomic():
+    test_session = generate_test_session("test_session_id1", "test_app_id")
+    payload = json.dumps({"hello": "world"})
+
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        for name in ["first.json", "second.json"]:
+            info = tarfile.TarInfo(name)
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload.encode()))
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1?view=minimal",
+            body=json.dumps(test_session),
+            status=200,
+            content_type="application/json")
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1/bundles",
+            body=generate_downloadable_payload(payload),
+            status=200,
+            content_type="application/json")
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1/bundles",
+            body=archive.getvalue(),
+            status=200,
+            content_type="application/json")
+
+        c = new_client()
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            output_file = os.path.join(tmpdirname, "test_session_id1.json")
+            c.download_session("test_session_id1", output_file)
+            with open(output_file) as f:
+                assert f.read() == payload
+            assert os.listdir(tmpdirname) == ["test_session_id1.json"]
+
+            # a failed download leaves neither a partial file nor the temporary file behind
+            failed_file = os.path.join(tmpdirname, "failed.json")
+            try:
+                c.download_session("test_session_id1", failed_file)
+                assert False, "expected the download to fail"
+            except RuntimeError:
+                pass
+            assert os.listdir(tmpdirname) == ["test_session_id1.json"]
+
+
+def test_read_session_fields_follows_cursor():
+    test_session = generate_test_session("test_session_id1", "test_app_id")
+    pages = {
+        0: {"bundle": {"accelerometerData": [{"x": 1}, {"x": 2}]}, "maxDeterminedAt": "20", "fromBundleCursor": "2"},
+        2: {"bundle": {"accelerometerData": [{"x": 3}]}, "maxDeterminedAt": "30", "fromBundleCursor": "3"},
+        3: {"bundle": {}, "maxDeterminedAt": "30", "fromBundleCursor": "3"},
+    }
+    requested = []
+
+    def read_fields(request):
+        assert request.params["fields"] == "accelerometer_data"
+        cursor = int(request.params["from_bundle_cursor"])
+        requested.append(cursor)
+        return 200, {}, json.dumps(pages[cursor])
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1?view=minimal",
+            body=json.dumps(test_session),
+            status=200,
+            content_type="application/json")
+        rsps.add_callback(
+            responses.GET,
+            "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions/test_session_id1/fields",
+            callback=read_fields,
+            content_type="application/json")
+
+        c = new_client()
+        result = list(c.read_session_fields("test_session_id1", ["accelerometer_data"]))
+        assert [[s.x for s in page.bundle.accelerometer_data] for page in result] == [[1, 2], [3]]
+        assert [page.from_bundle_cursor for page in result] == [2, 3]
+        assert requested == [0, 2, 3]
+
+        # resuming from a saved cursor only reads the remaining pages
+        result = list(c.read_session_fields("test_session_id1", ["accelerometer_data"], since_cursor=2,
+                                            prefetch=False))
+        assert [page.max_determined_at for page in result] == [30]
+
+        with pytest.raises(ValueError):
+            next(c.read_session_fields("test_session_id1", ["accelerometer"]))
+
+
+def test_read_session_chunks_in_creation_order():
+    session = generate_test_session("test_session_id1", region_id="")
+    created_at = datetime.datetime(2022, 8, 1)
+    # listed out of order, the oldest chunks are the slowest to read
+    chunk_ids = [3, 0, 4, 1, 2]
+    chunks = [{"chunk_id": f"chunk{i}", "created_at": (created_at + datetime.timedelta(minutes=i)).isoformat() + "Z"}
+              for i in chunk_ids]
+
+    def read_chunk(i):
+        def handler(accept):
+            time.sleep(0.05 * (4 - i))
+            lines = [json.dumps(generate_bundle("test_session_id1", i * 10 + n)) for n in range(3)]
+            return "application/json", "\n".join(lines).encode()
+        return handler
+
+    routes = {
+        "/v2/sessions/test_session_id1": lambda accept: ("application/json", json.dumps(session).encode()),
+        "/v2/sessions/test_session_id1/chunks": lambda accept: ("application/json", json.dumps({
+            "chunks": chunks, "pagination": {"current_page": 1, "total_pages": 1}}).encode()),
+    }
+    for i in chunk_ids:
+        routes[f"/v2/sessions/test_session_id1/chunks/chunk{i}"] = read_chunk(i)
+
+    with LocalServer(routes) as server:
+        c = server.new_client()
+        bundles = list(c.read_session_chunks("test_session_id1", workers=3, max_buffered_chunks=3))
+        assert [b.bundle.index for b in bundles] == [i * 10 + n for i in range(5) for n in range(3)]
+
+        with pytest.raises(ValueError):
+            next(c.read_session_chunks("test_session_id1", workers=4, max_buffered_chunks=2))
+
+
+def test_chunk_cache(tmp_path):
+    cache = ChunkCache(str(tmp_path), max_bytes=200)
+    assert cache.get("abcd") is None
+
+    cache.put("abcd", [b"first", b"second"])
+    assert cache.get("abcd") == [b"first", b"second"]
+
+    # least recently used chunks are evicted once the cache is over its size cap
+    cache.put("ef/+", [b"x" * 60])
+    assert cache.get("abcd") is not None
+    cache.put("0123", [b"y" * 100])
+    assert cache.get("ef/+") is None
+    assert cache.get("abcd") == [b"first", b"second"]
+
+    # entries are reused by a new cache on the same directory
+    assert ChunkCache(str(tmp_path), max_bytes=200).get("0123") == [b"y" * 100]
+
+    # corrupted entries are dropped
+    for path in tmp_path.iterdir():
+        data = path.read_bytes()
+        path.write_bytes(data[:-1] + bytes([data[-1] ^ 1]))
+    assert cache.get("abcd") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["corrupted"], stats["evictions"]) == (3, 3, 1, 1)
+    assert stats["entries"] == 1
+
+
+def test_read_chunk_with_chunk_cache(tmp_path):
+    session = generate_test_session("test_session_id1", region_id="")
+    lines = [json.dumps(generate_bundle("test_session_id1", i)) for i in range(3)]
+    reads = []
+
+    def read_chunk(accept):
+        reads.append(accept)
+        return "application/json", "\n".join(lines).encode()
+
+    with LocalServer({
+        "/v2/sessions/test_session_id1": lambda accept: ("application/json", json.dumps(session).encode()),
+        "/v2/sessions/test_session_id1/chunks/chunk_id1": read_chunk,
+    }) as server:
+        cache = ChunkCache(str(tmp_path))
+        c = server.new_client(chunk_cache=cache)
+        chunk = Chunk(chunk_id="chunk_id1", md5="abcd")
+
+        first = list(c.read_chunk("test_session_id1", chunk))
+        assert list(c.read_chunk("test_session_id1", chunk)) == first
+        assert [b.bundle.index for b in c.read_chunk("test_session_id1", chunk, lazy=True)] == [0, 1, 2]
+        assert len(reads) == 1
+        assert cache.stats()["hits"] == 2
+
+        # chunks given by id only are not cached
+        list(c.read_chunk("test_session_id1", "chunk_id1"))
+        assert len(reads) == 2
+
+
+def test_follow_session():
+    now = datetime.datetime.utcnow()
+    chunks = [{"chunk_id": f"chunk{i}", "created_at": (now + datetime.timedelta(seconds=i)).isoformat() + "Z"}
+              for i in range(3)]
+    polls = []
+
+    def describe_session(accept):
+        # the session receives data for two polls, then goes inactive with its last chunk persisted
+        polls.append(len(polls))
+        session = generate_test_session("test_session_id1", region_id="")
+        newest_event = now + datetime.timedelta(seconds=len(polls)) if len(polls) < 3 else \
+            now - datetime.timedelta(hours=1)
+        session["newest_event"] = newest_event.isoformat() + "Z"
+        return "application/json", json.dumps(session).encode()
+
+    def list_chunks(accept):
+        listed = chunks[:min(len(polls), 3)]
+        return "application/json", json.dumps({
+            "chunks": listed, "pagination": {"current_page": 1, "total_pages": 1}}).encode()
+
+    routes = {
+        "/v2/sessions/test_session_id1": describe_session,
+        "/v2/sessions/test_session_id1/chunks": list_chunks,
+    }
+    for i in range(3):
+        lines = [json.dumps(generate_bundle("test_session_id1", i * 10 + n)) for n in range(2)]
+        routes[f"/v2/sessions/test_session_id1/chunks/chunk{i}"] = \
+            lambda accept, body="\n".join(lines).encode(): ("application/json", body)
+
+    with LocalServer(routes) as server:
+        c = server.new_client()
+        followed = []
+        bundles = list(c.follow_session("test_session_id1", on_chunk=followed.append,
+                                        min_interval=0.01, max_interval=0.02))
+        assert [b.bundle.index for b in bundles] == [0, 1, 10, 11, 20, 21]
+        assert [chunk.chunk_id for chunk in followed] == ["chunk0", "chunk1", "chunk2"]
+
+        # resuming from the watermark of the second chunk only reads the last one
+        polls.clear()
+        polls.extend([0, 1, 2])
+        since = followed[1].created_at.ToDatetime()
+        bundles = list(c.follow_session("test_session_id1", since=since, min_interval=0.01))
+        assert [b.bundle.index for b in bundles] == [20, 21]
+
+
+def test_follow_session_reads_late_chunks_while_active():
+    # the second chunk holds events older than the first chunk and is persisted after it.
+    # The session receives events for half a second, then goes inactive.
+    now = datetime.datetime.utcnow()
+    started = time.monotonic()
+    chunks = [{"chunk_id": f"chunk{i}", "created_at": (now + datetime.timedelta(hours=1, seconds=i)).isoformat() + "Z"}
+              for i in range(2)]
+    polls = []
+    listings = []
+
+    def describe_session(accept):
+        polls.append(len(polls))
+        session = generate_test_session("test_session_id1", region_id="")
+        newest_event = now + datetime.timedelta(seconds=len(polls)) if time.monotonic() - started < 0.5 else \
+            now - datetime.timedelta(hours=1)
+        session["newest_event"] = newest_event.isoformat() + "Z"
+        return "application/json", json.dumps(session).encode()
+
+    def list_chunks(accept):
+        listings.append(len(listings))
+        return "application/json", json.dumps({
+            "chunks": chunks[:min(len(listings), 2)], "pagination": {"current_page": 1, "total_pages": 1}}).encode()
+
+    routes = {
+        "/v2/sessions/test_session_id1": describe_session,
+        "/v2/sessions/test_session_id1/chunks": list_chunks,
+    }
+    for i in range(2):
+        routes[f"/v2/sessions/test_session_id1/chunks/chunk{i}"] = \
+            lambda accept, body=json.dumps(generate_bundle("test_session_id1", i)).encode(): ("application/json", body)
+
+    with LocalServer(routes) as server:
+        read_while_active = []
+        list(server.new_client().follow_session(
+            "test_session_id1", on_chunk=lambda chunk: read_while_active.append(time.monotonic() - started < 0.5),
+            min_interval=0.01, max_interval=0.02))
+        # the late chunk is read as soon as the newest event moves, not once the session is inactive
+        assert read_while_active == [True, True]
+
+
+class FlakyArchiveServer(object):
+    """ Serves an archive with an ETag and Range support, dropping the connection
+    after 'cut' bytes for the first 'drops' requests. """
+
+    def __init__(self, archive: bytes, drops: int, cut: int):
+        self.ranges = []
+        self.sent = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/v2/sessions/test_session_id1/bundles":
+                    body = json.dumps(generate_test_session("test_session_id1", region_id="")).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                requested = self.headers.get("Range")
+                server.ranges.append(requested)
+                start = 0
+                if requested is not None and self.headers.get("If-Range") == '"v1"':
+                    start = int(requested[len("bytes="):-1])
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(archive) - 1}/{len(archive)}")
+                else:
+                    self.send_response(200)
+                self.send_header("ETag", '"v1"')
+                self.send_header("Content-Length", str(len(archive) - start))
+                self.end_headers()
+
+                body = archive[start:]
+                if len(server.ranges) <= drops:
+                    body = body[:cut]
+                    self.close_connection = True
+                self.wfile.write(body)
+                server.sent += len(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+    __enter__ = LocalServer.__enter__
+    __exit__ = LocalServer.__exit__
+    new_client = LocalServer.new_client
+
+
+def test_download_session_resumes_with_range_requests(tmp_path):
+    payload = "".join(json.dumps({"index": i, "noise": os.urandom(64).hex()}) + "\n" for i in range(5000))
+    archive = generate_downloadable_payload(payload)
+    output_file = str(tmp_path / "test_session_id1.json")
+
+    # the connection drops twice, using up the requests of the first call, and the second
+    # call resumes the partial download it left behind
+    with FlakyArchiveServer(archive, drops=2, cut=len(archive) // 3) as server:
+        c = server.new_client(tries=2)
+        try:
+            c.download_session("test_session_id1", output_file)
+            assert False, "expected the download to fail"
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            pass
+        assert len(server.ranges) == 2
+        assert sorted(os.listdir(tmp_path)) == ["test_session_id1.json.partial", "test_session_id1.json.partial.json"]
+
+        c.download_session("test_session_id1", output_file)
+        with open(output_file) as f:
+            assert f.read() == payload
+        assert os.listdir(tmp_path) == ["test_session_id1.json"]
+        assert server.ranges[0] is None
+        offsets = [int(r[len("bytes="):-1]) for r in server.ranges[1:]]
+        assert len(offsets) == 2 and 0 < offsets[0] < offsets[1]
+        # at most the last partly received read of each dropped connection is sent again
+        assert server.sent <= len(archive) + 2 * client.DOWNLOAD_BUFFER_SIZE
+
+
+def test_download_session_keeps_partial_download_on_interrupt(tmp_path):
+    payload = "".join(json.dumps({"index": i, "noise": os.urandom(64).hex()}) + "\n" for i in range(5000))
+    archive = generate_downloadable_payload(payload)
+    output_file = str(tmp_path / "test_session_id1.json")
+
+    def interrupted_extract(chunks, output_file):
+        next(chunks)
+        raise KeyboardInterrupt()
+
+    with FlakyArchiveServer(archive, drops=0, cut=0) as server:
+        c = server.new_client(tries=1)
+        extract_archive = c._extract_archive
+        c._extract_archive = interrupted_extract
+        try:
+            c.download_session("test_session_id1", output_file)
+            assert False, "expected the download to be interrupted"
+        except KeyboardInterrupt:
+            pass
+        assert sorted(os.listdir(tmp_path)) == ["test_session_id1.json.partial", "test_session_id1.json.partial.json"]
+
+        c._extract_archive = extract_archive
+        c.download_session("test_session_id1", output_file)
+        with open(output_file) as f:
+            assert f.read() == payload
+        assert os.listdir(tmp_path) == ["test_session_id1.json"]
+        assert server.ranges[0] is None and server.ranges[1] is not None
@@ -0,0 +1,104 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+
+import pytest
+from google.protobuf import json_format
+
+from moonsense.decoder import FastJsonDecoder, ProtobufJsonDecoder
+from moonsense.models import SealedBundle, Session
+
+BUNDLE = {
+    "bundle": {
+        "index": 3,
+        "clientTime": {"wallTimeMillis": "1660000000000", "timer_millis": 12},
+        "battery": {},
+        "accelerometerData": [{"determinedAt": "1660000000001", "x": 0.5, "y": -1, "z": 9.81}],
+        "pointerData": [{
+            "type": "TOUCH",
+            "position": {"dx": 10, "dy": 20.5},
+            "target": {"targetId": "login"},
+            "obscured": True,
+        }],
+        "keyPressData": [{"type": 2, "maskedKey": 120}],
+        "customEvents": [{"eventName": "checkout", "properties": {"step": "2", "cart": "3"}}],
+        "features": {
+            "velocity": {"doubleList": {"value": [1.5, "Infinity", 3]}},
+            "counts": {"int64List": {"value": ["1", 2]}},
+            "blob": {"bytesList": {"value": ["aGVsbG8=", "d29ybGQ"]}},
+            "shape": {"doubleMap": {"value": {"a": 1.0, "b": 2}}},
+        },
+        "isFinalBundle": False,
+        "unknownField": {"nested": [1, 2, 3]},
+    },
+    "session_id": "test_session_id1",
+    "serverTimeMillis": "1660000000500",
+    "remoteIp": None,
+}
+
+SESSION = {
+    "session_id": "test_session_id1",
+    "created_at": "2022-08-09T10:11:12.123456Z",
+    "newestEvent": "1970-01-01T00:00:00Z",
+    "metadata": {"platform": "iOS"},
+    "counters": {"accelerometer": {"total": 200}, "pointer": {"total": "60"}},
+    "labels": [{"name": "label1"}],
+}
+
+
+@pytest.mark.parametrize("document,message_class", [(BUNDLE, SealedBundle), (SESSION, Session)])
+def test_fast_decoder_matches_json_format(document, message_class):
+    data = json.dumps(document)
+    expected = ProtobufJsonDecoder().decode(data, message_class())
+
+    decoder = FastJsonDecoder()
+    assert decoder.decode(data.encode(), message_class()) == expected
+    # the second decode runs on the compiled handlers
+    assert decoder.decode(data, message_class()) == expected
+
+    decoder._loads = json.loads
+    assert decoder.decode(data, message_class()) == expected
+
+
+def test_fast_decoder_keeps_empty_message_presence():
+    bundle = FastJsonDecoder().decode(json.dumps(BUNDLE), SealedBundle())
+    assert bundle.bundle.HasField("battery")
+    assert not bundle.bundle.HasField("frame_rate_event")
+
+    session = FastJsonDecoder().decode(json.dumps(SESSION), Session())
+    assert session.HasField("newest_event")
+
+
+def test_fast_decoder_rejects_invalid_values():
+    decoder = FastJsonDecoder()
+    with pytest.raises(json_format.ParseError):
+        decoder.decode(json.dumps({"bundle": {"pointerData": [{"type": "NOT_A_TYPE"}]}}), SealedBundle())
+    with pytest.raises(json_format.ParseError):
+        decoder.decode(json.dumps({"bundle": {"isFinalBundle": "true"}}), SealedBundle())
+    with pytest.raises(json_format.ParseError):
+        decoder.decode(json.dumps({"bundle": []}), SealedBundle())
+
+
+@pytest.mark.parametrize("index", ["1.0", "1e2", 2 ** 40, "abc"])
+def test_fast_decoder_raises_parse_errors_like_json_format(index):
+    document = json.dumps({"bundle": {"index": index}})
+    with pytest.raises(json_format.ParseError):
+        ProtobufJsonDecoder().decode(document, SealedBundle())
+    with pytest.raises(json_format.ParseError):
+        FastJsonDecoder().decode(document, SealedBundle())
+    with pytest.raises(json_format.ParseError):
+        FastJsonDecoder().decode(json.dumps({"bundle": {"keyPressData": [{"maskedKey": index}]}}), SealedBundle())
@@ -0,0 +1,365 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pytest
+import responses
+
+from moonsense.download import DEFAULT_THREAD_PARALLELISM, DownloadAllSessions
+from moonsense.manifest import DownloadManifest, MANIFEST_FILENAME, STATUS_COMPLETE, STATUS_FAILED
+
+from .test_client import LocalServer, generate_bundle, generate_chunk_payload, generate_downloadable_payload, \
+    generate_test_session, new_client
+
+SESSION_IDS = ["session1", "session2", "session3"]
+
+
+@pytest.fixture
+def umask():
+    previous = os.umask(0o022)
+    yield
+    os.umask(previous)
+
+
+def test_download_all_sessions_with_threads(tmp_path):
+    created_at = datetime.datetime(2022, 8, 9, 10, 11, 12)
+    base_url = "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions"
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            base_url,
+            body=json.dumps({
+                "sessions": [generate_test_session(session_id, created_at=created_at) for session_id in SESSION_IDS],
+                "pagination": {"current_page": 1, "total_pages": 1}}),
+            status=200,
+            content_type="application/json")
+        for session_id in SESSION_IDS:
+            rsps.add(
+                responses.GET,
+                f"{base_url}/{session_id}/bundles",
+                body=generate_downloadable_payload(json.dumps(generate_bundle(session_id))),
+                status=200,
+                content_type="application/gzip")
+
+        c = new_client()
+        c.download_all_sessions(str(tmp_path), created_at.date(), created_at.date(), [], False, [],
+                                engine="thread")
+        # the connection pool is grown to the number of download threads
+        assert c._pool_size == DEFAULT_THREAD_PARALLELISM
+
+        # the listed sessions are downloaded without describing them again
+        paths = [call.request.path_url.split("?")[0] for call in rsps.calls]
+        assert paths[0] == "/v2/sessions"
+        assert sorted(paths[1:]) == [f"/v2/sessions/{session_id}/bundles" for session_id in SESSION_IDS]
+
+    for session_id in SESSION_IDS:
+        session_dir = tmp_path / "2022-08-09" / session_id
+        assert sorted(os.listdir(session_dir)) == ["metadata.json", "raw_sealed_bundles.json"]
+        with open(session_dir / "metadata.json") as f:
+            assert json.load(f)["sessionId"] == session_id
+        with open(session_dir / "raw_sealed_bundles.json") as f:
+            assert json.loads(f.read())["session_id"] == session_id
+
+
+def test_download_all_sessions_rejects_unknown_engine(tmp_path):
+    with pytest.raises(ValueError):
+        with LocalServer({}) as server:
+            server.new_client().download_all_sessions(
+                str(tmp_path), datetime.date.today(), datetime.date.today(), [], False, [], engine="fiber")
+
+
+def _add_listing(rsps, base_url, sessions):
+    rsps.add(
+        responses.GET,
+        base_url,
+        body=json.dumps({"sessions": sessions, "pagination": {"current_page": 1, "total_pages": 1}}),
+        status=200,
+        content_type="application/json")
+
+
+def test_download_manifest_records_sessions_and_retries_failures(tmp_path):
+    created_at = datetime.datetime(2022, 8, 9, 10, 11, 12)
+    base_url = "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions"
+    sessions = [generate_test_session(session_id, created_at=created_at) for session_id in SESSION_IDS]
+
+    with responses.RequestsMock() as rsps:
+        _add_listing(rsps, base_url, sessions)
+        for session_id in SESSION_IDS[:2]:
+            rsps.add(
+                responses.GET,
+                f"{base_url}/{session_id}/bundles",
+                body=generate_downloadable_payload(json.dumps(generate_bundle(session_id))),
+                status=200,
+                content_type="application/gzip")
+        rsps.add(responses.GET, f"{base_url}/session3/bundles", status=404)
+
+        new_client().download_all_sessions(str(tmp_path), created_at.date(), created_at.date(), [], False, [],
+                                           engine="thread")
+
+    manifest = DownloadManifest(str(tmp_path / MANIFEST_FILENAME))
+    for session_id in SESSION_IDS[:2]:
+        status = manifest.status(session_id)
+        assert status["status"] == STATUS_COMPLETE
+        assert status["created_at"] == int(created_at.timestamp())
+        session_dir = tmp_path / "2022-08-09" / session_id
+        assert sorted(status["checksums"]) == ["metadata.json", "raw_sealed_bundles.json"]
+        with open(session_dir / "raw_sealed_bundles.json", "rb") as f:
+            assert status["checksums"]["raw_sealed_bundles.json"] == hashlib.md5(f.read()).hexdigest()
+        assert status["bytes"] == sum(os.path.getsize(session_dir / name) for name in os.listdir(session_dir))
+    assert manifest.status("session3")["status"] == STATUS_FAILED
+    assert [session.session_id for session in manifest.unfinished()] == ["session3"]
+    assert manifest.max_created_at() == int(created_at.timestamp())
+    # the window was closed although session3 failed, the watermark covers it
+    assert manifest.windows() == []
+    assert manifest.watermark() == int(created_at.timestamp())
+
+    # the incremental run lists from the watermark and retries the failed session from the
+    # manifest, although the listing does not return it again
+    with responses.RequestsMock() as rsps:
+        _add_listing(rsps, base_url, [])
+        rsps.add(
+            responses.GET,
+            f"{base_url}/session3/bundles",
+            body=generate_downloadable_payload(json.dumps(generate_bundle("session3"))),
+            status=200,
+            content_type="application/gzip")
+
+        new_client().download_all_sessions(str(tmp_path), created_at.date() + datetime.timedelta(days=1),
+                                           created_at.date(), [], True, [], engine="thread")
+
+        assert sorted(call.request.path_url.split("?")[0] for call in rsps.calls) == \
+            ["/v2/sessions", "/v2/sessions/session3/bundles"]
+
+    assert manifest.status("session3")["status"] == STATUS_COMPLETE
+    assert manifest.unfinished() == []
+    manifest.close()
+
+
+def test_interrupted_download_resumes_unlisted_range(tmp_path, umask):
+    day = datetime.datetime(2022, 8, 9)
+    base_url = "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions"
+    sessions = [generate_test_session(session_id, created_at=day + datetime.timedelta(hours=12 - i))
+                for i, session_id in enumerate(SESSION_IDS)]
+
+    def add_bundles(rsps, session_id):
+        rsps.add(
+            responses.GET,
+            f"{base_url}/{session_id}/bundles",
+            body=generate_downloadable_payload(json.dumps(generate_bundle(session_id))),
+            status=200,
+            content_type="application/gzip")
+
+    # the listing fails after the first page
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            base_url,
+            body=json.dumps({"sessions": sessions[:2], "pagination": {"current_page": 1, "next_page": 2}}),
+            status=200,
+            content_type="application/json")
+        rsps.add(responses.GET, base_url, status=500)
+        for session_id in SESSION_IDS[:2]:
+            add_bundles(rsps, session_id)
+
+        with pytest.raises(RuntimeError):
+            new_client().download_all_sessions(str(tmp_path), day.date(), day.date(), [], False, [],
+                                               engine="thread")
+
+    # only committed sessions are in place and the watermark only covers them
+    assert sorted(os.listdir(tmp_path / "2022-08-09")) == ["max_timestamp", "session1", "session2"]
+    assert os.listdir(tmp_path / ".staging") == []
+    with open(tmp_path / "2022-08-09" / "max_timestamp") as f:
+        assert int(f.read()) == int((day + datetime.timedelta(hours=12)).timestamp())
+    assert os.stat(tmp_path / "2022-08-09" / "max_timestamp").st_mode & 0o777 == 0o644
+
+    manifest = DownloadManifest(str(tmp_path / MANIFEST_FILENAME))
+    assert manifest.watermark() is None
+    [(_, window_since, window_until)] = manifest.windows()
+    assert window_since == int(day.timestamp())
+    assert window_until == int((day + datetime.timedelta(hours=11, seconds=1)).timestamp())
+
+    # the restart lists what is new and the rest of the interrupted range only
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            base_url,
+            body=json.dumps({"sessions": [], "pagination": {"current_page": 1}}),
+            status=200,
+            content_type="application/json")
+        rsps.add(
+            responses.GET,
+            base_url,
+            body=json.dumps({"sessions": sessions[1:], "pagination": {"current_page": 1}}),
+            status=200,
+            content_type="application/json")
+        add_bundles(rsps, "session3")
+
+        new_client().download_all_sessions(str(tmp_path), day.date() + datetime.timedelta(days=1), day.date(),
+                                           [], True, [], engine="thread")
+
+        listings = [call.request.params for call in rsps.calls if call.request.path_url.startswith("/v2/sessions?")]
+        assert listings[1]["filter[max_created_at]"] == "2022-08-09T11:00:01+00:00"
+        assert [call.request.path_url for call in rsps.calls][-1] == "/v2/sessions/session3/bundles"
+
+    assert sorted(os.listdir(tmp_path / "2022-08-09")) == ["max_timestamp", "session1", "session2", "session3"]
+    assert manifest.windows() == []
+    assert manifest.watermark() == int((day + datetime.timedelta(hours=12)).timestamp())
+    assert manifest.unfinished() == []
+    manifest.close()
+
+
+def test_sync_appends_new_chunks(tmp_path, umask):
+    created_at = datetime.datetime(2022, 8, 9, 10, 11, 12)
+    base_url = "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions"
+    chunks = [{"chunk_id": f"chunk{i}", "md5": f"md5-{i}",
+               "created_at": (created_at + datetime.timedelta(minutes=i)).isoformat() + "Z"} for i in range(3)]
+
+    def sync(listed_chunks):
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+            _add_listing(rsps, base_url, [generate_test_session("session1", created_at=created_at)])
+            rsps.add(
+                responses.GET,
+                f"{base_url}/session1/chunks",
+                body=json.dumps({"chunks": listed_chunks, "pagination": {"current_page": 1, "total_pages": 1}}),
+                status=200,
+                content_type="application/json")
+            for i in range(3):
+                rsps.add(
+                    responses.GET,
+                    f"{base_url}/session1/chunks/chunk{i}",
+                    body=generate_chunk_payload([generate_bundle("session1", i * 10 + n) for n in range(2)]),
+                    headers={"Content-Encoding": "gzip"},
+                    status=200,
+                    content_type="application/json")
+
+            new_client().download_all_sessions(str(tmp_path), created_at.date(), created_at.date(), [], False, [],
+                                               engine="thread", sync=True)
+            return [call.request.path_url for call in rsps.calls if "/chunks/" in call.request.path_url]
+
+    def bundle_indices():
+        with open(tmp_path / "2022-08-09" / "session1" / "raw_sealed_bundles.json") as f:
+            return [json.loads(line)["bundle"].get("index", 0) for line in f]
+
+    # the first sync writes the file chunk by chunk
+    assert sync(chunks[:2]) == ["/v2/sessions/session1/chunks/chunk0", "/v2/sessions/session1/chunks/chunk1"]
+    assert bundle_indices() == [0, 1, 10, 11]
+    # the lines are stored as sent by the server
+    with open(tmp_path / "2022-08-09" / "session1" / "raw_sealed_bundles.json") as f:
+        assert f.read() == "".join(json.dumps(generate_bundle("session1", i)) + "\n" for i in [0, 1, 10, 11])
+
+    # the next one only reads the new chunk and appends it, even after a partial append
+    with open(tmp_path / "2022-08-09" / "session1" / "raw_sealed_bundles.json", "ab") as f:
+        f.write(b'{"bundle":{"ind')
+    assert sync(chunks) == ["/v2/sessions/session1/chunks/chunk2"]
+    assert bundle_indices() == [0, 1, 10, 11, 20, 21]
+    assert os.stat(tmp_path / "2022-08-09" / "session1" / "metadata.json").st_mode & 0o777 == 0o644
+
+    manifest = DownloadManifest(str(tmp_path / MANIFEST_FILENAME))
+    recorded = manifest.chunks("session1")
+    assert sorted(recorded) == ["chunk0", "chunk1", "chunk2"]
+    bundles_path = tmp_path / "2022-08-09" / "session1" / "raw_sealed_bundles.json"
+    assert recorded["chunk2"][1] == os.path.getsize(bundles_path)
+    with open(bundles_path, "rb") as f:
+        assert manifest.status("session1")["checksums"]["raw_sealed_bundles.json"] == hashlib.md5(f.read()).hexdigest()
+
+    # a chunk that changed since it was appended rewrites the whole file
+    chunks[0]["md5"] = "changed"
+    assert len(sync(chunks)) == 3
+    assert bundle_indices() == [0, 1, 10, 11, 20, 21]
+    manifest.close()
+
+    with pytest.raises(ValueError):
+        new_client().download_all_sessions(str(tmp_path), created_at.date(), created_at.date(), [], True, [],
+                                           engine="thread", sync=True)
+
+
+def test_thread_engine_stops_without_waiting_for_downloads(tmp_path):
+    downloads = DownloadAllSessions(new_client())
+    started = threading.Event()
+
+    def slow_download(datadir, with_journey_id, session):
+        started.set()
+        time.sleep(30)
+
+    def interrupted_listing():
+        yield "session1"
+        started.wait()
+        raise KeyboardInterrupt()
+
+    downloads.download_data_into_folder = slow_download
+    begin = time.monotonic()
+    with pytest.raises(KeyboardInterrupt):
+        downloads._download_with_threads(interrupted_listing(), str(tmp_path), False, 2)
+    assert time.monotonic() - begin < 5
+    assert downloads.stop_event.is_set()
+
+
+def test_interrupted_download_resumes_within_the_same_second(tmp_path):
+    day = datetime.datetime(2022, 8, 9)
+    base_url = "https://us-central1.gcp.data-api.moonsense.dev/v2/sessions"
+    # session1 and session2 are created within the same second
+    created = {
+        "session1": day + datetime.timedelta(hours=12, milliseconds=900),
+        "session2": day + datetime.timedelta(hours=12, milliseconds=700),
+        "session3": day + datetime.timedelta(hours=11),
+    }
+    sessions = [generate_test_session(session_id, created_at=created_at) for session_id, created_at in created.items()]
+    fail_after_first_page = [True]
+
+    def list_sessions(request):
+        # the listing honors the created_at filters like the API does
+        min_created_at = datetime.datetime.fromisoformat(request.params["filter[min_created_at]"]).replace(tzinfo=None)
+        max_created_at = datetime.datetime.fromisoformat(request.params["filter[max_created_at]"]).replace(tzinfo=None)
+        listed = [session for session in sessions
+                  if min_created_at <= created[session["session_id"]] <= max_created_at]
+        if fail_after_first_page[0]:
+            if request.params["page"] != "1":
+                return 500, {}, ""
+            return 200, {}, json.dumps({"sessions": listed[:1], "pagination": {"current_page": 1, "next_page": 2}})
+        return 200, {}, json.dumps({"sessions": listed, "pagination": {"current_page": 1}})
+
+    def add_routes(rsps):
+        rsps.add_callback(responses.GET, base_url, callback=list_sessions, content_type="application/json")
+        for session_id in SESSION_IDS:
+            rsps.add(
+                responses.GET,
+                f"{base_url}/{session_id}/bundles",
+                body=generate_downloadable_payload(json.dumps(generate_bundle(session_id))),
+                status=200,
+                content_type="application/gzip")
+
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        add_routes(rsps)
+        with pytest.raises(RuntimeError):
+            new_client().download_all_sessions(str(tmp_path), day.date(), day.date(), [], False, [],
+                                               engine="thread")
+
+    fail_after_first_page[0] = False
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        add_routes(rsps)
+        new_client().download_all_sessions(str(tmp_path), day.date(), day.date(), [], True, [],
+                                           engine="thread")
+        downloaded = sorted(call.request.path_url for call in rsps.calls if call.request.path_url.endswith("/bundles"))
+        assert downloaded == ["/v2/sessions/session2/bundles", "/v2/sessions/session3/bundles"]
+
+    assert sorted(os.listdir(tmp_path / "2022-08-09")) == ["max_timestamp"] + SESSION_IDS
@@ -0,0 +1,95 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+
+import pytest
+from google.protobuf import json_format
+
+from moonsense.decoder import FastJsonDecoder, ProtobufJsonDecoder
+from moonsense.lazy import BundleProjection, LazySealedBundle
+from moonsense.models import SealedBundle
+from moonsense.util import split_fields
+
+from .test_decoder import BUNDLE
+
+
+@pytest.mark.parametrize("decoder", [ProtobufJsonDecoder(), FastJsonDecoder()])
+def test_lazy_bundle_from_json(decoder):
+    expected = json_format.ParseDict(BUNDLE, SealedBundle(), ignore_unknown_fields=True)
+    lazy = LazySealedBundle.from_json(json.dumps(BUNDLE), decoder)
+
+    assert lazy.session_id == "test_session_id1"
+    assert lazy.server_time_millis == 1660000000500
+    assert lazy.bundle.index == 3
+    assert lazy.bundle.client_time.timer_millis == 12
+    assert lazy.HasField("bundle")
+    assert not lazy.is_materialized
+
+    assert len(lazy.bundle.accelerometer_data) == 1
+    assert lazy.is_materialized
+    assert lazy == expected
+    assert lazy.materialize() == expected
+
+
+def test_lazy_bundle_from_protobuf():
+    expected = json_format.ParseDict(BUNDLE, SealedBundle(), ignore_unknown_fields=True)
+    lazy = LazySealedBundle.from_protobuf(expected.SerializeToString())
+
+    assert lazy.session_id == "test_session_id1"
+    assert lazy.bundle.index == 3
+    assert not lazy.is_materialized
+    assert lazy.bundle.pointer_data[0].target.target_id == "login"
+    assert lazy.SerializeToString() == expected.SerializeToString()
+
+
+def test_lazy_bundle_without_bundle():
+    lazy = LazySealedBundle.from_json(json.dumps({"session_id": "s1"}), FastJsonDecoder())
+    assert not lazy.HasField("bundle")
+    assert lazy.bundle.index == 0
+    assert len(lazy.bundle.accelerometer_data) == 0
+    assert lazy == SealedBundle(session_id="s1")
+
+
+def test_split_fields():
+    message = SealedBundle(session_id="s1", journey_id="j1", server_time_millis=7)
+    rest, selected = split_fields(message.SerializeToString(), {4, 10})
+    assert SealedBundle.FromString(rest) == SealedBundle(server_time_millis=7)
+    assert SealedBundle.FromString(selected) == SealedBundle(session_id="s1", journey_id="j1")
+
+
+@pytest.mark.parametrize("decoder", [ProtobufJsonDecoder(), FastJsonDecoder()])
+def test_projection_skips_other_repeated_fields(decoder):
+    projection = BundleProjection(["accelerometer_data", "pointer_data"])
+    full = json_format.ParseDict(BUNDLE, SealedBundle(), ignore_unknown_fields=True)
+
+    for bundle in [projection.decode_json(json.dumps(BUNDLE), decoder),
+                   projection.decode_protobuf(full.SerializeToString()),
+                   LazySealedBundle.from_json(json.dumps(BUNDLE), decoder, projection).materialize(),
+                   LazySealedBundle.from_protobuf(full.SerializeToString(), projection).materialize()]:
+        assert bundle.session_id == "test_session_id1"
+        assert bundle.bundle.index == 3
+        assert bundle.bundle.client_time.timer_millis == 12
+        assert bundle.bundle.accelerometer_data == full.bundle.accelerometer_data
+        assert bundle.bundle.pointer_data == full.bundle.pointer_data
+        assert len(bundle.bundle.key_press_data) == 0
+        assert len(bundle.bundle.custom_events) == 0
+        assert len(bundle.bundle.features) == 0
+
+
+def test_projection_rejects_unknown_fields():
+    with pytest.raises(ValueError):
+        BundleProjection(["accelerometer", "pointer_data"])
@@ -0,0 +1,53 @@
+"""
+Copyright 2022 Moonsense, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+
+from google.protobuf import json_format
+
+from moonsense.models import SealedBundle
+from moonsense.pipeline import DecodePool
+
+from .test_client import LocalServer, generate_bundle, generate_test_session
+from .test_decoder import BUNDLE
+
+
+def test_decode_pool_keeps_order():
+    lines = [json.dumps(generate_bundle("test_session_id1", i)).encode() for i in range(100)]
+    expected = [json_format.Parse(line, SealedBundle()) for line in lines]
+
+    # small batches and few pending batches exercise the ordering across many round trips
+    with DecodePool(processes=2, batch_bytes=500, max_pending_batches=3) as pool:
+        assert list(pool.decode(iter(lines))) == expected
+        assert [SealedBundle.FromString(data) for data in pool.decode(lines, serialized=True)] == expected
+
+        projected = list(pool.decode([json.dumps(BUNDLE)], fields=["pointer_data"]))
+        assert len(projected[0].bundle.pointer_data) == 1
+        assert len(projected[0].bundle.accelerometer_data) == 0
+
+
+def test_read_chunk_with_decode_pool():
+    lines = [json.dumps(generate_bundle("test_session_id1", i)) for i in range(20)]
+    session = generate_test_session("test_session_id1", region_id="")
+
+    with LocalServer({
+        "/v2/sessions/test_session_id1": lambda accept: ("application/json", json.dumps(session).encode()),
+        "/v2/sessions/test_session_id1/chunks/chunk_id1":
+            lambda accept: ("application/json", "\n".join(lines).encode()),
+    }) as server, DecodePool(processes=2, batch_bytes=200) as pool:
+        c = server.new_client(decode_pool=pool)
+        bundles = list(c.read_chunk("test_session_id1", "chunk_id1"))
+        assert [b.bundle.index for b in bundles] == list(range(20))